@@ -0,0 +1,193 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+"""Control de admisión y descarte de carga ("load shedding").
+
+Sin límites, cuando llega más trabajo del que se puede atender las solicitudes
+se acumulan en colas sin fondo y la latencia crece para todos los clientes.
+Es mejor rechazar enseguida lo que no vamos a poder terminar a tiempo y
+mantener acotado el p99 de lo que sí aceptamos:
+
+- ControlAdmision: como mucho 'limite' solicitudes a la vez en la ruta, y como
+  mucho 'max_cola' esperando turno durante 'espera_max' segundos. Si la cola
+  está llena (o se agota la espera) se lanza Rechazada, que las apps
+  convierten en un 503 con la cabecera Retry-After.
+- LimitadorTasa: cubeta de tokens por clave de cliente (opcional). Si un cliente
+  supera su tasa se le responde 429 con Retry-After.
+
+ControlAdmision tiene una versión síncrona (entrar/salir, para los hilos de
+Flask) y otra asíncrona (entrar_async/salir_async, para el bucle de eventos de
+FastAPI). Cada instancia se usa solo de una de las dos formas. asyncio se
+importa dentro de la versión asíncrona: un worker Flask no lo necesita y se
+ahorra los ~50 ms de importarlo al arrancar.
+"""
+
+
+class Rechazada(Exception):
+    def __init__(self, motivo, reintentar_en):
+        super().__init__(motivo)
+        self.motivo = motivo
+        # Segundos enteros, tal como se envían en la cabecera Retry-After
+        self.reintentar_en = max(1, math.ceil(reintentar_en))
+
+
+class ControlAdmision:
+    # Claves de estadisticas() que solo crecen (se exportan como counter)
+    CONTADORES = ("admitidas", "rechazadas_cola_llena", "rechazadas_espera")
+
+    def __init__(self, nombre, limite=32, max_cola=64, espera_max=1.0, reintentar_en=1.0):
+        self.nombre = nombre
+        self.limite = limite
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.reintentar_en = reintentar_en
+        self.en_curso = 0
+        self.admitidas = 0
+        self.rechazadas_cola_llena = 0
+        self.rechazadas_espera = 0
+        # Versión síncrona
+        self._condicion = threading.Condition()
+        self._en_cola = 0
+        # Versión asíncrona: futuros de las corutinas que esperan turno, en orden de llegada
+        self._esperando = deque()
+
+    @property
+    def en_cola(self):
+        return self._en_cola + len(self._esperando)
+
+    def _rechazar_cola_llena(self):
+        self.rechazadas_cola_llena += 1
+        raise Rechazada(f"Cola de '{self.nombre}' llena", self.reintentar_en)
+
+    def _rechazar_espera(self):
+        self.rechazadas_espera += 1
+        raise Rechazada(f"Tiempo de espera agotado en la cola de '{self.nombre}'", self.reintentar_en)
+
+    # --- Síncrona (hilos) ---
+
+    def entrar(self):
+        with self._condicion:
+            if self.en_curso < self.limite and not self._en_cola:
+                self.en_curso += 1
+                self.admitidas += 1
+                return
+            if self._en_cola >= self.max_cola:
+                self._rechazar_cola_llena()
+            self._en_cola += 1
+            try:
+                hay_sitio = self._condicion.wait_for(lambda: self.en_curso < self.limite, self.espera_max)
+            finally:
+                self._en_cola -= 1
+            if not hay_sitio:
+                self._rechazar_espera()
+            self.en_curso += 1
+            self.admitidas += 1
+
+    def salir(self):
+        with self._condicion:
+            self.en_curso -= 1
+            self._condicion.notify()
+
+    # --- Asíncrona (asyncio) ---
+
+    async def entrar_async(self):
+        import asyncio
+
+        if self.en_curso < self.limite and not self._esperando:
+            self.en_curso += 1
+            self.admitidas += 1
+            return
+        if len(self._esperando) >= self.max_cola:
+            self._rechazar_cola_llena()
+        futuro = asyncio.get_running_loop().create_future()
+        self._esperando.append(futuro)
+        try:
+            # salir_async() nos pasa su plaza resolviendo el futuro
+            await asyncio.wait_for(futuro, self.espera_max)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if futuro.done() and not futuro.cancelled():
+                # La plaza llegó justo a la vez que el timeout o la cancelación:
+                # la devolvemos para no perderla.
+                self.salir_async()
+            if isinstance(error, asyncio.TimeoutError):
+                self._rechazar_espera()
+            raise
+        finally:
+            try:
+                self._esperando.remove(futuro)
+            except ValueError:
+                pass
+        self.admitidas += 1
+
+    def salir_async(self):
+        while self._esperando:
+            futuro = self._esperando.popleft()
+            if not futuro.done():
+                # La plaza pasa directamente al siguiente en la cola (en_curso no cambia)
+                futuro.set_result(None)
+                return
+        self.en_curso -= 1
+
+    def estadisticas(self):
+        return {
+            "en_curso": self.en_curso,
+            "en_cola": self.en_cola,
+            "admitidas": self.admitidas,
+            "rechazadas_cola_llena": self.rechazadas_cola_llena,
+            "rechazadas_espera": self.rechazadas_espera,
+        }
+
+
+class LimitadorTasa:
+    """Cubeta de tokens por clave de cliente: 'tasa' tokens por segundo y como
+    mucho 'rafaga' acumulados. Guarda como mucho 'max_claves' clientes (LRU)."""
+
+    # Claves de estadisticas() que solo crecen (se exportan como counter)
+    CONTADORES = ("rechazadas",)
+
+    def __init__(self, tasa, rafaga=None, max_claves=10_000):
+        if tasa <= 0:
+            raise ValueError(f"La tasa debe ser positiva (se recibió {tasa})")
+        self.tasa = tasa
+        self.rafaga = rafaga if rafaga is not None else max(1.0, tasa)
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()  # clave -> [tokens, última actualización]
+        self._lock = threading.Lock()
+        self.rechazadas = 0
+
+    @classmethod
+    def desde_entorno(cls):
+        """Crea el limitador si LIMITE_TASA (solicitudes/s por cliente) está definida;
+        LIMITE_RAFAGA es opcional. Devuelve None si no hay límite configurado
+        (LIMITE_TASA vacía o 0 desactiva el límite)."""
+        tasa = float(os.environ.get("LIMITE_TASA") or 0)
+        if tasa <= 0:
+            return None
+        rafaga = os.environ.get("LIMITE_RAFAGA")
+        return cls(tasa, float(rafaga) if rafaga else None)
+
+    def consumir(self, clave):
+        """Consume un token. Devuelve 0 si hay token, o los segundos hasta el próximo."""
+        ahora = time.monotonic()
+        with self._lock:
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                cubeta = self._cubetas[clave] = [self.rafaga, ahora]
+                if len(self._cubetas) > self.max_claves:
+                    self._cubetas.popitem(last=False)
+            else:
+                self._cubetas.move_to_end(clave)
+                cubeta[0] = min(self.rafaga, cubeta[0] + (ahora - cubeta[1]) * self.tasa)
+                cubeta[1] = ahora
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                return 0
+            self.rechazadas += 1
+            return (1 - cubeta[0]) / self.tasa
+
+    def estadisticas(self):
+        with self._lock:
+            return {"clientes": len(self._cubetas), "rechazadas": self.rechazadas}
@@ -1,19 +1,85 @@
-from fastapi import FastAPI
-from pydantic import BaseModel # Importamos BaseModel de Pydantic
+import asyncio
+import os
+import threading
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.middleware.asyncexitstack import AsyncExitStackMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from typing import Optional # Lo mantenemos por si lo usamos en otros lados
 
-# 1. Crear una instancia de la aplicación FastAPI
-app = FastAPI()
+from admision import ControlAdmision, LimitadorTasa, Rechazada
+from cache_respuestas import CacheRespuestas, clave_cache, coincide_if_none_match
+from coalescencia import Coalescedor
+from flujo_json import ErrorRegistro, iterar_registros_async
+from repositorio_items import crear_repositorio
+import compresion
+import idempotencia
+import metricas
+import perfilador
+import serializacion
+import validacion
+from validacion import ErrorValidacion, es_json, validar_registro, validar_saludo_json
+
+
+class RespuestaJSONRapida(JSONResponse):
+    """JSONResponse que codifica con la capa común (orjson si está instalado)."""
+
+    def render(self, content) -> bytes:
+        return serializacion.dumps(content)
+
+
+# 1. Las rutas se registran en un APIRouter; la aplicación la crea crear_app()
+# default_response_class hace que nuestras rutas usen el codificador rápido.
+rutas = APIRouter(default_response_class=RespuestaJSONRapida)
+"""
+Un APIRouter es un conjunto de rutas sin aplicación: @rutas.get() funciona
+igual que @app.get(). La aplicación FastAPI se crea en crear_app() (al final
+del archivo), que incluye estas rutas y monta los middlewares. Así importar el
+módulo no construye la app, y quien la crea decide si calentarla antes de
+aceptar tráfico.
+"""
+
+# Métricas por ruta (ver metricas.py), expuestas en /metrics
+registro_metricas = metricas.RegistroMetricas("fastapi")
+# Perfilador muestreado (apagado salvo que se configure PERFIL_CADA_N o PERFIL_TOKEN)
+perfilador_muestreado = perfilador.PerfiladorMuestreado()
+# Idempotency-Key en el POST de saludos (ver idempotencia.py)
+deduplicador_saludos = idempotencia.Deduplicador(idempotencia.crear_almacen())
+# Compresión negociada con Accept-Encoding (ver compresion.py)
+compresor_respuestas = compresion.CompresorRespuestas()
+registro_metricas.registrar_colector(compresor_respuestas.muestras)
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "idempotencia", "Deduplicación por Idempotency-Key.", deduplicador_saludos.estadisticas(),
+    deduplicador_saludos.CONTADORES, ruta="/api/crear_saludo_fastapi"))
+
+
+@rutas.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=registro_metricas.exportar(), media_type=metricas.TIPO_CONTENIDO)
 
 
-# Modelo Pydantic para los datos de entrada del saludo
-# Esto define la "forma" o "esquema" de los datos que esperamos.
-"""Todas las clases que definen esquemas de datos con Pydantic
-deben heredar de BaseModel.
+@rutas.get("/admin/perfiles", include_in_schema=False)
+async def admin_perfiles(request: Request, ruta: str | None = None, limpiar: bool = False):
+    """Pilas perfiladas en formato colapsado (para flamegraph). ?ruta= filtra por
+    ruta y ?limpiar=1 reinicia la agregación después de devolverla."""
+    if not perfilador_muestreado.autorizado(request.headers.get(perfilador.CABECERA_TOKEN)):
+        raise HTTPException(status_code=403, detail="No autorizado")
+    texto = perfilador_muestreado.colapsado(ruta)
+    if limpiar:
+        perfilador_muestreado.limpiar()
+    return Response(content=texto, media_type="text/plain")
+
+"""
+Si una ruta devuelve un diccionario, FastAPI lo pasa primero por
+jsonable_encoder (que recorre y copia toda la estructura) y luego lo codifica.
+Cuando el handler ya tiene un dict de tipos JSON simples ese paso sobra, así
+que nuestras rutas devuelven directamente una RespuestaJSONRapida (o una
+Response con bytes ya serializados) y FastAPI la envía tal cual.
 """
-class SaludoRequest(BaseModel):
-    nombre: str
-    edad: None | int = None # Hacemos la edad opcional
+
+
+# El esquema de los datos de entrada del saludo (SaludoRequest) está en
+# validacion.py: lo comparten las dos apps y se compila una sola vez.
 
 
 # 2. Definir una ruta y su función asociada
@@ -24,9 +90,13 @@ Le dice a FastAPI que la función que está debajo (hola_mundo_raiz) es la encar
 solicitudes que lleguen a la ruta (path) / utilizando el método HTTP GET.
 FastAPI tiene decoradores para todos los métodos HTTP estándar: @app.post(), @app.put(), @app.delete(),
 @app.options(), @app.head(), @app.patch()."""
-@app.get("/")  # Usamos el decorador @app.get() para definir una ruta del tipo GET
+# La respuesta de la raíz nunca cambia: la serializamos una sola vez al arrancar
+RAIZ_JSON = serializacion.pre_serializar({"mensaje": "¡Hola, mundo desde FastAPI!"})
+
+
+@rutas.get("/")  # Usamos el decorador @rutas.get() para definir una ruta del tipo GET
 async def hola_mundo_raiz():
-    return {"mensaje": "¡Hola, mundo desde FastAPI!"}
+    return Response(content=RAIZ_JSON, media_type="application/json")
 
 """
 Si devuelves un diccionario de Python, una lista, un modelo Pydantic
@@ -71,18 +141,79 @@ funciones def síncronas de manera eficiente ejecutándolas en un pool de hilos
 separado si es necesario.
 """
 
-@app.get("/items/{item_id}")
-async def leer_item(item_id: int, q: str | None = None):
+# Caché de respuestas de /items/{item_id}: guarda los bytes ya serializados y su ETag
+cache_items = CacheRespuestas(max_entradas=10_000, ttl=60.0)
+# Los fallos de caché concurrentes para la misma clave comparten una sola carga
+coalescedor_items = Coalescedor(timeout=5.0)
+# Catálogo de items (ver repositorio_items.py): SQLite si ITEMS_DB está definida
+repositorio_items = crear_repositorio()
+MAX_IDS_POR_CONSULTA = 1000
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "cache", "Estadísticas de la caché de respuestas.", cache_items.estadisticas(),
+    cache_items.CONTADORES, cache="items"))
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "coalescencia", "Solicitudes de items coalescidas.", coalescedor_items.estadisticas(),
+    coalescedor_items.CONTADORES, ruta="/items/{item_id}"))
+
+
+@rutas.get("/items")
+async def leer_items(ids: str):
+    """
+    Lee varios items en una sola consulta: /items?ids=1,2,3
+
+    Devuelve los encontrados en el orden pedido y la lista de ids que no existen.
+    """
+    try:
+        # dict.fromkeys quita duplicados conservando el orden
+        lista_ids = list(dict.fromkeys(int(parte) for parte in ids.split(",") if parte.strip()))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids debe ser una lista de enteros separados por comas")
+    if len(lista_ids) > MAX_IDS_POR_CONSULTA:
+        raise HTTPException(status_code=422, detail=f"Como máximo {MAX_IDS_POR_CONSULTA} ids por consulta")
+    encontrados = await repositorio_items.obtener_varios(lista_ids)
+    return RespuestaJSONRapida({
+        "items": [encontrados[item_id] for item_id in lista_ids if item_id in encontrados],
+        "no_encontrados": [item_id for item_id in lista_ids if item_id not in encontrados],
+    })
+
+
+@rutas.get("/items/{item_id}")
+async def leer_item(item_id: int, request: Request, q: str | None = None):
     """
     Lee un item por su ID y opcionalmente un query string adicional.
     """
     # item_id se declara como int, FastAPI hará la conversión y validación.
     # q es un parámetro de consulta opcional de tipo string.
     # Python 3.10+ para 'str | None', para versiones anteriores usa 'Optional[str] = None' de 'typing'
-    response = {"item_id": item_id}
+    # La clave usa el item_id ya convertido, así /items/042 y /items/42 comparten entrada.
+    clave = clave_cache(f"/items/{item_id}", request.url.query)
+    entrada = cache_items.obtener(clave)
+    if entrada is None:
+        try:
+            entrada = await coalescedor_items.ejecutar(clave, lambda: _cargar_item(clave, item_id, q))
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Tiempo de espera agotado al leer el item")
+    return _respuesta_cacheada(entrada, request, cache_items)
+
+
+async def _cargar_item(clave, item_id: int, q: str | None):
+    """Lee el item del repositorio y guarda en caché su respuesta ya serializada.
+    Se ejecuta una sola vez por clave aunque haya muchas solicitudes esperándola."""
+    item = await repositorio_items.obtener(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item no encontrado")
+    response = dict(item)
     if q:
         response.update({"q": q}) # el tipado dinamico de Python permite esto
-    return response
+    return cache_items.guardar(clave, serializacion.dumps(response))
+
+
+def _respuesta_cacheada(entrada, request: Request, cache: CacheRespuestas) -> Response:
+    """304 si el cliente ya tiene esta versión (If-None-Match), si no el cuerpo cacheado."""
+    cabeceras = {"ETag": entrada.etag, "Cache-Control": cache.cache_control}
+    if coincide_if_none_match(request.headers.get("if-none-match"), entrada.etag):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=entrada.cuerpo, media_type=entrada.tipo_contenido, headers=cabeceras)
 
 """
 {item_id} define una parte de la URL que será variable. El valor que se ponga
@@ -114,38 +245,351 @@ Ejemplo de URL: /items/10 (aquí item_id es 10, q es None)
 """
 
 
+# Control de admisión (ver admision.py): los POST tienen su propio límite de
+# concurrencia y su propia cola, así una avalancha de POST no frena los GET.
+control_crear_saludo = ControlAdmision("crear_saludo_fastapi", limite=64, max_cola=128, espera_max=1.0)
+limitador_clientes = LimitadorTasa.desde_entorno()  # None si LIMITE_TASA no está definida
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "admision", "Control de admisión por ruta.", control_crear_saludo.estadisticas(),
+    control_crear_saludo.CONTADORES, ruta="/api/crear_saludo_fastapi"))
+if limitador_clientes is not None:
+    registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+        "limite_tasa", "Límite de tasa por cliente (429).", limitador_clientes.estadisticas(),
+        limitador_clientes.CONTADORES, ruta="/api/crear_saludo_fastapi"))
+
+
+async def admitir_crear_saludo(request: Request):
+    """Dependencia con yield: reserva una plaza antes del handler y la libera al
+    terminar. Si no hay sitio responde 429/503 con Retry-After en vez de esperar sin límite."""
+    if limitador_clientes is not None:
+        # La clave del cliente: su API key si la envía, si no su IP
+        cliente = request.headers.get("x-api-key") or (request.client.host if request.client else "")
+        espera = limitador_clientes.consumir(cliente)
+        if espera:
+            rechazo = Rechazada("Límite de tasa superado", espera)
+            raise HTTPException(status_code=429, detail=rechazo.motivo,
+                                headers={"Retry-After": str(rechazo.reintentar_en)})
+    try:
+        await control_crear_saludo.entrar_async()
+    except Rechazada as rechazo:
+        raise HTTPException(status_code=503, detail=rechazo.motivo,
+                            headers={"Retry-After": str(rechazo.reintentar_en)})
+    try:
+        yield
+    finally:
+        control_crear_saludo.salir_async()
+
+
 # Nuevo endpoint para manejar POST con validación Pydantic
-@app.post("/api/crear_saludo_fastapi", status_code=201) # Podemos definir el status_code por defecto aquí
-async def api_crear_saludo_fastapi_post(datos_saludo: SaludoRequest):
-     # 'datos_saludo' será una instancia de SaludoRequest.
-    # FastAPI automáticamente:
-    # 1. Lee el cuerpo de la solicitud.
-    # 2. Valida que sea un JSON con los campos 'nombre' (str) y opcionalmente 'edad' (int).
-    # 3. Si la validación falla, devuelve un error 422 Unprocessable Entity con detalles.
-    # 4. Si la validación es exitosa, convierte los datos en una instancia de SaludoRequest.
-
-    mensaje_respuesta = f"¡Hola, {datos_saludo.nombre}! Tu saludo ha sido procesado por FastAPI."
-    if datos_saludo.edad is not None:
-        mensaje_respuesta += f" Veo que tiene {datos_saludo.edad} años."
-    
+# openapi_extra documenta el cuerpo en /docs, ya que no lo declaramos como parámetro;
+# su esquema lo añade _openapi() al generar la documentación (ver crear_app)
+@rutas.post("/api/crear_saludo_fastapi", status_code=201, # Podemos definir el status_code por defecto aquí
+          dependencies=[Depends(admitir_crear_saludo)],
+          openapi_extra={"requestBody": {"required": True, "content": {"application/json": {}}}})
+async def api_crear_saludo_fastapi_post(request: Request):
+    # Antes el parámetro era 'datos_saludo: SaludoRequest' y FastAPI:
+    # 1. Leía el cuerpo de la solicitud y lo convertía en un diccionario.
+    # 2. Validaba ese diccionario contra el modelo y creaba una instancia.
+    # 3. Si la validación fallaba, devolvía un error 422 Unprocessable Entity con detalles.
+    # Ahora validar_saludo_json (ver validacion.py) valida los bytes del cuerpo
+    # directamente, con las mismas reglas y errores que la app Flask.
+    if not es_json(request.headers.get("content-type")):
+        raise HTTPException(status_code=415, detail="La solicitud debe ser JSON")
+    try:
+        datos_saludo = validar_saludo_json(await request.body())
+    except ErrorValidacion as error:
+        return RespuestaJSONRapida({"detail": error.errores}, status_code=422)
+
+    return RespuestaJSONRapida(_procesar_saludo(datos_saludo), status_code=201)
+
+
+def _procesar_saludo(datos_saludo: dict) -> dict:
+    """Construye la respuesta de un saludo ya validado (la usan el endpoint
+    individual y el de lote, para que ambos respondan exactamente igual)."""
+    mensaje_respuesta = f"¡Hola, {datos_saludo['nombre']}! Tu saludo ha sido procesado por FastAPI."
+    if datos_saludo["edad"] is not None:
+        mensaje_respuesta += f" Veo que tiene {datos_saludo['edad']} años."
+
     respuesta = {
         "mensaje": mensaje_respuesta,
-        "datos_recibidos": datos_saludo.model_dump()  # .dict() en Pydantic v1
+        "datos_recibidos": datos_saludo  # el validador ya devuelve un dict, sin model_dump()
     }
     return respuesta
 
-    """Los modelos Pydantic tienen un método .model_dump()
-    (o .dict() en Pydantic v1) que devuelve una representación
-    de diccionario del modelo, lo cual es útil si quieres devolver
-    los datos recibidos en la respuesta.
+
+class RespuestaStreamingDuplex(StreamingResponse):
+    """StreamingResponse que no escucha receive() mientras envía.
+
+    La StreamingResponse normal (con servidores ASGI < 2.4, como Uvicorn) lanza
+    una tarea que consume receive() para detectar la desconexión del cliente.
+    Si el generador de la respuesta está leyendo a la vez el cuerpo de la
+    solicitud, esa tarea le robaría trozos del cuerpo. Aquí es el propio
+    generador quien lee receive(), y una desconexión le llega como
+    ClientDisconnect desde request.stream().
+
+    'al_terminar' (opcional) se llama siempre al acabar, también si el cliente
+    se desconecta antes de que el generador llegue a arrancar.
     """
 
+    def __init__(self, *args, al_terminar=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.al_terminar = al_terminar
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            if self.al_terminar is not None:
+                self.al_terminar()
+        if self.background is not None:
+            await self.background()
+
+
+def _linea_ndjson(objeto) -> bytes:
+    return serializacion.dumps(objeto, default=str) + b"\n"
+
+
+# Endpoint de lote: muchos saludos en una sola solicitud HTTP
+@rutas.post("/api/crear_saludo_fastapi/lote")
+async def api_crear_saludo_fastapi_lote(request: Request):
+    """
+    Recibe un array JSON o un flujo NDJSON de SaludoRequest y responde NDJSON,
+    una línea por registro y en el mismo orden.
+
+    El cuerpo se lee trozo a trozo con request.stream() y cada registro se valida
+    y se responde en cuanto llega, así que la memoria no crece con el tamaño del
+    lote. Un registro inválido produce una línea {"indice", "error"} en vez de
+    un 422 para todo el lote.
+
+    Como la respuesta empieza antes de terminar de leer la solicitud, el
+    cliente debe leer la respuesta mientras envía (por ejemplo con
+    httpx.stream); un cliente que primero envía todo y luego lee puede quedar
+    bloqueado con lotes grandes, igual que con cualquier endpoint full-duplex.
+    """
+    async def resultados():
+        async for resultado in _procesar_registros(request):
+            yield _linea_ndjson(resultado)
+
+    return RespuestaStreamingDuplex(resultados(), media_type="application/x-ndjson")
+
+
+async def _procesar_registros(request: Request):
+    """Lee los SaludoRequest del cuerpo (array JSON o NDJSON) y produce, en orden,
+    un dict de resultado por registro: {"indice", ...} o {"indice", "error"}."""
+    indice = 0
+    async for registro in iterar_registros_async(request.stream()):
+        yield _resultado_saludo(indice, lambda: validar_registro(registro))
+        if isinstance(registro, ErrorRegistro) and registro.fatal:
+            return
+        indice += 1
+
+
+def _resultado_saludo(indice: int, validar) -> dict:
+    """Resultado de un saludo en el lote, SSE o el WebSocket: el "error" es la
+    misma lista que el "detail" del 422 del POST individual."""
+    try:
+        datos_saludo = validar()
+    except ErrorValidacion as error:
+        return {"indice": indice, "error": error.errores}
+    return {"indice": indice, **_procesar_saludo(datos_saludo)}
+
+
+# Canales persistentes: WebSocket y Server-Sent Events
+"""Con POST /api/crear_saludo_fastapi cada saludo paga un ciclo HTTP completo.
+En estos canales el cliente abre una conexión y envía saludos sin parar:
+
+- WebSocket /ws/saludos: cada mensaje del cliente es un SaludoRequest en JSON
+  (texto o binario) y el servidor responde en la misma conexión, un mensaje
+  {"indice", ...} por saludo y en el mismo orden. El JSON de cada mensaje se
+  valida directamente desde sus bytes (validar_saludo_json).
+- SSE POST /sse/saludos: el cliente envía un cuerpo NDJSON en streaming y
+  recibe un text/event-stream con un evento por saludo ("id: <indice>").
+
+Contrapresión: en el WebSocket, una tarea lee mensajes y los deja en una cola
+acotada (TAM_COLA_STREAMING) y otra los procesa y envía. Si el cliente no lee
+las respuestas, send() espera a que se vacíe el búfer del socket; la cola se
+llena, la lectura se detiene y el cliente deja de poder enviar (la ventana TCP
+se cierra). En SSE el siguiente registro del cuerpo solo se lee después de
+enviar el evento anterior. Así un consumidor lento no hace crecer la memoria
+del servidor.
+
+Límite de conexiones: como mucho MAX_CONEXIONES_STREAMING a la vez entre los
+dos canales (un ControlAdmision sin cola). Si no hay sitio, el WebSocket se
+cierra con el código 1013 ("Try Again Later") y SSE responde 503 con Retry-After.
+"""
+TAM_COLA_STREAMING = int(os.environ.get("TAM_COLA_STREAMING", "64"))
+control_streaming = ControlAdmision("streaming_saludos",
+                                    limite=int(os.environ.get("MAX_CONEXIONES_STREAMING", "256")),
+                                    max_cola=0)
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "admision", "Control de admisión por ruta.", control_streaming.estadisticas(),
+    control_streaming.CONTADORES, ruta="/ws/saludos"))
+CIERRE_REINTENTAR_LUEGO = 1013
+MOTIVO_SIN_CONEXIONES = "Límite de conexiones de streaming alcanzado"
+
+
+@rutas.websocket("/ws/saludos")
+async def ws_saludos(websocket: WebSocket):
+    try:
+        await control_streaming.entrar_async()
+    except Rechazada:
+        await websocket.accept()
+        await websocket.close(code=CIERRE_REINTENTAR_LUEGO, reason=MOTIVO_SIN_CONEXIONES)
+        return
+    try:
+        await websocket.accept()
+        cola = asyncio.Queue(maxsize=TAM_COLA_STREAMING)
+        lector = asyncio.create_task(_leer_mensajes(websocket, cola))
+        try:
+            indice = 0
+            while True:
+                mensaje = await cola.get()
+                if mensaje is None:  # el cliente cerró la conexión
+                    break
+                resultado = _resultado_saludo(indice, lambda: validar_saludo_json(mensaje))
+                await websocket.send_text(serializacion.dumps(resultado).decode("utf-8"))
+                indice += 1
+        except WebSocketDisconnect:
+            pass
+        finally:
+            lector.cancel()
+    finally:
+        control_streaming.salir_async()
+
+
+async def _leer_mensajes(websocket: WebSocket, cola: asyncio.Queue):
+    """Pasa los mensajes del cliente a la cola; put() espera si está llena."""
+    try:
+        while True:
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                break
+            datos = mensaje.get("bytes")
+            if datos is None:
+                datos = mensaje.get("text", "").encode("utf-8")
+            await cola.put(datos)
+    finally:
+        # None avisa al que envía de que no llegarán más mensajes. Si la cola está
+        # llena el cliente ya se fue: descartamos un mensaje que no podríamos responder.
+        if cola.full():
+            cola.get_nowait()
+        cola.put_nowait(None)
+
+
+@rutas.post("/sse/saludos")
+async def sse_saludos(request: Request):
+    """
+    Variante Server-Sent Events: cuerpo NDJSON (o array JSON) de SaludoRequest
+    en streaming y un evento "data: {...}" por saludo en la respuesta.
+    """
+    try:
+        await control_streaming.entrar_async()
+    except Rechazada as rechazo:
+        raise HTTPException(status_code=503, detail=MOTIVO_SIN_CONEXIONES,
+                            headers={"Retry-After": str(rechazo.reintentar_en)})
+
+    async def eventos():
+        async for resultado in _procesar_registros(request):
+            yield b"id: %d\ndata: %s\n\n" % (resultado["indice"], serializacion.dumps(resultado, default=str))
+
+    return RespuestaStreamingDuplex(eventos(), media_type="text/event-stream",
+                                    headers={"Cache-Control": "no-cache"},
+                                    al_terminar=control_streaming.salir_async)
+
+
+# Crear la aplicación: la fábrica crear_app()
+def crear_app(calentar=False):
+    """Crea la aplicación FastAPI con las rutas de este módulo y sus middlewares.
+
+    Con calentar=True, antes de devolverla hace el trabajo que si no pagaría la
+    primera solicitud (ver calentar_app).
+    """
+    # default_response_class hace que las respuestas que FastAPI construye por su
+    # cuenta (errores 422, HTTPException...) también usen el codificador rápido.
+    app = FastAPI(default_response_class=RespuestaJSONRapida)
+    app.include_router(rutas)
+    # add_middleware apila hacia fuera: el último añadido (métricas) es el más externo.
+    # La idempotencia va por fuera del control de admisión, así las repeticiones no
+    # ocupan plaza, y por dentro de la compresión, así se guarda el cuerpo sin
+    # comprimir. La compresión va por dentro de las métricas para que
+    # http_bytes_respuesta cuente los bytes ya comprimidos.
+    app.add_middleware(perfilador.MiddlewarePerfilASGI, perfilador=perfilador_muestreado)
+    app.add_middleware(idempotencia.MiddlewareIdempotenciaASGI, deduplicador=deduplicador_saludos,
+                       rutas=["/api/crear_saludo_fastapi"])
+    app.add_middleware(compresion.MiddlewareCompresionASGI, compresor=compresor_respuestas)
+    app.add_middleware(metricas.MiddlewareMetricasASGI, registro=registro_metricas)
+    app.openapi = _openapi(app)
+    if calentar:
+        calentar_app(app)
+    return app
+
+
+def _openapi(app):
+    """app.openapi() que añade el esquema del cuerpo de crear_saludo. Obtenerlo
+    compila el validador de pydantic (ver validacion.py), así que se hace al
+    pedir /openapi.json o /docs por primera vez y no al importar el módulo."""
+    generar = app.openapi
+
+    def openapi():
+        if app.openapi_schema is None:
+            cuerpo = generar()["paths"]["/api/crear_saludo_fastapi"]["post"]["requestBody"]
+            cuerpo["content"]["application/json"]["schema"] = validacion.ESQUEMA_SALUDO
+        return app.openapi_schema
+
+    return openapi
+
+
+def calentar_app(app):
+    """Construye la pila de middlewares (Starlette la monta en la primera
+    solicitud), compila el validador de saludos y hace una solicitud interna a
+    "/" para que FastAPI prepare el enrutado y el manejo de solicitudes. Las
+    demás rutas no se llaman (tocarían el repositorio, la admisión...): su
+    primera solicitud aún paga ~1 ms mientras FastAPI inspecciona su función. Con
+    servidor.py se hace una sola vez en el maestro, antes del fork(), y todos los
+    workers nacen ya calientes."""
+    app.middleware_stack = app.build_middleware_stack()
+    validacion.calentar()
+    # La solicitud va al enrutador sin nuestros middlewares, así no cuenta en las
+    # métricas; solo se envuelve en el AsyncExitStackMiddleware que FastAPI pone
+    # siempre delante del enrutador y del que este depende. Se ejecuta en un hilo
+    # con su propio bucle de eventos porque uvicorn importa app_fastapi:app con su
+    # bucle ya en marcha.
+    hilo = threading.Thread(target=asyncio.run, args=(_solicitud_interna(app, "GET", "/"),))
+    hilo.start()
+    hilo.join()
+
+
+async def _solicitud_interna(app, metodo, ruta):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": metodo,
+             "scheme": "http", "path": ruta, "raw_path": ruta.encode("latin-1"), "query_string": b"",
+             "root_path": "", "headers": [(b"host", b"calentamiento")], "client": None,
+             "server": None, "app": app}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensaje):
+        pass
+
+    await AsyncExitStackMiddleware(app.router)(scope, receive, send)
+
+
+def __getattr__(nombre):
+    # app_fastapi.app ("uvicorn app_fastapi:app", servidor.py) se crea la primera
+    # vez que alguien la pide, calentada salvo que APP_CALENTAR=0
+    if nombre == "app":
+        app = globals()["app"] = crear_app(calentar=os.environ.get("APP_CALENTAR", "1") != "0")
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
 
 # No necesitamos el bloque if __name__ == '__main__': app.run() aquí.
 # La aplicación se ejecuta con un servidor ASGI como Uvicorn desde la terminal.
 
 # Se ejecuta con el siguiente comando:
 # uvicorn app_fastapi:app --reload
+# o, con la fábrica (uvicorn llama a crear_app() en lugar de leer 'app'):
+# uvicorn app_fastapi:crear_app --factory
 """
 uvicorn: Es el comando para iniciar el servidor Uvicorn.
 app_fastapi:app:
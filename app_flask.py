@@ -1,4 +1,20 @@
-from flask import Flask, jsonify, request
+import functools
+import os
+
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from admision import ControlAdmision, LimitadorTasa, Rechazada
+from cache_respuestas import CacheRespuestas, clave_cache, coincide_if_none_match
+from flujo_json import ErrorRegistro, iterar_registros
+import compresion
+import idempotencia
+import metricas
+import perfilador
+import serializacion
+import validacion
+from validacion import ErrorValidacion, es_json, validar_registro, validar_saludo_json
 
 """
 Hemos añadido jsonify a nuestra línea de importación. jsonify es una función
@@ -11,19 +27,84 @@ El objeto request de Flask nos da acceso a los datos de la solicitud HTTP
 entrante (cabeceras, cuerpo, parámetros, etc.).
 """
 
-# 1. Crear una instancia de la aplicación Flask
-app = Flask(__name__)
+class ProveedorJSONRapido(DefaultJSONProvider):
+    """Proveedor JSON de Flask que usa la capa común de serialización
+    (orjson si está instalado). jsonify() y request.get_json() pasan por aquí.
+
+    Da la misma salida que el proveedor por defecto: respeta sort_keys (True en
+    Flask) y formatea fechas con self.default. Las opciones que la capa común no
+    tiene (indent, la salida legible de jsonify en modo debug...) se dejan al
+    proveedor por defecto.
+    """
+
+    def dumps(self, obj, **kwargs):
+        ordenar = kwargs.pop("sort_keys", self.sort_keys)
+        default = kwargs.pop("default", self.default)
+        if kwargs:
+            return super().dumps(obj, sort_keys=ordenar, default=default, **kwargs)
+        return serializacion.dumps(obj, default=default, ordenar=ordenar).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return serializacion.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # Con el salto de línea final que añade jsonify
+        cuerpo = serializacion.dumps(obj, default=self.default, ordenar=self.sort_keys) + b"\n"
+        return self._app.response_class(cuerpo, mimetype=self.mimetype)
+
+
+# 1. Las rutas se registran en un Blueprint; la aplicación la crea crear_app()
+rutas = Blueprint("api", __name__)
 
 """
-El argumento __name__ es una variable especial de Python que contiene el nombre
-del módulo actual. Flask lo usa para determinar la ruta raíz de la aplicación y
-para encontrar recursos como plantillas y archivos estáticos. Para un script que
-se ejecuta directamente, __name__ será "__main__".'''
+Un Blueprint es un conjunto de rutas que todavía no pertenece a ninguna
+aplicación: @rutas.route() funciona igual que @app.route(), pero solo anota la
+ruta. La aplicación Flask se crea en crear_app() (al final del archivo), que
+registra el Blueprint y monta los middlewares. Así importar este módulo no
+construye la app, y quien la crea decide si calentarla antes de aceptar
+tráfico.
 """
 
 
+# Perfilador muestreado (apagado salvo que se configure PERFIL_CADA_N o PERFIL_TOKEN)
+perfilador_muestreado = perfilador.PerfiladorMuestreado()
+# Compresión negociada con Accept-Encoding (ver compresion.py)
+compresor_respuestas = compresion.CompresorRespuestas()
+# Métricas por ruta, expuestas en /metrics
+registro_metricas = metricas.RegistroMetricas("flask")
+registro_metricas.registrar_colector(compresor_respuestas.muestras)
+
+
+@rutas.before_app_request
+def _anotar_ruta_para_metricas():
+    # La plantilla ('/api/saludo') y no el path real: así no hay una serie por cada URL distinta
+    if request.url_rule is not None:
+        request.environ[metricas.CLAVE_RUTA_WSGI] = request.url_rule.rule
+
+
+@rutas.route('/metrics')
+def metrics():
+    # content_type y no mimetype: Werkzeug añadiría otro "; charset=utf-8"
+    return Response(registro_metricas.exportar(), content_type=metricas.TIPO_CONTENIDO)
+
+
+@rutas.route('/admin/perfiles')
+def admin_perfiles():
+    """Pilas perfiladas en formato colapsado (para flamegraph). ?ruta= filtra por
+    ruta y ?limpiar=1 reinicia la agregación después de devolverla."""
+    if not perfilador_muestreado.autorizado(request.headers.get(perfilador.CABECERA_TOKEN)):
+        return jsonify({"error": "No autorizado"}), 403
+    texto = perfilador_muestreado.colapsado(request.args.get('ruta'))
+    if request.args.get('limpiar'):
+        perfilador_muestreado.limpiar()
+    return Response(texto, mimetype="text/plain")
+
+
 # 2. Definir una ruta y su función asociada
-@app.route('/')     #Esta es la ruta raíz o principal de nuestro sitio web
+@rutas.route('/')     #Esta es la ruta raíz o principal de nuestro sitio web
 def hola_mundo():
     return '¡Hola, mundo desde Flask!'
 
@@ -44,18 +125,40 @@ Es una buena práctica común prefijar las rutas de tu API con /api/ para distin
 de las rutas que podrían servir páginas web HTML tradicionales, aunque no es estrictamente
 obligatorio.
 """
-@app.route('/api/saludo')
+# Caché de respuestas ya serializadas (ver cache_respuestas.py)
+cache_saludo = CacheRespuestas(max_entradas=256, ttl=60.0)
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "cache", "Estadísticas de la caché de respuestas.", cache_saludo.estadisticas(),
+    cache_saludo.CONTADORES, cache="saludo"))
+
+
+# Creamos un diccionario de Python
+mensaje_saludo = {
+    "id": 1,
+    "texto": "Hola desde mi primera API con Flask!",
+    "lenguaje": "Python",
+    "tipo": "JSON"
+}
+# Como nunca cambia, lo convertimos a JSON una sola vez al arrancar (en lugar
+# de llamar a jsonify en cada solicitud) y servimos siempre los mismos bytes.
+SALUDO_JSON = serializacion.pre_serializar(mensaje_saludo)
+
+
+@rutas.route('/api/saludo')
 def api_saludo():
-    # Creamos un diccionario de Python
-    mensaje = {
-        "id": 1,
-        "texto": "Hola desde mi primera API con Flask!",
-        "lenguaje": "Python",
-        "tipo": "JSON"
-    }
-    # Usamos jsonify para convertir el diccionario en un objeto JSON
-    # y establecer la cabecera Content-Type a application/json
-    return jsonify(mensaje)
+    clave = clave_cache(request.path, request.query_string)
+    entrada = cache_saludo.obtener(clave)
+    if entrada is None:
+        entrada = cache_saludo.guardar(clave, SALUDO_JSON, "application/json")
+    return _respuesta_cacheada(entrada, cache_saludo)
+
+
+def _respuesta_cacheada(entrada, cache):
+    """304 si el cliente ya tiene esta versión (If-None-Match), si no el cuerpo cacheado."""
+    cabeceras = {"ETag": entrada.etag, "Cache-Control": cache.cache_control}
+    if coincide_if_none_match(request.headers.get("If-None-Match"), entrada.etag):
+        return Response(status=304, headers=cabeceras)
+    return Response(entrada.cuerpo, mimetype=entrada.tipo_contenido, headers=cabeceras)
 
 """
 En lugar de devolver una simple cadena de texto como antes, ahora usamos jsonify(mensaje).
@@ -72,26 +175,124 @@ acceder a él con GET desde el navegador, obtendrás un error "Method Not Allowe
 (También podríamos poner methods=['GET', 'POST'] si quisiéramos que el mismo
 endpoint maneje ambos).
 """
-@app.route('/api/crear_saludo', methods=['POST']) # Especificamos que este endpoint acepta POST
+# Control de admisión (ver admision.py): los POST tienen su propio límite de
+# concurrencia y su propia cola, así una avalancha de POST no frena los GET.
+control_crear_saludo = ControlAdmision("crear_saludo", limite=32, max_cola=64, espera_max=1.0)
+limitador_clientes = LimitadorTasa.desde_entorno()  # None si LIMITE_TASA no está definida
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "admision", "Control de admisión por ruta.", control_crear_saludo.estadisticas(),
+    control_crear_saludo.CONTADORES, ruta="/api/crear_saludo"))
+if limitador_clientes is not None:
+    registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+        "limite_tasa", "Límite de tasa por cliente (429).", limitador_clientes.estadisticas(),
+        limitador_clientes.CONTADORES, ruta="/api/crear_saludo"))
+
+
+def admitir(control, limitador=None):
+    """Decorador: aplica el límite de tasa por cliente y el control de admisión a una vista.
+    Responde 429 o 503 con Retry-After en lugar de dejar que la solicitud espere sin límite."""
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            if limitador is not None:
+                # La clave del cliente: su API key si la envía, si no su IP
+                espera = limitador.consumir(request.headers.get("X-API-Key") or request.remote_addr)
+                if espera:
+                    rechazo = Rechazada("Límite de tasa superado", espera)
+                    return jsonify({"error": rechazo.motivo}), 429, {"Retry-After": str(rechazo.reintentar_en)}
+            try:
+                control.entrar()
+            except Rechazada as rechazo:
+                return jsonify({"error": rechazo.motivo}), 503, {"Retry-After": str(rechazo.reintentar_en)}
+            try:
+                return vista(*args, **kwargs)
+            finally:
+                control.salir()
+        return envoltura
+    return decorador
+
+
+# Idempotency-Key (ver idempotencia.py): los reintentos de una misma solicitud
+# reciben la respuesta guardada en lugar de volver a procesarse.
+deduplicador_saludos = idempotencia.Deduplicador(idempotencia.crear_almacen())
+registro_metricas.registrar_colector(lambda: metricas.muestras_de(
+    "idempotencia", "Deduplicación por Idempotency-Key.", deduplicador_saludos.estadisticas(),
+    deduplicador_saludos.CONTADORES, ruta="/api/crear_saludo"))
+
+
+def idempotente(deduplicador):
+    """Decorador: si la solicitud trae Idempotency-Key, la primera se procesa y su
+    respuesta se guarda; las repeticiones la reciben sin ejecutar la vista."""
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            clave = request.headers.get(idempotencia.CABECERA)
+            if clave is None:
+                return vista(*args, **kwargs)
+            if not clave or len(clave) > idempotencia.MAX_LONGITUD_CLAVE:
+                return jsonify({"detail": f"{idempotencia.CABECERA} debe tener entre 1 y "
+                                          f"{idempotencia.MAX_LONGITUD_CLAVE} caracteres"}), 400
+            clave = idempotencia.clave_completa(request.path, request.headers.get("X-API-Key", ""), clave)
+            # La huella necesita el cuerpo entero en memoria: lo acotamos (413 si no cabe)
+            request.max_content_length = deduplicador.max_bytes_cuerpo
+            try:
+                cuerpo = request.get_data()
+            except RequestEntityTooLarge:
+                return jsonify({"detail": idempotencia.DETALLE_DEMASIADO_GRANDE.format(
+                    deduplicador.max_bytes_cuerpo)}), 413
+            resultado, guardada = deduplicador.reclamar(clave, idempotencia.huella(cuerpo))
+            if resultado == idempotencia.COMPLETADA:
+                respuesta = Response(guardada.cuerpo, status=guardada.estado, headers=guardada.cabeceras)
+                respuesta.headers[idempotencia.CABECERA_REPETIDA] = "true"
+                return respuesta
+            if resultado == idempotencia.CONFLICTO:
+                return jsonify({"detail": f"{idempotencia.CABECERA} ya usada con otra solicitud"}), 422
+            if resultado == idempotencia.EN_CURSO:
+                return (jsonify({"detail": f"La solicitud con esta {idempotencia.CABECERA} sigue en curso"}),
+                        409, {"Retry-After": "1"})
+            if resultado == idempotencia.LLENO:
+                return jsonify({"detail": idempotencia.DETALLE_LLENO}), 503, {"Retry-After": "1"}
+            try:
+                respuesta = current_app.make_response(vista(*args, **kwargs))
+            except BaseException:
+                deduplicador.almacen.liberar(clave)
+                raise
+            deduplicador.terminar(clave, respuesta.status_code, list(respuesta.headers.items()),
+                                  respuesta.get_data())
+            return respuesta
+        return envoltura
+    return decorador
+
+
+# idempotente va por fuera de admitir: una repetición no ocupa plaza en la cola
+@rutas.route('/api/crear_saludo', methods=['POST']) # Especificamos que este endpoint acepta POST
+@idempotente(deduplicador_saludos)
+@admitir(control_crear_saludo, limitador_clientes)
 def api_crear_saludo_post():
     # Verificamos si la solicitud contiene JSON
     """Es una buena práctica verificar que el cliente realmente envió datos en formato JSON.
-    request.is_json devuelve True si la cabecera Content-Type de la solicitud es application/json.
-    Si no es JSON, devolvemos un error con el código de estado HTTP 400 Bad Request
+    es_json comprueba la cabecera Content-Type (application/json, o sin cabecera, igual
+    que FastAPI). Si no es JSON, devolvemos un error con el código de estado HTTP
+    415 Unsupported Media Type
     """
-    if not request.is_json:
-        return jsonify({"error": "La solicitud debe ser JSON"}), 400 # 400 Bad Request
-    
-    # Obtenemos los datos JSON enviados en el cuerpo de la solicitud
-    """Esta función parsea el cuerpo de la solicitud JSON y lo convierte en un
-    diccionario de Python (o una lista, si el JSON raíz es una lista).
+    if not es_json(request.content_type):
+        return jsonify({"detail": "La solicitud debe ser JSON"}), 415 # 415 Unsupported Media Type
+
+    # Validamos directamente los bytes del cuerpo con el validador compartido
+    """Antes usábamos request.get_json(), que convierte el cuerpo en un diccionario
+    de Python, y luego comprobábamos a mano que estuviera el campo 'nombre'.
+    validar_saludo_json (ver validacion.py) decodifica y valida en un solo paso,
+    con las mismas reglas y los mismos errores 422 que la app FastAPI.
     """
-    datos_recibidos = request.get_json()
+    try:
+        datos_recibidos = validar_saludo_json(request.get_data(cache=False))
+    except ErrorValidacion as error:
+        return jsonify({"detail": error.errores}), 422 # 422 Unprocessable Entity
+
+    return jsonify(_procesar_saludo(datos_recibidos)), 201 # 201 Created - indica que algo se creó/procesó con éxito
 
-    # Verificamos si el campo 'nombre' está en los datos recibidos
-    if 'nombre' not in datos_recibidos:
-        return jsonify({"error": "Falta el campo 'nombre' en los datos"}), 400
-    
+
+def _procesar_saludo(datos_recibidos):
     nombre = datos_recibidos['nombre']
 
     # Creamos una respuesta
@@ -99,17 +300,93 @@ def api_crear_saludo_post():
         "mensaje": f"¡Hola, {nombre}! Tu saludo ha sido procesado por Flask.",
         "nombre_recibido": nombre
     }
+    return respuesta
+
+
+# Endpoint de lote: muchos saludos en una sola solicitud
+"""request.get_json() lee el cuerpo completo antes de devolver nada: con un lote
+de 500 MB eso son 500 MB (más el diccionario resultante) en la memoria del
+worker. Aquí leemos request.stream por trozos, procesamos cada registro NDJSON
+en cuanto llega y devolvemos un generador: Flask envía cada línea de la
+respuesta según se produce, así que el cliente empieza a recibir resultados
+enseguida y el worker solo guarda en memoria el registro que está procesando.
+stream_with_context mantiene viva la solicitud (y request.stream) mientras el
+generador se ejecuta.
+"""
+TAMANO_TROZO = 64 * 1024
+
+
+@rutas.route('/api/crear_saludo/lote', methods=['POST'])
+def api_crear_saludo_lote():
+    def resultados():
+        trozos = iter(lambda: request.stream.read(TAMANO_TROZO), b"")
+        for indice, registro in enumerate(iterar_registros(trozos)):
+            try:
+                datos_saludo = validar_registro(registro)
+            except ErrorValidacion as error:
+                yield _linea_ndjson({"indice": indice, "error": error.errores})
+                if isinstance(registro, ErrorRegistro) and registro.fatal:
+                    return
+            else:
+                yield _linea_ndjson({"indice": indice, **_procesar_saludo(datos_saludo)})
+
+    return Response(stream_with_context(resultados()), mimetype="application/x-ndjson")
+
+
+def _linea_ndjson(objeto):
+    return serializacion.dumps(objeto) + b"\n"
+
+
+# 3. Crear la aplicación: la fábrica crear_app()
+def crear_app(calentar=False):
+    """Crea la aplicación Flask con las rutas de este módulo y sus middlewares.
+
+    Con calentar=True, antes de devolverla hace el trabajo que si no pagaría la
+    primera solicitud (ver calentar_app).
+    """
+    # __name__ le dice a Flask dónde está la aplicación (para plantillas y estáticos)
+    app = Flask(__name__)
+    app.json = ProveedorJSONRapido(app)
+    app.register_blueprint(rutas)
+    # Los middlewares WSGI se apilan de dentro hacia fuera: perfilador, compresión
+    # y métricas. La compresión va por dentro de las métricas, así
+    # http_bytes_respuesta cuenta los bytes que salen de verdad.
+    app.wsgi_app = perfilador.MiddlewarePerfilWSGI(app.wsgi_app, perfilador_muestreado)
+    app.wsgi_app = compresion.MiddlewareCompresionWSGI(app.wsgi_app, compresor_respuestas)
+    app.wsgi_app = metricas.MiddlewareMetricasWSGI(app.wsgi_app, registro_metricas)
+    if calentar:
+        calentar_app(app)
+    return app
+
+
+def calentar_app(app):
+    """Compila el enrutador de Werkzeug, el validador de saludos (importa pydantic)
+    y el proveedor JSON. Con servidor.py se hace una sola vez en el maestro, antes
+    del fork(), y todos los workers nacen ya calientes."""
+    app.url_map.update()
+    validacion.calentar()
+    # Un contexto de solicitud de prueba enlaza el mapa de URLs a un host y
+    # resuelve "/": la primera vez eso carga el códec idna y compila expresiones
+    # regulares, que si no pagaría la primera solicitud real.
+    with app.test_request_context("/"):
+        jsonify(mensaje_saludo).get_data()
 
-    return jsonify(respuesta), 201 # 201 Created - indica que algo se creó/procesó con éxito
 
+def __getattr__(nombre):
+    # app_flask.app (servidor.py, "flask --app app_flask run") se crea la primera
+    # vez que alguien la pide, calentada salvo que APP_CALENTAR=0
+    if nombre == "app":
+        app = globals()["app"] = crear_app(calentar=os.environ.get("APP_CALENTAR", "1") != "0")
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 
-# 3. (Opcional pero recomendado) Definir una función para ejecutar la aplicación
+# 4. (Opcional pero recomendado) Definir una función para ejecutar la aplicación
 if __name__ == '__main__':
     # Ejecuta la aplicación Flask
     # debug=True permite la recarga automática y proporciona un depurador en el navegador
     # (reinicia el servidor automáticamente al detectar cambios en el código y muestra errores detallados)
-    app.run(debug=True)
+    crear_app().run(debug=True)
 
 """
 Esta es una construcción estándar en Python. El código dentro de este bloque solo
@@ -0,0 +1,582 @@
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+"""Suite de benchmarks en proceso para app_flask y app_fastapi.
+
+No se levanta ningún servidor: Flask se ejecuta con su cliente de pruebas WSGI
+y FastAPI con un transporte ASGI en memoria (httpx.ASGITransport), así que
+lo que se mide es enrutado, validación y serialización, sin ruido de red.
+
+Uso:
+    python benchmark.py                          # mide y muestra los resultados
+    python benchmark.py --salida resultados.json  # además los guarda
+    python benchmark.py --baseline base.json --umbral 10
+        # falla (código de salida 1) si alguna ruta pierde más de un 10% de ops/s
+    python benchmark.py serializacion             # bytes/s de cada codificador JSON
+    python benchmark.py validacion                # validaciones/s del cuerpo de crear_saludo
+    python benchmark.py items --tamanos 10000,100000,1000000,10000000
+        # cómo escala el repositorio SQLite de items con el tamaño del catálogo
+    python benchmark.py arranque --margen-flask 50 --margen-fastapi 100
+        # importar + crear cada app en un proceso nuevo (python -X importtime);
+        # falla (código de salida 1) si alguna tarda más de esos ms por encima
+        # de importar solo flask / fastapi (tests/test_arranque.py lo comprueba)
+"""
+
+# Rutas a medir: (app, nombre de la función de ruta, método, path, cuerpo JSON)
+RUTAS_FLASK = [
+    ("flask", "hola_mundo", "GET", "/", None),
+    ("flask", "api_saludo", "GET", "/api/saludo", None),
+    ("flask", "api_crear_saludo_post", "POST", "/api/crear_saludo", {"nombre": "Ana Conda"}),
+]
+RUTAS_FASTAPI = [
+    ("fastapi", "hola_mundo_raiz", "GET", "/", None),
+    ("fastapi", "leer_item", "GET", "/items/42?q=consulta", None),
+    ("fastapi", "leer_items", "GET", "/items?ids=1,2,3,4,5", None),
+    ("fastapi", "api_crear_saludo_fastapi_post", "POST", "/api/crear_saludo_fastapi",
+     {"nombre": "Barry Allen", "edad": 30}),
+]
+
+
+def _resumir(latencias, transcurrido, pico_bytes):
+    """Convierte las latencias (en segundos) en el resumen que se guarda en JSON."""
+    latencias.sort()
+    n = len(latencias)
+
+    def p(q):
+        return latencias[min(n - 1, int(q / 100 * n))] * 1e6
+
+    return {
+        "iteraciones": n,
+        "ops_s": n / transcurrido,
+        "p50_us": p(50),
+        "p90_us": p(90),
+        "p99_us": p(99),
+        "max_us": latencias[-1] * 1e6,
+        "pico_bytes_por_solicitud": pico_bytes,
+    }
+
+
+def _pico_por_solicitud(hacer_solicitud, muestras):
+    """Memoria máxima asignada (bytes) durante una solicitud, promediada.
+
+    tracemalloc ralentiza mucho la ejecución, por eso se mide en una pasada
+    aparte y con pocas muestras.
+    """
+    tracemalloc.start()
+    total = 0
+    try:
+        for _ in range(muestras):
+            actual, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            hacer_solicitud()
+            _, pico = tracemalloc.get_traced_memory()
+            total += pico - actual
+    finally:
+        tracemalloc.stop()
+    return total // muestras
+
+
+def medir_flask(rutas, iteraciones, calentamiento):
+    from app_flask import app
+
+    cliente = app.test_client()
+    resultados = {}
+    for _, nombre, metodo, path, cuerpo in rutas:
+        def hacer_solicitud():
+            respuesta = cliente.open(path, method=metodo, json=cuerpo)
+            respuesta.get_data()
+            return respuesta
+
+        for _ in range(calentamiento):
+            hacer_solicitud()
+        latencias = []
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            t0 = time.perf_counter()
+            hacer_solicitud()
+            latencias.append(time.perf_counter() - t0)
+        transcurrido = time.perf_counter() - inicio
+        pico = _pico_por_solicitud(hacer_solicitud, min(iteraciones, 200))
+        resultados[f"flask.{nombre}"] = _resumir(latencias, transcurrido, pico)
+    return resultados
+
+
+def medir_fastapi(rutas, iteraciones, calentamiento):
+    import httpx
+    from app_fastapi import app
+
+    async def medir():
+        transporte = httpx.ASGITransport(app=app)
+        resultados = {}
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            for _, nombre, metodo, path, cuerpo in rutas:
+                async def hacer_solicitud():
+                    respuesta = await cliente.request(metodo, path, json=cuerpo)
+                    respuesta.read()
+                    return respuesta
+
+                for _ in range(calentamiento):
+                    await hacer_solicitud()
+                latencias = []
+                inicio = time.perf_counter()
+                for _ in range(iteraciones):
+                    t0 = time.perf_counter()
+                    await hacer_solicitud()
+                    latencias.append(time.perf_counter() - t0)
+                transcurrido = time.perf_counter() - inicio
+
+                # El pico se mide solicitud a solicitud dentro del mismo bucle de eventos.
+                tracemalloc.start()
+                total = 0
+                muestras = min(iteraciones, 200)
+                try:
+                    for _ in range(muestras):
+                        actual, _ = tracemalloc.get_traced_memory()
+                        tracemalloc.reset_peak()
+                        await hacer_solicitud()
+                        _, pico = tracemalloc.get_traced_memory()
+                        total += pico - actual
+                finally:
+                    tracemalloc.stop()
+                resultados[f"fastapi.{nombre}"] = _resumir(latencias, transcurrido, total // muestras)
+        return resultados
+
+    return asyncio.run(medir())
+
+
+def comparar(resultados, baseline, umbral):
+    """Devuelve la lista de regresiones: rutas cuyo ops/s cayó más de 'umbral' %."""
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anterior = baseline.get("rutas", {}).get(nombre)
+        if not anterior:
+            continue
+        cambio = (actual["ops_s"] - anterior["ops_s"]) / anterior["ops_s"] * 100
+        actual["cambio_pct"] = cambio
+        if cambio < -umbral:
+            regresiones.append((nombre, anterior["ops_s"], actual["ops_s"], cambio))
+    return regresiones
+
+
+def imprimir(resultados):
+    print(f"{'ruta':<42} {'ops/s':>10} {'p50 µs':>9} {'p90 µs':>9} {'p99 µs':>9} "
+          f"{'max µs':>9} {'pico B':>9} {'cambio':>8}")
+    for nombre, r in resultados.items():
+        cambio = f"{r['cambio_pct']:+.1f}%" if "cambio_pct" in r else ""
+        print(f"{nombre:<42} {r['ops_s']:>10.1f} {r['p50_us']:>9.1f} {r['p90_us']:>9.1f} "
+              f"{r['p99_us']:>9.1f} {r['max_us']:>9.1f} {r['pico_bytes_por_solicitud']:>9d} {cambio:>8}")
+
+
+# Formas de respuesta reales de nuestras rutas, para el micro-benchmark de serialización
+CARGAS_SERIALIZACION = {
+    "raiz": {"mensaje": "¡Hola, mundo desde FastAPI!"},
+    "saludo": {"id": 1, "texto": "Hola desde mi primera API con Flask!", "lenguaje": "Python", "tipo": "JSON"},
+    "item": {"item_id": 42, "q": "consulta"},
+    "crear_saludo": {
+        "mensaje": "¡Hola, Barry Allen! Tu saludo ha sido procesado por FastAPI. Veo que tiene 30 años.",
+        "datos_recibidos": {"nombre": "Barry Allen", "edad": 30},
+    },
+    "lote_1000": [
+        {"indice": i, "mensaje": f"¡Hola, persona {i}! Tu saludo ha sido procesado por FastAPI.",
+         "datos_recibidos": {"nombre": f"persona {i}", "edad": i % 90}}
+        for i in range(1000)
+    ],
+}
+
+
+def medir_serializacion(duracion_por_caso=0.5):
+    """Mide, para cada codificador disponible y cada carga, cuántos bytes JSON
+    produce por segundo. Incluye jsonable_encoder + json (lo que hace FastAPI
+    por defecto con un dict) como referencia si FastAPI está instalado."""
+    import serializacion
+
+    candidatos = {nombre: cod.dumps for nombre, cod in serializacion.CODIFICADORES.items()}
+    try:
+        from fastapi.encoders import jsonable_encoder
+    except ImportError:
+        pass
+    else:
+        json_estandar = serializacion.CODIFICADORES["json"].dumps
+        candidatos["jsonable_encoder+json"] = lambda contenido: json_estandar(jsonable_encoder(contenido))
+
+    resultados = {}
+    for nombre_carga, carga in CARGAS_SERIALIZACION.items():
+        for nombre, dumps in candidatos.items():
+            tamano = len(dumps(carga))
+            operaciones = 0
+            inicio = time.perf_counter()
+            limite = inicio + duracion_por_caso
+            while time.perf_counter() < limite:
+                for _ in range(100):
+                    dumps(carga)
+                operaciones += 100
+            transcurrido = time.perf_counter() - inicio
+            resultados[f"{nombre_carga}.{nombre}"] = {
+                "bytes": tamano,
+                "ops_s": operaciones / transcurrido,
+                "mb_s": operaciones * tamano / transcurrido / 1e6,
+            }
+    return resultados
+
+
+# Cuerpos de crear_saludo para el micro-benchmark de validación
+CUERPOS_VALIDACION = {
+    "valido": b'{"nombre": "Barry Allen", "edad": 30}',
+    "coercion": b'{"nombre": "Barry Allen", "edad": "30"}',
+    "invalido": b'{"edad": "treinta"}',
+}
+
+
+def medir_validacion(duracion_por_caso=0.5):
+    """Validaciones/s del cuerpo de crear_saludo: el validador compartido
+    (validacion.py) frente a lo que hacían antes las apps: FastAPI decodificaba
+    a un dict y lo validaba con un modelo BaseModel (más model_dump() para la
+    respuesta), y Flask hacía get_json() y comprobaba 'nombre' a mano."""
+    from pydantic import BaseModel, ValidationError
+    import serializacion
+    import validacion
+
+    class SaludoRequestAnterior(BaseModel):
+        nombre: str
+        edad: None | int = None
+
+    def modelo_anterior(cuerpo):
+        try:
+            return SaludoRequestAnterior.model_validate(json.loads(cuerpo)).model_dump()
+        except ValidationError as error:
+            return error.errors(include_url=False, include_context=False)
+
+    def manual_anterior(cuerpo):
+        datos = serializacion.loads(cuerpo)
+        return isinstance(datos, dict) and "nombre" in datos
+
+    def compartido(cuerpo):
+        try:
+            return validacion.validar_saludo_json(cuerpo)
+        except validacion.ErrorValidacion as error:
+            return error.errores
+
+    candidatos = {"fastapi_modelo_anterior": modelo_anterior, "flask_manual_anterior": manual_anterior,
+                  "compartido": compartido}
+    resultados = {}
+    for nombre_cuerpo, cuerpo in CUERPOS_VALIDACION.items():
+        for nombre, validar in candidatos.items():
+            operaciones = 0
+            inicio = time.perf_counter()
+            limite = inicio + duracion_por_caso
+            while time.perf_counter() < limite:
+                for _ in range(100):
+                    validar(cuerpo)
+                operaciones += 100
+            resultados[f"{nombre_cuerpo}.{nombre}"] = {"ops_s": operaciones / (time.perf_counter() - inicio)}
+    return resultados
+
+
+def medir_items(tamanos, duracion, concurrencia, ids_por_lote, directorio):
+    """Genera una base SQLite por tamaño y mide lecturas individuales y por lotes."""
+    import os
+    import random
+    from repositorio_items import RepositorioSQLite, generar_items
+
+    async def medir_modo(repositorio, cantidad, por_lote):
+        azar = random.Random(1)
+        completadas = 0
+        limite = time.perf_counter() + duracion
+
+        async def trabajador():
+            nonlocal completadas
+            while time.perf_counter() < limite:
+                if por_lote:
+                    await repositorio.obtener_varios([azar.randint(1, cantidad) for _ in range(por_lote)])
+                else:
+                    await repositorio.obtener(azar.randint(1, cantidad))
+                completadas += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*[trabajador() for _ in range(concurrencia)])
+        return completadas / (time.perf_counter() - inicio)
+
+    resultados = {}
+    for cantidad in tamanos:
+        ruta = os.path.join(directorio, f"items_{cantidad}.db")
+        if not os.path.exists(ruta):
+            inicio = time.perf_counter()
+            generar_items(ruta, cantidad)
+            print(f"Generados {cantidad} items en {time.perf_counter() - inicio:.1f} s")
+        repositorio = RepositorioSQLite(ruta, tam_pool=concurrencia)
+        try:
+            individual = asyncio.run(medir_modo(repositorio, cantidad, 0))
+            por_lote = asyncio.run(medir_modo(repositorio, cantidad, ids_por_lote))
+        finally:
+            repositorio.cerrar()
+        resultados[cantidad] = {
+            "obtener_ops_s": individual,
+            "obtener_varios_ops_s": por_lote,
+            "obtener_varios_items_s": por_lote * ids_por_lote,
+        }
+    return resultados
+
+
+# Código que ejecuta el proceso hijo de medir_arranque(). Las marcas en stderr
+# separan, en la salida de -X importtime, las importaciones del intérprete, las
+# de importar el módulo de la app y las que hace crear_app().
+SONDA_ARRANQUE = """
+import json, sys, time
+sys.stderr.write("--arranque--\\n")
+sys.stderr.flush()
+t0 = time.perf_counter()
+import {modulo} as modulo
+t1 = time.perf_counter()
+sys.stderr.write("--importado--\\n")
+sys.stderr.flush()
+app = modulo.crear_app(calentar={calentar})
+t2 = time.perf_counter()
+sys.stderr.write("--creado--\\n")
+sys.stderr.flush()
+rutas = {rutas!r}
+primeras, siguientes = [], []
+if {modulo!r} == "app_flask":
+    from werkzeug.test import EnvironBuilder
+    def solicitud(metodo, path, cuerpo):
+        environ = EnvironBuilder(path=path, method=metodo, json=cuerpo).get_environ()
+        inicio = time.perf_counter()
+        b"".join(app(environ, lambda estado, cabeceras, exc_info=None: None))
+        return time.perf_counter() - inicio
+    for metodo, path, cuerpo in rutas:
+        primeras.append(solicitud(metodo, path, cuerpo))
+        siguientes.append(solicitud(metodo, path, cuerpo))
+else:
+    import asyncio
+    async def solicitud(metodo, path, cuerpo):
+        ruta, _, consulta = path.partition("?")
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else b""
+        scope = {{"type": "http", "asgi": {{"version": "3.0"}}, "http_version": "1.1", "method": metodo,
+                 "scheme": "http", "path": ruta, "raw_path": ruta.encode(), "query_string": consulta.encode(),
+                 "root_path": "", "client": ("127.0.0.1", 1), "server": ("arranque", 80),
+                 "headers": [(b"host", b"arranque"), (b"content-type", b"application/json"),
+                             (b"content-length", str(len(datos)).encode())]}}
+        async def receive():
+            return {{"type": "http.request", "body": datos, "more_body": False}}
+        async def send(mensaje):
+            pass
+        inicio = time.perf_counter()
+        await app(scope, receive, send)
+        return time.perf_counter() - inicio
+    async def medir():
+        for metodo, path, cuerpo in rutas:
+            primeras.append(await solicitud(metodo, path, cuerpo))
+            siguientes.append(await solicitud(metodo, path, cuerpo))
+    asyncio.run(medir())
+print(json.dumps({{"importar_ms": (t1 - t0) * 1e3, "crear_ms": (t2 - t1) * 1e3,
+                  "primera_ms": [t * 1e3 for t in primeras], "siguiente_ms": [t * 1e3 for t in siguientes]}}))
+"""
+
+
+def _importaciones(stderr, desde, hasta):
+    """Lee la salida de -X importtime entre dos marcas de la sonda y devuelve
+    [(módulo, acumulado en ms, nivel)]. El acumulado de un módulo incluye todo
+    lo que importa a su vez; nivel 0 es una importación hecha por la sonda, nivel
+    1 una hecha por ese módulo, etc."""
+    lineas = stderr.split(desde, 1)[-1].split(hasta, 1)[0].splitlines()
+    importaciones = []
+    for linea in lineas:
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        if not acumulado.strip().isdigit():
+            continue  # la cabecera de la tabla
+        nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        importaciones.append((nombre.strip(), int(acumulado) / 1000, nivel))
+    return importaciones
+
+
+# Presupuestos de arranque: ms que importar + crear_app pueden añadir a importar
+# solo el framework (medido: ~10-20 ms en Flask y ~40-55 ms en FastAPI, sobre
+# ~160 ms de "import flask" y ~390 ms de "import fastapi"). Calentar tiene un
+# margen extra porque compila el validador: en Flask eso importa pydantic
+# (~110 ms); FastAPI ya lo importa con el propio framework.
+MARGEN_ARRANQUE_MS = {"app_flask": 50.0, "app_fastapi": 100.0}
+MARGEN_CALENTAR_MS = 150.0
+FRAMEWORK = {"app_flask": "flask", "app_fastapi": "fastapi"}
+
+SONDA_BASE = """
+import sys
+sys.stderr.write("--arranque--\\n")
+sys.stderr.flush()
+import {paquete}
+sys.stderr.write("--importado--\\n")
+"""
+
+
+def medir_importacion_base(paquete, repeticiones):
+    """Mediana, en ms según -X importtime, de importar solo 'paquete' (flask o
+    fastapi) en un proceso nuevo: la referencia de los presupuestos de arranque,
+    porque ese coste no depende de nosotros y varía mucho de una máquina a otra."""
+    import statistics
+    import subprocess
+
+    tiempos = []
+    for _ in range(repeticiones):
+        proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", SONDA_BASE.format(paquete=paquete)],
+                                 capture_output=True, text=True, check=True)
+        importar = _importaciones(proceso.stderr, "--arranque--", "--importado--")
+        tiempos.append(sum(ms for _, ms, nivel in importar if nivel == 0))
+    return statistics.median(tiempos)
+
+
+def medir_arranque(modulo, rutas, calentar, repeticiones):
+    """Arranca 'repeticiones' procesos nuevos que importan 'modulo', crean la app
+    y le hacen dos solicitudes por ruta. Devuelve las medianas de: importación
+    según -X importtime, crear_app() (tiempo total y lo que importa) y latencia
+    de la primera y la segunda solicitud a cada ruta; más las importaciones más
+    pesadas. arranque_ms (importar + crear_app) es lo que se compara con el
+    presupuesto."""
+    import statistics
+    import subprocess
+
+    sonda = SONDA_ARRANQUE.format(modulo=modulo, calentar=calentar,
+                                  rutas=[(metodo, path, cuerpo) for _, _, metodo, path, cuerpo in rutas])
+    ejecuciones = []
+    for _ in range(repeticiones):
+        proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", sonda],
+                                 capture_output=True, text=True, check=True)
+        medidas = json.loads(proceso.stdout.strip().splitlines()[-1])
+        importar = _importaciones(proceso.stderr, "--arranque--", "--importado--")
+        crear = _importaciones(proceso.stderr, "--importado--", "--creado--")
+        medidas["importtime_ms"] = sum(ms for _, ms, nivel in importar if nivel == 0)
+        medidas["importtime_crear_ms"] = sum(ms for _, ms, nivel in crear if nivel == 0)
+        # Lo que importa el módulo de la app directamente y lo que importa crear_app()
+        medidas["importaciones"] = [(nombre, ms) for nombre, ms, nivel in importar + crear
+                                    if nivel <= 1 and nombre != modulo]
+        ejecuciones.append(medidas)
+
+    mediana = statistics.median
+    resultado = {
+        "importtime_ms": mediana(e["importtime_ms"] for e in ejecuciones),
+        "importar_ms": mediana(e["importar_ms"] for e in ejecuciones),
+        "crear_ms": mediana(e["crear_ms"] for e in ejecuciones),
+        "importtime_crear_ms": mediana(e["importtime_crear_ms"] for e in ejecuciones),
+        "rutas": {},
+    }
+    resultado["arranque_ms"] = resultado["importtime_ms"] + resultado["crear_ms"]
+    for i, (_, nombre, *_resto) in enumerate(rutas):
+        resultado["rutas"][nombre] = {
+            "primera_ms": mediana(e["primera_ms"][i] for e in ejecuciones),
+            "siguiente_ms": mediana(e["siguiente_ms"][i] for e in ejecuciones),
+        }
+    # Las importaciones más pesadas de la ejecución mediana
+    ejecuciones.sort(key=lambda e: e["importtime_ms"])
+    resultado["importaciones"] = sorted(ejecuciones[len(ejecuciones) // 2]["importaciones"],
+                                        key=lambda i: i[1], reverse=True)
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks en proceso de las apps Flask y FastAPI")
+    parser.add_argument("--app", choices=["todas", "flask", "fastapi"], default="todas")
+    parser.add_argument("--iteraciones", type=int, default=2000)
+    parser.add_argument("--calentamiento", type=int, default=200)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", help="Archivo JSON con resultados anteriores para comparar")
+    parser.add_argument("--umbral", type=float, default=10.0,
+                        help="Caída máxima de ops/s permitida frente a la baseline (en %%)")
+    subparsers = parser.add_subparsers(dest="modo")
+    serializacion = subparsers.add_parser("serializacion", help="Bytes/s de cada codificador JSON")
+    serializacion.add_argument("--duracion", type=float, default=0.5, help="Segundos por caso")
+    validacion = subparsers.add_parser("validacion", help="Validaciones/s del cuerpo de crear_saludo")
+    validacion.add_argument("--duracion", type=float, default=0.5, help="Segundos por caso")
+    items = subparsers.add_parser("items", help="Escalado del repositorio SQLite de items")
+    items.add_argument("--tamanos", default="10000,100000,1000000,10000000",
+                       help="Tamaños del catálogo separados por comas")
+    items.add_argument("--duracion", type=float, default=2.0, help="Segundos por medición")
+    items.add_argument("--concurrencia", type=int, default=4)
+    items.add_argument("--ids-por-lote", type=int, default=50)
+    items.add_argument("--directorio", default=".", help="Dónde guardar (y reutilizar) las bases generadas")
+    arranque = subparsers.add_parser("arranque", help="Coste de importar y crear cada app (-X importtime)")
+    arranque.add_argument("--repeticiones", type=int, default=5, help="Procesos por caso (se toma la mediana)")
+    arranque.add_argument("--margen-flask", type=float, default=MARGEN_ARRANQUE_MS["app_flask"],
+                          help="ms que importar y crear app_flask puede añadir a 'import flask'")
+    arranque.add_argument("--margen-fastapi", type=float, default=MARGEN_ARRANQUE_MS["app_fastapi"],
+                          help="ms que importar y crear app_fastapi puede añadir a 'import fastapi'")
+    arranque.add_argument("--margen-calentar", type=float, default=MARGEN_CALENTAR_MS,
+                          help="ms adicionales permitidos con calentar=True")
+    arranque.add_argument("--top", type=int, default=8, help="Importaciones más pesadas a mostrar")
+    args = parser.parse_args(argv)
+
+    if args.modo == "arranque":
+        casos = []
+        if args.app in ("todas", "flask"):
+            casos.append(("app_flask", RUTAS_FLASK, args.margen_flask))
+        if args.app in ("todas", "fastapi"):
+            casos.append(("app_fastapi", RUTAS_FASTAPI, args.margen_fastapi))
+        excedidos = []
+        for modulo, rutas, margen in casos:
+            base = medir_importacion_base(FRAMEWORK[modulo], args.repeticiones)
+            print(f"import {FRAMEWORK[modulo]}: {base:.1f} ms")
+            for calentar in (False, True):
+                presupuesto = base + margen + (args.margen_calentar if calentar else 0.0)
+                r = medir_arranque(modulo, rutas, calentar, args.repeticiones)
+                print(f"{modulo} (calentar={calentar}): importar {r['importtime_ms']:.1f} ms + "
+                      f"crear_app {r['crear_ms']:.1f} ms (importa {r['importtime_crear_ms']:.1f} ms) = "
+                      f"{r['arranque_ms']:.1f} ms, presupuesto {presupuesto:.0f} ms")
+                print(f"  {'ruta':<36} {'1ª ms':>8} {'2ª ms':>8}")
+                for nombre, latencias in r["rutas"].items():
+                    print(f"  {nombre:<36} {latencias['primera_ms']:>8.2f} {latencias['siguiente_ms']:>8.2f}")
+                if r["arranque_ms"] > presupuesto:
+                    excedidos.append((modulo, calentar, r["arranque_ms"], presupuesto))
+            print(f"  importaciones más pesadas de {modulo}:")
+            for nombre, ms in r["importaciones"][:args.top]:
+                print(f"    {nombre:<34} {ms:>8.1f} ms")
+        for modulo, calentar, ms, presupuesto in excedidos:
+            print(f"PRESUPUESTO EXCEDIDO {modulo} (calentar={calentar}): {ms:.1f} ms > {presupuesto:.0f} ms")
+        return 1 if excedidos else 0
+
+    if args.modo == "items":
+        tamanos = [int(t) for t in args.tamanos.split(",")]
+        print(f"{'items':>10} {'obtener ops/s':>14} {'lote ops/s':>12} {'lote items/s':>13}")
+        for cantidad, r in medir_items(tamanos, args.duracion, args.concurrencia,
+                                       args.ids_por_lote, args.directorio).items():
+            print(f"{cantidad:>10} {r['obtener_ops_s']:>14.0f} {r['obtener_varios_ops_s']:>12.0f} "
+                  f"{r['obtener_varios_items_s']:>13.0f}")
+        return 0
+
+    if args.modo == "serializacion":
+        print(f"{'carga.codificador':<36} {'bytes':>7} {'ops/s':>12} {'MB/s':>9}")
+        for nombre, r in medir_serializacion(args.duracion).items():
+            print(f"{nombre:<36} {r['bytes']:>7} {r['ops_s']:>12.0f} {r['mb_s']:>9.1f}")
+        return 0
+
+    if args.modo == "validacion":
+        print(f"{'cuerpo.validador':<36} {'validaciones/s':>15}")
+        for nombre, r in medir_validacion(args.duracion).items():
+            print(f"{nombre:<36} {r['ops_s']:>15.0f}")
+        return 0
+
+    resultados = {}
+    if args.app in ("todas", "flask"):
+        resultados.update(medir_flask(RUTAS_FLASK, args.iteraciones, args.calentamiento))
+    if args.app in ("todas", "fastapi"):
+        resultados.update(medir_fastapi(RUTAS_FASTAPI, args.iteraciones, args.calentamiento))
+
+    regresiones = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as archivo:
+            regresiones = comparar(resultados, json.load(archivo), args.umbral)
+
+    imprimir(resultados)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"python": platform.python_version(), "rutas": resultados}, archivo, indent=2)
+
+    for nombre, antes, ahora, cambio in regresiones:
+        print(f"REGRESIÓN {nombre}: {antes:.1f} -> {ahora:.1f} ops/s ({cambio:+.1f}%)")
+    return 1 if regresiones else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+"""Caché de respuestas ya serializadas, compartida por app_flask y app_fastapi.
+
+La mayoría del tráfico son lecturas repetidas (mismo item_id y mismo q). En vez
+de reconstruir el diccionario y volver a serializarlo a JSON en cada llamada,
+guardamos los bytes finales de la respuesta junto con un ETag fuerte (un hash
+del cuerpo). Si el cliente ya tiene esa versión y la envía en If-None-Match,
+respondemos 304 Not Modified sin cuerpo: ni serializamos ni transferimos nada.
+
+Es una caché LRU acotada (OrderedDict: lo usado recientemente va al final y
+desalojamos por el principio) con un TTL por entrada. Usa un lock porque Flask
+atiende solicitudes desde varios hilos.
+"""
+
+
+class RespuestaCacheada:
+    __slots__ = ("cuerpo", "etag", "tipo_contenido", "expira")
+
+    def __init__(self, cuerpo, etag, tipo_contenido, expira):
+        self.cuerpo = cuerpo
+        self.etag = etag
+        self.tipo_contenido = tipo_contenido
+        self.expira = expira
+
+
+def etag_fuerte(cuerpo):
+    """ETag fuerte: cambia si cambia cualquier byte del cuerpo."""
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+
+def clave_cache(path, query_string):
+    """Clave de caché: path más la query normalizada (pares ordenados), así
+    '?b=2&a=1' y '?a=1&b=2' comparten entrada."""
+    if isinstance(query_string, bytes):
+        query_string = query_string.decode("latin-1")
+    pares = sorted(parse_qsl(query_string, keep_blank_values=True))
+    return f"{path}?{urlencode(pares)}" if pares else path
+
+
+def coincide_if_none_match(cabecera, etag):
+    """True si la cabecera If-None-Match incluye el ETag (o es '*').
+
+    If-None-Match usa comparación débil (RFC 9110): se ignora el prefijo W/.
+    """
+    if not cabecera:
+        return False
+    if cabecera.strip() == "*":
+        return True
+    for candidato in cabecera.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == etag:
+            return True
+    return False
+
+
+class CacheRespuestas:
+    """LRU acotada con TTL que guarda RespuestaCacheada por clave."""
+
+    # Claves de estadisticas() que solo crecen (se exportan como counter)
+    CONTADORES = ("aciertos", "fallos", "desalojos", "expiradas")
+
+    def __init__(self, max_entradas=1024, ttl=60.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expiradas = 0
+
+    @property
+    def cache_control(self):
+        """Valor de Cache-Control coherente con el TTL de la caché."""
+        return f"public, max-age={int(self.ttl)}"
+
+    def obtener(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            if entrada.expira <= ahora:
+                del self._entradas[clave]
+                self.expiradas += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada
+
+    def guardar(self, clave, cuerpo, tipo_contenido="application/json"):
+        entrada = RespuestaCacheada(cuerpo, etag_fuerte(cuerpo), tipo_contenido,
+                                    time.monotonic() + self.ttl)
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+        return entrada
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "expiradas": self.expiradas,
+            }
@@ -1,5 +1,13 @@
 import requests # Importa la librería que acabamos de instalar.
 import json
+import argparse
+import asyncio
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 """Importamos el módulo json estándar de Python. Lo usaremos
 con json.dumps() para "imprimir bonito" el JSON
@@ -27,144 +35,731 @@ servidor no está disponible o hay un problema de red, requests puede lanzar
 una excepción. Esto evita que nuestro script cliente se bloquee.
 """
 
-print("--- Probando API Flask ---")
-try:
-    response_flask_get = requests.get(url_flask_saludo_get)
-    # Usamos la función requests.get() para realizar una solicitud HTTP GET a la URL especificada.
-    # El resultado se almacena en la variable response_flask. Este es un objeto Response de la librería requests.
-    
-    response_flask_get.raise_for_status() # Lanza una excepción para códigos de error HTTP (4xx o 5xx)
-    """Si la solicitud HTTP resultó en un código de estado de error del cliente (4xx) o del
-    servidor (5xx), este método lanzará una excepción HTTPError. Si la solicitud fue exitosa
-    (códigos 2xx), no hace nada. Es una forma rápida de verificar errores comunes.
-    """
+def probar_endpoints():
+    """Recorre una vez cada endpoint y muestra la respuesta (modo demostración)."""
+    print("--- Probando API Flask ---")
+    try:
+        response_flask_get = requests.get(url_flask_saludo_get)
+        # Usamos la función requests.get() para realizar una solicitud HTTP GET a la URL especificada.
+        # El resultado se almacena en la variable response_flask. Este es un objeto Response de la librería requests.
 
-    datos_flask_get = response_flask_get.json() # Convierte la respuesta JSON a un diccionario Python
-    """Si la respuesta del servidor contiene datos JSON válidos (y la cabecera Content-Type
-    es application/json, lo cual Flask y FastAPI hacen por nosotros), este método automáticamente:
-    - Lee el contenido del cuerpo de la respuesta.
-    - Parsea (convierte) la cadena JSON en una estructura de datos de Python (generalmente un diccionario o una lista).
-    """
+        response_flask_get.raise_for_status() # Lanza una excepción para códigos de error HTTP (4xx o 5xx)
+        """Si la solicitud HTTP resultó en un código de estado de error del cliente (4xx) o del
+        servidor (5xx), este método lanzará una excepción HTTPError. Si la solicitud fue exitosa
+        (códigos 2xx), no hace nada. Es una forma rápida de verificar errores comunes.
+        """
+
+        datos_flask_get = response_flask_get.json() # Convierte la respuesta JSON a un diccionario Python
+        """Si la respuesta del servidor contiene datos JSON válidos (y la cabecera Content-Type
+        es application/json, lo cual Flask y FastAPI hacen por nosotros), este método automáticamente:
+        - Lee el contenido del cuerpo de la respuesta.
+        - Parsea (convierte) la cadena JSON en una estructura de datos de Python (generalmente un diccionario o una lista).
+        """
+
+        print(f"Respuesta de Flask (código {response_flask_get.status_code}):")
+        """El objeto Response también tiene un atributo status_code que
+        contiene el código de estado HTTP devuelto por el servidor
+        (por ejemplo, 200 para OK, 404 para Not Found).
+        """
+
+        # Usamos json.dumps para una impresión más legible del JSON
+        print(json.dumps(datos_flask_get, indent=2, ensure_ascii=False)) 
+        """json.dumps() toma un objeto Python (como nuestro diccionario
+        datos_flask) y lo convierte de nuevo en una cadena con formato JSON.
+        - indent=2: Le dice a dumps que indente la salida JSON con 2 espacios,
+        haciéndola mucho más legible.
+        - ensure_ascii=False: Permite que caracteres no ASCII
+        (como la ¡ en nuestro saludo) se muestren directamente en lugar
+        de secuencias de escape Unicode (como \u00a1),
+        asumiendo que tu terminal soporta UTF-8.
+        """
+
+        print("-" * 30)
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error al conectar con la API de Flask: {e}")
+        print("-" * 30)
+
+
+    print("--- Probando API Flask (POST Crear Saludo) ---")
+    try:
+        # Datos que vamos a enviar en el cuerpo de la solicitud POST
+        datos_para_enviar_flask = {"nombre": "Ana Conda"} 
+
+        # Hacemos la solicitud POST, enviando los datos como JSON
+        # requests se encarga de establecer la cabecera Content-Type a application/json
+        # Usamos requests.post() para realizar la solicitud POST
+        response_flask_post = requests.post(url_flask_saludo_post, json=datos_para_enviar_flask)
+        """json=datos_para_enviar_flask: Este es un parámetro muy conveniente
+        de requests. Cuando le pasas un diccionario al parámetro json, requests
+        automáticamente:
+        -Convierte el diccionario Python a una cadena JSON.
+        - Establece la cabecera HTTP Content-Type a application/json.
+        - Coloca la cadena JSON en el cuerpo de la solicitud POST.
+        """
+
+        response_flask_post.raise_for_status() # Chequea errores HTTP
 
-    print(f"Respuesta de Flask (código {response_flask_get.status_code}):")
-    """El objeto Response también tiene un atributo status_code que
-    contiene el código de estado HTTP devuelto por el servidor
-    (por ejemplo, 200 para OK, 404 para Not Found).
+        datos_recibidos_flask = response_flask_post.json()
+        print(f"Respuesta de Flask POST (código {response_flask_post.status_code}):")
+        print(json.dumps(datos_recibidos_flask, indent=2, ensure_ascii=False))
+        print("-" * 30)
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error al conectar con la API de Flask (POST): {e}")
+        print("-" * 30)
+
+
+    """Hacemos lo mismo para los endpoints de FastAPI. 
+    ota que desde la perspectiva del cliente que usa requests,
+    ¡la forma de interactuar con una API GET que devuelve JSON
+    es idéntica, ya sea que el backend esté hecho con Flask o FastAPI!
     """
-    
-    # Usamos json.dumps para una impresión más legible del JSON
-    print(json.dumps(datos_flask_get, indent=2, ensure_ascii=False)) 
-    """json.dumps() toma un objeto Python (como nuestro diccionario
-    datos_flask) y lo convierte de nuevo en una cadena con formato JSON.
-    - indent=2: Le dice a dumps que indente la salida JSON con 2 espacios,
-    haciéndola mucho más legible.
-    - ensure_ascii=False: Permite que caracteres no ASCII
-    (como la ¡ en nuestro saludo) se muestren directamente en lugar
-    de secuencias de escape Unicode (como \u00a1),
-    asumiendo que tu terminal soporta UTF-8.
+
+
+    print("--- Probando API FastAPI (Raíz GET) ---")
+    try:
+        response_fastapi_raiz = requests.get(url_fastapi_raiz)
+        response_fastapi_raiz.raise_for_status()
+        datos_fastapi_raiz = response_fastapi_raiz.json()
+        print(f"Respuesta de FastAPI Raíz GET (código {response_fastapi_raiz.status_code}):")
+        print(json.dumps(datos_fastapi_raiz, indent=2, ensure_ascii=False))
+        print("-" * 30)
+    except requests.exceptions.RequestException as e:
+        print(f"Error al conectar con la API de FastAPI (Raíz GET): {e}")
+        print("-" * 30)
+
+    print("--- Probando API FastAPI (Item GET) ---")
+    try:
+        response_fastapi_item = requests.get(url_fastapi_item_get)
+        response_fastapi_item.raise_for_status()
+        datos_fastapi_item = response_fastapi_item.json()
+        print(f"Respuesta de FastAPI Item GET (código {response_fastapi_item.status_code}):")
+        print(json.dumps(datos_fastapi_item, indent=2, ensure_ascii=False))
+        print("-" * 30)
+    except requests.exceptions.RequestException as e:
+        print(f"Error al conectar con la API de FastAPI (Item GET): {e}")
+        print("-" * 30)
+
+    print("--- Probando API FastAPI (POST Crear Saludo) ---")
+    try:
+        # Datos correctos
+        datos_para_enviar_fastapi_ok = {"nombre": "Barry Allen", "edad": 30}
+
+        response_fastapi_post_ok = requests.post(url_fastapi_saludo_post, json=datos_para_enviar_fastapi_ok)
+        response_fastapi_post_ok.raise_for_status()
+
+        datos_recibidos_fastapi_ok = response_fastapi_post_ok.json()
+        print(f"Respuesta de FastAPI POST OK (código {response_fastapi_post_ok.status_code}):")
+        print(json.dumps(datos_recibidos_fastapi_ok, indent=2, ensure_ascii=False))
+        print() # Salto de línea
+
+        # Datos incorrectos (falta 'nombre', 'edad' es un string)
+        datos_para_enviar_fastapi_error = {"apelido": "Wayne", "edad": "treinta y cinco"}
+
+        print("Intentando enviar datos incorrectos a FastAPI POST...")
+        response_fastapi_post_error = requests.post(url_fastapi_saludo_post, json=datos_para_enviar_fastapi_error)
+        # NO usamos raise_for_status() aquí para poder ver el cuerpo del error 422
+
+        print(f"Respuesta de FastAPI POST con error (código {response_fastapi_post_error.status_code}):")
+        # El error 422 de FastAPI ya es JSON, así que lo imprimimos directamente
+        print(json.dumps(response_fastapi_post_error.json(), indent=2, ensure_ascii=False))
+        print("-" * 30)
+
+    except requests.exceptions.HTTPError as http_err:
+        print(f"Error HTTP al conectar con la API de FastAPI (POST): {http_err}")
+        try:
+            error_details = http_err.response.json()
+            print("Detalles del error (JSON):")
+            print(json.dumps(error_details, indent=2, ensure_ascii=False))
+        except json.JSONDecodeError:
+            print(f"Detalles del error (texto): {http_err.response.text}")
+        print("-" * 30)
+    except requests.exceptions.RequestException as req_err:
+        print(f"Error de conexión con la API de FastAPI (POST): {req_err}")
+        print("-" * 30)
+
+
+# --- Modo generador de carga ---
+"""Para dimensionar los despliegues de Flask y FastAPI necesitamos números, no
+impresiones. El modo de carga reutiliza conexiones (keep-alive) mediante una
+requests.Session por hilo, lanza las solicitudes desde varios hilos a la vez y
+al final calcula el throughput y los percentiles de latencia por endpoint.
+"""
+
+# Mezcla de endpoints: (nombre, método, url, cuerpo JSON, peso relativo)
+ENDPOINTS_CARGA = [
+    ("flask GET /api/saludo", "GET", url_flask_saludo_get, None, 1),
+    ("flask POST /api/crear_saludo", "POST", url_flask_saludo_post, {"nombre": "Ana Conda"}, 1),
+    ("fastapi GET /", "GET", url_fastapi_raiz, None, 1),
+    ("fastapi GET /items/{item_id}", "GET", url_fastapi_item_get, None, 1),
+    ("fastapi POST /api/crear_saludo_fastapi", "POST", url_fastapi_saludo_post,
+     {"nombre": "Barry Allen", "edad": 30}, 1),
+]
+
+
+def crear_sesion(tam_pool=10):
+    """Crea una Session con un pool de conexiones persistentes por host."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=tam_pool, pool_maxsize=tam_pool)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada: el menor valor
+    que deja al menos el p% de las muestras a su altura o por debajo."""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[min(indice, len(valores_ordenados) - 1)]
+
+
+def generar_carga(endpoints=None, concurrencia=8, total=None, duracion=None, timeout=10.0):
+    """Lanza solicitudes contra la mezcla de endpoints y devuelve las mediciones.
+
+    Se detiene al alcanzar 'total' solicitudes o al pasar 'duracion' segundos
+    (lo que ocurra primero). Devuelve (segundos_transcurridos, resultados), donde
+    resultados es {nombre: {"latencias": [...], "errores": n}}.
     """
+    endpoints = endpoints or ENDPOINTS_CARGA
+    if total is None and duracion is None:
+        total = 1000
+    nombres = [e[0] for e in endpoints]
+    pesos = [e[4] for e in endpoints]
+    por_nombre = {e[0]: e for e in endpoints}
 
-    print("-" * 30)
+    # Contador compartido de solicitudes emitidas; el lock solo protege un entero.
+    emitidas = [0]
+    lock_emitidas = threading.Lock()
+    inicio = time.perf_counter()
+    limite_tiempo = inicio + duracion if duracion is not None else None
+
+    def tomar_turno():
+        if limite_tiempo is not None and time.perf_counter() >= limite_tiempo:
+            return False
+        if total is None:
+            return True
+        with lock_emitidas:
+            if emitidas[0] >= total:
+                return False
+            emitidas[0] += 1
+            return True
+
+    def trabajador(semilla):
+        # Cada hilo tiene su propia Session (no se comparten entre hilos) y
+        # acumula sus mediciones localmente para no contender por un lock.
+        azar = random.Random(semilla)
+        sesion = crear_sesion()
+        locales = {nombre: {"latencias": [], "errores": 0} for nombre in nombres}
+        try:
+            while tomar_turno():
+                nombre = azar.choices(nombres, weights=pesos)[0]
+                _, metodo, url, cuerpo, _ = por_nombre[nombre]
+                t0 = time.perf_counter()
+                try:
+                    respuesta = sesion.request(metodo, url, json=cuerpo, timeout=timeout)
+                    respuesta.content  # Consumimos el cuerpo para liberar la conexión al pool
+                    if respuesta.status_code >= 400:
+                        locales[nombre]["errores"] += 1
+                        continue
+                except requests.exceptions.RequestException:
+                    locales[nombre]["errores"] += 1
+                    continue
+                locales[nombre]["latencias"].append(time.perf_counter() - t0)
+        finally:
+            sesion.close()
+        return locales
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        parciales = list(ejecutor.map(trabajador, range(concurrencia)))
+    transcurrido = time.perf_counter() - inicio
+
+    resultados = {nombre: {"latencias": [], "errores": 0} for nombre in nombres}
+    for parcial in parciales:
+        for nombre, datos in parcial.items():
+            resultados[nombre]["latencias"].extend(datos["latencias"])
+            resultados[nombre]["errores"] += datos["errores"]
+    return transcurrido, resultados
 
-except requests.exceptions.RequestException as e:
-    print(f"Error al conectar con la API de Flask: {e}")
+
+def imprimir_reporte(transcurrido, resultados):
+    """Muestra throughput y percentiles p50/p90/p99/max (en ms) por endpoint."""
+    print(f"{'endpoint':<42} {'ok':>7} {'err':>5} {'req/s':>9} "
+          f"{'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    total_ok = total_err = 0
+    for nombre, datos in resultados.items():
+        latencias = sorted(datos["latencias"])
+        total_ok += len(latencias)
+        total_err += datos["errores"]
+        ms = [percentil(latencias, p) * 1000 for p in (50, 90, 99, 100)]
+        print(f"{nombre:<42} {len(latencias):>7} {datos['errores']:>5} "
+              f"{len(latencias) / transcurrido:>9.1f} "
+              f"{ms[0]:>8.2f} {ms[1]:>8.2f} {ms[2]:>8.2f} {ms[3]:>8.2f}")
     print("-" * 30)
+    print(f"Total: {total_ok} ok, {total_err} errores en {transcurrido:.2f} s "
+          f"({total_ok / transcurrido:.1f} req/s)")
+
+
+# --- Modo reproducción (lazo abierto) ---
+"""Un cliente de lazo cerrado (como generar_carga) solo envía la siguiente
+solicitud cuando recibe la anterior: si el servidor se atasca, el cliente deja
+de enviar y las esperas nunca se miden (omisión coordinada). Aquí cada
+solicitud tiene una hora prevista de envío, se envía a esa hora aunque las
+anteriores no hayan vuelto, y la latencia se mide desde la hora prevista.
+"""
+
 
+class HistogramaHDR:
+    """Histograma log-lineal al estilo HdrHistogram (valores enteros en µs).
 
-print("--- Probando API Flask (POST Crear Saludo) ---")
-try:
-    # Datos que vamos a enviar en el cuerpo de la solicitud POST
-    datos_para_enviar_flask = {"nombre": "Ana Conda"} 
-
-    # Hacemos la solicitud POST, enviando los datos como JSON
-    # requests se encarga de establecer la cabecera Content-Type a application/json
-    # Usamos requests.post() para realizar la solicitud POST
-    response_flask_post = requests.post(url_flask_saludo_post, json=datos_para_enviar_flask)
-    """json=datos_para_enviar_flask: Este es un parámetro muy conveniente
-    de requests. Cuando le pasas un diccionario al parámetro json, requests
-    automáticamente:
-    -Convierte el diccionario Python a una cadena JSON.
-    - Establece la cabecera HTTP Content-Type a application/json.
-    - Coloca la cadena JSON en el cuerpo de la solicitud POST.
+    Los valores menores que 'sub_cubetas' se guardan exactos; por encima, cada
+    potencia de dos se divide en sub_cubetas/2 cubetas, así el error relativo
+    queda acotado por 'digitos' cifras significativas.
     """
 
-    response_flask_post.raise_for_status() # Chequea errores HTTP
+    def __init__(self, digitos=2):
+        self.bits = math.ceil(math.log2(2 * 10 ** digitos))
+        self.sub_cubetas = 1 << self.bits
+        self.mitad = self.sub_cubetas >> 1
+        self.conteos = {}
+        self.total = 0
+        self.suma = 0
+        self.suma_cuadrados = 0
+        self.maximo = 0
+        self._lock = threading.Lock()
 
-    datos_recibidos_flask = response_flask_post.json()
-    print(f"Respuesta de Flask POST (código {response_flask_post.status_code}):")
-    print(json.dumps(datos_recibidos_flask, indent=2, ensure_ascii=False))
-    print("-" * 30)
+    def _indice(self, valor):
+        if valor < self.sub_cubetas:
+            return valor
+        desplazamiento = valor.bit_length() - self.bits
+        return self.sub_cubetas + (desplazamiento - 1) * self.mitad + ((valor >> desplazamiento) - self.mitad)
 
-except requests.exceptions.RequestException as e:
-    print(f"Error al conectar con la API de Flask (POST): {e}")
-    print("-" * 30)
+    def _valor_superior(self, indice):
+        """Mayor valor que cae en la cubeta 'indice' (el que se reporta)."""
+        if indice < self.sub_cubetas:
+            return indice
+        desplazamiento = (indice - self.sub_cubetas) // self.mitad + 1
+        base = (indice - self.sub_cubetas) % self.mitad + self.mitad
+        return ((base + 1) << desplazamiento) - 1
+
+    def registrar(self, valor):
+        valor = max(0, int(valor))
+        indice = self._indice(valor)
+        with self._lock:
+            self.conteos[indice] = self.conteos.get(indice, 0) + 1
+            self.total += 1
+            self.suma += valor
+            self.suma_cuadrados += valor * valor
+            if valor > self.maximo:
+                self.maximo = valor
+
+    def valor_en_percentil(self, p):
+        if not self.total:
+            return 0
+        objetivo = max(1, math.ceil(p / 100 * self.total))
+        acumulado = 0
+        for indice in sorted(self.conteos):
+            acumulado += self.conteos[indice]
+            if acumulado >= objetivo:
+                return min(self._valor_superior(indice), self.maximo)
+        return self.maximo
+
+    def escribir_distribucion(self, archivo, escala=1000.0, ticks_por_mitad=5):
+        """Escribe la distribución de percentiles en el formato de texto .hgrm
+        que entienden los graficadores de HdrHistogram (valores en ms por defecto)."""
+        archivo.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+        ordenados = sorted(self.conteos.items())
+        acumulado = 0
+        posicion = 0
+        p = 0.0
+        while True:
+            objetivo = max(1, math.ceil(p / 100 * self.total))
+            while posicion < len(ordenados) and acumulado < objetivo:
+                acumulado += ordenados[posicion][1]
+                posicion += 1
+            valor = min(self._valor_superior(ordenados[posicion - 1][0]), self.maximo) if posicion else 0
+            fraccion = acumulado / self.total if self.total else 1.0
+            inverso = f"{1 / (1 - fraccion):>14.2f}" if fraccion < 1 else ""
+            archivo.write(f"{valor / escala:>12.3f} {fraccion:>14.12f} {acumulado:>10d} {inverso}\n")
+            if acumulado >= self.total or p >= 100:
+                break
+            mitades = 2 ** (int(math.log2(100 / (100 - p))) + 1)
+            p = min(100.0, p + 100 / (mitades * ticks_por_mitad))
+        media = self.suma / self.total if self.total else 0
+        desviacion = math.sqrt(max(0, self.suma_cuadrados / self.total - media ** 2)) if self.total else 0
+        archivo.write(f"#[Mean    = {media / escala:12.3f}, StdDeviation   = {desviacion / escala:12.3f}]\n")
+        archivo.write(f"#[Max     = {self.maximo / escala:12.3f}, Total count    = {self.total:12d}]\n")
+        archivo.write(f"#[Buckets = {len(self.conteos):12d}, SubBuckets     = {self.sub_cubetas:12d}]\n")
+
+
+def leer_trafico(ruta):
+    """Lee el log JSONL línea a línea (sin cargarlo entero en memoria).
+
+    Cada línea describe una solicitud: {"method", "path" o "url", "body",
+    "offset"} donde offset son los segundos desde el inicio de la captura.
+    Las líneas que no describen una solicitud se ignoran.
+    """
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(registro, dict) or not ("path" in registro or "url" in registro):
+                continue
+            yield registro
+
+
+# Segundos de retraso sobre la hora prevista a partir de los que una solicitud
+# cuenta como retrasada (el sleep del bucle de envío no es exacto)
+TOLERANCIA_RETRASO = 0.01
+
+
+def reproducir_trafico(ruta, base_url="http://127.0.0.1:8000", velocidad=1.0, tasa=None,
+                       max_en_vuelo=256, timeout=10.0):
+    """Reproduce el log en lazo abierto y devuelve (histograma, enviadas, errores,
+    retrasadas).
+
+    Con 'tasa' (solicitudes por segundo) se ignoran los offsets grabados y se
+    envía a ritmo fijo; si no, se respetan los offsets divididos por 'velocidad'.
 
+    Como mucho hay 'max_en_vuelo' solicitudes en vuelo, así la memoria del
+    cliente no crece sin límite. Si a la hora prevista están todas ocupadas (el
+    servidor se ha quedado atrás), el envío espera a que se libere una plaza y
+    las siguientes salen en cuanto pueden. Todas se registran en el histograma
+    con la latencia contada desde su hora prevista: el tiempo que una solicitud
+    no pudo salir por culpa del servidor cuenta como latencia suya, igual que
+    la sufriría un usuario real (es lo que corrige la omisión coordinada). Las
+    que salen más de TOLERANCIA_RETRASO segundos tarde se cuentan en
+    'retrasadas'.
 
-"""Hacemos lo mismo para los endpoints de FastAPI. 
-ota que desde la perspectiva del cliente que usa requests,
-¡la forma de interactuar con una API GET que devuelve JSON
-es idéntica, ya sea que el backend esté hecho con Flask o FastAPI!
+    Lanza ValueError si el archivo no contiene ninguna solicitud.
+    """
+    histograma = HistogramaHDR()
+    errores = []  # list.append es atómico bajo el GIL; no hace falta lock
+    locales = threading.local()
+    plazas = threading.BoundedSemaphore(max_en_vuelo)
+
+    def enviar(registro, hora_prevista):
+        sesion = getattr(locales, "sesion", None)
+        if sesion is None:
+            sesion = locales.sesion = crear_sesion()
+        url = registro.get("url") or base_url.rstrip("/") + registro["path"]
+        try:
+            respuesta = sesion.request(registro.get("method", "GET"), url,
+                                       json=registro.get("body"), timeout=timeout)
+            respuesta.content
+            if respuesta.status_code >= 400:
+                errores.append(registro)
+        except requests.exceptions.RequestException:
+            errores.append(registro)
+        finally:
+            # La latencia cuenta desde la hora prevista, no desde el envío real:
+            # incluye la espera por una plaza y el retraso del bucle de envío.
+            histograma.registrar((time.perf_counter() - hora_prevista) * 1_000_000)
+            plazas.release()
+
+    enviadas = 0
+    retrasadas = 0
+    with ThreadPoolExecutor(max_workers=max_en_vuelo) as ejecutor:
+        inicio = time.perf_counter()
+        for indice, registro in enumerate(leer_trafico(ruta)):
+            if tasa:
+                hora_prevista = inicio + indice / tasa
+            else:
+                hora_prevista = inicio + float(registro.get("offset", 0.0)) / velocidad
+            espera = hora_prevista - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            # Sin plaza libre se espera a que termine una solicitud en vuelo; esa
+            # espera acaba en la latencia de esta (se mide desde hora_prevista)
+            plazas.acquire()
+            if time.perf_counter() - hora_prevista > TOLERANCIA_RETRASO:
+                retrasadas += 1
+            # Hay tantos hilos como plazas, así que siempre hay uno libre para ella
+            ejecutor.submit(enviar, registro, hora_prevista)
+            enviadas += 1
+    if not enviadas:
+        raise ValueError(f"{ruta} no contiene ninguna solicitud (líneas JSON con \"path\" o \"url\")")
+    return histograma, enviadas, len(errores), retrasadas
+
+
+# --- Modo canales: POST individual frente a WebSocket y SSE ---
+"""Envía los mismos 'total' saludos por tres caminos contra app_fastapi y mide
+saludos/s: un POST por saludo (con conexión persistente), el WebSocket
+/ws/saludos y el stream SSE /sse/saludos. En los dos canales persistentes un
+hilo envía mientras el principal lee las respuestas, así la comparación
+incluye el efecto de no esperar cada respuesta antes de enviar el siguiente
+saludo (y la contrapresión del servidor si el cliente lee más despacio).
 """
 
 
-print("--- Probando API FastAPI (Raíz GET) ---")
-try:
-    response_fastapi_raiz = requests.get(url_fastapi_raiz)
-    response_fastapi_raiz.raise_for_status()
-    datos_fastapi_raiz = response_fastapi_raiz.json()
-    print(f"Respuesta de FastAPI Raíz GET (código {response_fastapi_raiz.status_code}):")
-    print(json.dumps(datos_fastapi_raiz, indent=2, ensure_ascii=False))
-    print("-" * 30)
-except requests.exceptions.RequestException as e:
-    print(f"Error al conectar con la API de FastAPI (Raíz GET): {e}")
-    print("-" * 30)
+def _saludos_de_prueba(total):
+    return [json.dumps({"nombre": f"persona {i}", "edad": i % 90}).encode("utf-8") for i in range(total)]
 
-print("--- Probando API FastAPI (Item GET) ---")
-try:
-    response_fastapi_item = requests.get(url_fastapi_item_get)
-    response_fastapi_item.raise_for_status()
-    datos_fastapi_item = response_fastapi_item.json()
-    print(f"Respuesta de FastAPI Item GET (código {response_fastapi_item.status_code}):")
-    print(json.dumps(datos_fastapi_item, indent=2, ensure_ascii=False))
-    print("-" * 30)
-except requests.exceptions.RequestException as e:
-    print(f"Error al conectar con la API de FastAPI (Item GET): {e}")
-    print("-" * 30)
 
-print("--- Probando API FastAPI (POST Crear Saludo) ---")
-try:
-    # Datos correctos
-    datos_para_enviar_fastapi_ok = {"nombre": "Barry Allen", "edad": 30}
+def _medir_post(base_url, saludos, timeout):
+    sesion = crear_sesion(1)
+    errores = 0
+    inicio = time.perf_counter()
+    for saludo in saludos:
+        try:
+            respuesta = sesion.post(f"{base_url}/api/crear_saludo_fastapi", data=saludo,
+                                    headers={"Content-Type": "application/json"}, timeout=timeout)
+            if respuesta.status_code >= 400:
+                errores += 1
+        except requests.exceptions.RequestException:
+            errores += 1
+    transcurrido = time.perf_counter() - inicio
+    sesion.close()
+    return len(saludos) - errores, errores, transcurrido
 
-    response_fastapi_post_ok = requests.post(url_fastapi_saludo_post, json=datos_para_enviar_fastapi_ok)
-    response_fastapi_post_ok.raise_for_status()
 
-    datos_recibidos_fastapi_ok = response_fastapi_post_ok.json()
-    print(f"Respuesta de FastAPI POST OK (código {response_fastapi_post_ok.status_code}):")
-    print(json.dumps(datos_recibidos_fastapi_ok, indent=2, ensure_ascii=False))
-    print() # Salto de línea
+def _medir_websocket(base_url, saludos, timeout):
+    from websockets.sync.client import connect
 
-    # Datos incorrectos (falta 'nombre', 'edad' es un string)
-    datos_para_enviar_fastapi_error = {"apelido": "Wayne", "edad": "treinta y cinco"}
+    url = base_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1) + "/ws/saludos"
+    errores = 0
+    inicio = time.perf_counter()
+    with connect(url, open_timeout=timeout) as conexion:
+        def enviar():
+            for saludo in saludos:
+                conexion.send(saludo.decode("utf-8"))
 
-    print("Intentando enviar datos incorrectos a FastAPI POST...")
-    response_fastapi_post_error = requests.post(url_fastapi_saludo_post, json=datos_para_enviar_fastapi_error)
-    # NO usamos raise_for_status() aquí para poder ver el cuerpo del error 422
+        emisor = threading.Thread(target=enviar, daemon=True)
+        emisor.start()
+        for _ in saludos:
+            if "error" in json.loads(conexion.recv(timeout=timeout)):
+                errores += 1
+        emisor.join()
+    return len(saludos) - errores, errores, time.perf_counter() - inicio
 
-    print(f"Respuesta de FastAPI POST con error (código {response_fastapi_post_error.status_code}):")
-    # El error 422 de FastAPI ya es JSON, así que lo imprimimos directamente
-    print(json.dumps(response_fastapi_post_error.json(), indent=2, ensure_ascii=False))
-    print("-" * 30)
 
-except requests.exceptions.HTTPError as http_err:
-    print(f"Error HTTP al conectar con la API de FastAPI (POST): {http_err}")
+def _medir_sse(base_url, saludos, timeout, tam_trozo=64 * 1024):
+    import http.client
+    import socket
+    from urllib.parse import urlsplit
+
+    # http.client no deja leer la respuesta mientras se envía el cuerpo, así que
+    # escribimos la solicitud (chunked) a mano en un hilo y leemos en el principal.
+    partes = urlsplit(base_url)
+    sock = socket.create_connection((partes.hostname, partes.port or 80), timeout=timeout)
+    cabecera = (f"POST /sse/saludos HTTP/1.1\r\nHost: {partes.netloc}\r\n"
+                "Content-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                "Accept: text/event-stream\r\n\r\n").encode("latin-1")
+
+    def enviar():
+        sock.sendall(cabecera)
+        trozo = []
+        tamano = 0
+        for saludo in saludos:
+            trozo.append(saludo + b"\n")
+            tamano += len(saludo) + 1
+            if tamano >= tam_trozo:
+                datos = b"".join(trozo)
+                sock.sendall(b"%x\r\n%s\r\n" % (len(datos), datos))
+                trozo, tamano = [], 0
+        if trozo:
+            datos = b"".join(trozo)
+            sock.sendall(b"%x\r\n%s\r\n" % (len(datos), datos))
+        sock.sendall(b"0\r\n\r\n")
+
+    errores = recibidos = 0
+    inicio = time.perf_counter()
+    emisor = threading.Thread(target=enviar, daemon=True)
+    emisor.start()
     try:
-        error_details = http_err.response.json()
-        print("Detalles del error (JSON):")
-        print(json.dumps(error_details, indent=2, ensure_ascii=False))
-    except json.JSONDecodeError:
-        print(f"Detalles del error (texto): {http_err.response.text}")
-    print("-" * 30)
-except requests.exceptions.RequestException as req_err:
-    print(f"Error de conexión con la API de FastAPI (POST): {req_err}")
-    print("-" * 30)
\ No newline at end of file
+        respuesta = http.client.HTTPResponse(sock)
+        respuesta.begin()
+        if respuesta.status != 200:
+            return 0, len(saludos), time.perf_counter() - inicio
+        for linea in respuesta:
+            if linea.startswith(b"data:"):
+                recibidos += 1
+                if b'"error"' in linea:
+                    errores += 1
+        emisor.join()
+    finally:
+        sock.close()
+    return recibidos - errores, errores + len(saludos) - recibidos, time.perf_counter() - inicio
+
+
+def comparar_canales(base_url="http://127.0.0.1:8000", total=2000, canales=("post", "ws", "sse"), timeout=10.0):
+    """Devuelve {canal: (ok, errores, segundos)} enviando 'total' saludos por cada canal."""
+    saludos = _saludos_de_prueba(total)
+    medidores = {"post": _medir_post, "ws": _medir_websocket, "sse": _medir_sse}
+    return {canal: medidores[canal](base_url, saludos, timeout) for canal in canales}
+
+
+# --- Modo asíncrono: plazos, reintentos y cobertura (cliente_async) ---
+"""El mismo recorrido de demostración, pero con cliente_async: cada llamada
+tiene un plazo, así que un servidor caído o lento se ve como un error en esa
+línea y el recorrido sigue. Después se mide el efecto de la cobertura (hedged
+requests) en la cola de latencias: 'total' lecturas de /items/{item_id} sin
+cobertura y otras tantas con ella, con 'concurrencia' en vuelo.
+"""
+
+
+async def probar_endpoints_async(plazo=2.0):
+    # cliente_async importa httpx: solo lo cargamos en el modo async
+    import cliente_async
+
+    async with cliente_async.ClienteFlask(plazo=plazo) as flask, \
+            cliente_async.ClienteFastAPI(plazo=plazo) as fastapi:
+        llamadas = [
+            ("flask GET /", flask.raiz()),
+            ("flask GET /api/saludo", flask.saludo()),
+            ("flask POST /api/crear_saludo", flask.crear_saludo("Ana Conda")),
+            ("flask POST /api/crear_saludo/lote",
+             flask.crear_saludos_lote([{"nombre": "Ana"}, {"nombre": "Eva"}])),
+            ("fastapi GET /", fastapi.raiz()),
+            ("fastapi GET /items/{item_id}", fastapi.item(42, q="consulta_desde_cliente")),
+            ("fastapi GET /items", fastapi.items([1, 2, 3])),
+            ("fastapi POST /api/crear_saludo_fastapi", fastapi.crear_saludo("Barry Allen", edad=30)),
+            ("fastapi POST /api/crear_saludo_fastapi/lote",
+             fastapi.crear_saludos_lote([{"nombre": "Ana"}, {"apelido": "Wayne"}])),
+            ("fastapi POST /sse/saludos", fastapi.saludos_sse([{"nombre": "Ana"}, {"nombre": "Eva"}])),
+            ("fastapi WS /ws/saludos", fastapi.saludos_websocket([{"nombre": "Ana"}, {"nombre": "Eva"}])),
+        ]
+        # Todas a la vez: el recorrido tarda lo que la llamada más lenta (o el plazo)
+        resultados = await asyncio.gather(*(llamada for _, llamada in llamadas), return_exceptions=True)
+        for (nombre, _), resultado in zip(llamadas, resultados):
+            print(f"--- {nombre} ---")
+            if isinstance(resultado, Exception):
+                print(f"Error: {type(resultado).__name__}: {resultado}")
+            else:
+                print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        print("-" * 30)
+
+
+async def medir_cobertura(base_url="http://127.0.0.1:8000", total=1000, concurrencia=16, plazo=2.0,
+                          max_item_id=1000):
+    """Devuelve {cobertura: (latencias ordenadas, errores, estadisticas del cliente)}."""
+    import cliente_async
+
+    resultados = {}
+    for cobertura in (False, True):
+        azar = random.Random(42)
+        ids = [azar.randint(1, max_item_id) for _ in range(total)]
+        latencias = []
+        errores = 0
+        async with cliente_async.ClienteFastAPI(base_url, plazo=plazo, cobertura=cobertura) as cliente:
+            async def trabajador():
+                nonlocal errores
+                while ids:
+                    item_id = ids.pop()
+                    t0 = time.perf_counter()
+                    try:
+                        await cliente.item(item_id)
+                    except (cliente_async.ErrorCliente, cliente_async.httpx.TransportError):
+                        errores += 1
+                        continue
+                    latencias.append(time.perf_counter() - t0)
+
+            await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+            resultados[cobertura] = (sorted(latencias), errores, cliente.estadisticas())
+    return resultados
+
+
+def _filtrar_endpoints(servidor):
+    if servidor == "todos":
+        return ENDPOINTS_CARGA
+    return [e for e in ENDPOINTS_CARGA if e[0].startswith(servidor)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente de las APIs Flask y FastAPI")
+    subparsers = parser.add_subparsers(dest="modo")
+
+    carga = subparsers.add_parser("carga", help="Genera carga concurrente y reporta latencias")
+    carga.add_argument("--concurrencia", type=int, default=8, help="Número de hilos")
+    carga.add_argument("--total", type=int, default=None, help="Número total de solicitudes")
+    carga.add_argument("--duracion", type=float, default=None, help="Duración en segundos")
+    carga.add_argument("--servidor", choices=["todos", "flask", "fastapi"], default="todos")
+    carga.add_argument("--timeout", type=float, default=10.0)
+
+    reproducir = subparsers.add_parser("reproducir", help="Reproduce un log JSONL en lazo abierto")
+    reproducir.add_argument("ruta", nargs="?", default="trafico.jsonl")
+    reproducir.add_argument("--base-url", default="http://127.0.0.1:8000")
+    reproducir.add_argument("--velocidad", type=float, default=1.0,
+                            help="Factor de aceleración sobre los offsets grabados")
+    reproducir.add_argument("--tasa", type=float, default=None,
+                            help="Ritmo fijo en solicitudes/s (ignora los offsets)")
+    reproducir.add_argument("--max-en-vuelo", type=int, default=256,
+                            help="Solicitudes en vuelo como máximo; las demás esperan plaza (y cuentan esa espera)")
+    reproducir.add_argument("--salida", default="latencias.hgrm",
+                            help="Archivo donde escribir el histograma")
+    reproducir.add_argument("--timeout", type=float, default=10.0)
+
+    canales = subparsers.add_parser("ws", help="Compara POST individuales con WebSocket y SSE")
+    canales.add_argument("--base-url", default="http://127.0.0.1:8000")
+    canales.add_argument("--total", type=int, default=2000, help="Saludos por canal")
+    canales.add_argument("--canales", default="post,ws,sse", help="Canales separados por comas")
+    canales.add_argument("--timeout", type=float, default=10.0)
+
+    asincrono = subparsers.add_parser("async", help="Recorrido con cliente_async y efecto de la cobertura")
+    asincrono.add_argument("--base-url", default="http://127.0.0.1:8000",
+                           help="App FastAPI contra la que medir la cobertura")
+    asincrono.add_argument("--total", type=int, default=1000,
+                           help="Lecturas por variante (0 para solo el recorrido)")
+    asincrono.add_argument("--concurrencia", type=int, default=16)
+    asincrono.add_argument("--plazo", type=float, default=2.0, help="Plazo por llamada en segundos")
+
+    args = parser.parse_args(argv)
+    if args.modo == "async":
+        asyncio.run(probar_endpoints_async(args.plazo))
+        if args.total:
+            resultados = asyncio.run(medir_cobertura(args.base_url, args.total, args.concurrencia, args.plazo))
+            print(f"{'cobertura':<10} {'ok':>7} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} "
+                  f"{'duplicados':>10} {'ganados':>8}")
+            for cobertura, (latencias, errores, estadisticas) in resultados.items():
+                ms = [percentil(latencias, p) * 1000 for p in (50, 95, 99, 100)]
+                print(f"{'sí' if cobertura else 'no':<10} {len(latencias):>7} {errores:>5} "
+                      f"{ms[0]:>8.2f} {ms[1]:>8.2f} {ms[2]:>8.2f} {ms[3]:>8.2f} "
+                      f"{estadisticas['coberturas']:>10} {estadisticas['coberturas_ganadas']:>8}")
+    elif args.modo == "ws":
+        print(f"{'canal':<6} {'ok':>7} {'err':>5} {'segundos':>9} {'saludos/s':>10}")
+        for canal, (ok, errores, transcurrido) in comparar_canales(
+                args.base_url, args.total, args.canales.split(","), args.timeout).items():
+            print(f"{canal:<6} {ok:>7} {errores:>5} {transcurrido:>9.2f} {ok / transcurrido:>10.1f}")
+    elif args.modo == "reproducir":
+        try:
+            histograma, enviadas, errores, retrasadas = reproducir_trafico(
+                args.ruta, base_url=args.base_url, velocidad=args.velocidad, tasa=args.tasa,
+                max_en_vuelo=args.max_en_vuelo, timeout=args.timeout)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            histograma.escribir_distribucion(archivo)
+        print(f"Enviadas: {enviadas}, errores: {errores}, retrasadas (sin plaza a su hora): {retrasadas}")
+        if retrasadas:
+            print("El servidor no siguió el ritmo: la espera de las retrasadas cuenta en sus latencias.")
+        for p in (50, 90, 99, 99.9, 100):
+            print(f"p{p}: {histograma.valor_en_percentil(p) / 1000:.2f} ms")
+        print(f"Histograma escrito en {args.salida}")
+    elif args.modo == "carga":
+        transcurrido, resultados = generar_carga(
+            _filtrar_endpoints(args.servidor), concurrencia=args.concurrencia,
+            total=args.total, duracion=args.duracion, timeout=args.timeout)
+        imprimir_reporte(transcurrido, resultados)
+    else:
+        probar_endpoints()
+
+
+# Sin argumentos, el script sigue haciendo el recorrido de demostración:
+#   python cliente.py
+# Modo de carga (por ejemplo 16 hilos durante 30 segundos solo contra FastAPI):
+#   python cliente.py carga --concurrencia 16 --duracion 30 --servidor fastapi
+# Reproducción de un log de tráfico al doble de velocidad:
+#   python cliente.py reproducir trafico.jsonl --velocidad 2
+# POST individuales frente a los canales WebSocket y SSE de FastAPI:
+#   python cliente.py ws --total 5000
+# Recorrido con plazos de 0.5 s y medida de la cobertura con 32 lecturas en vuelo:
+#   python cliente.py async --plazo 0.5 --concurrencia 32
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,499 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+
+import httpx
+
+"""Cliente asíncrono y reutilizable de las APIs Flask y FastAPI.
+
+cliente.py está pensado para probar a mano: hace una solicitud tras otra, sin
+timeout ni reintentos, así que una respuesta lenta detiene todo el script. Los
+servicios que llaman a estas APIs necesitan otra cosa: acotar lo que puede
+tardar cada llamada y recortar la cola de latencias (p99) sin multiplicar la
+carga del servidor. ClienteAPI (y sus variantes ClienteFlask y ClienteFastAPI)
+añade sobre un httpx.AsyncClient con conexiones persistentes:
+
+- Plazo por llamada ('plazo', en segundos): cubre todos los intentos, las
+  esperas entre ellos y la lectura del cuerpo. Si se agota se lanza
+  PlazoAgotado; nunca se espera más que eso.
+- Reintentos con espera exponencial y jitter completo (PoliticaReintentos),
+  solo cuando repetir es seguro: métodos idempotentes (GET) y POST con la
+  cabecera Idempotency-Key (el servidor deduplica, ver idempotencia.py). Se
+  reintentan errores de red, 408, 429, 502, 503 y 504, y se respeta
+  Retry-After si cabe en el plazo. Un error de conexión (la solicitud no llegó
+  a salir) se reintenta con cualquier método.
+- Cobertura ("hedged requests", opcional y solo para GET): si la respuesta no
+  ha llegado cuando pasa el p95 de las latencias recientes de esa operación,
+  se envía un duplicado y gana la primera respuesta; la otra se cancela. Solo
+  el ~5% más lento paga un duplicado, y 'fraccion_coberturas' limita los
+  duplicados a una fracción de las solicitudes para no doblar la carga si el
+  servidor entero se vuelve lento.
+- Un circuit breaker por URL base (InterruptorCircuito, compartido por todos
+  los clientes del proceso que apuntan a la misma URL): tras 'umbral_fallos'
+  fallos seguidos (errores de red o 5xx) deja de enviar durante
+  'tiempo_abierto' segundos y falla al instante con CircuitoAbierto; después
+  deja pasar una sola solicitud de prueba para decidir si vuelve a cerrarse.
+
+Todo corre en un único bucle de eventos, así que los contadores y el estado del
+circuito no necesitan locks. Ejemplo:
+
+    async with ClienteFastAPI(plazo=0.5, cobertura=True) as cliente:
+        item = await cliente.item(42)
+        saludo = await cliente.crear_saludo("Ana", edad=30)
+
+Recorrido de todos los endpoints y comparación con y sin cobertura:
+    python cliente.py async --total 2000
+"""
+
+URL_FLASK = "http://127.0.0.1:5000"
+URL_FASTAPI = "http://127.0.0.1:8000"
+
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS"}
+ESTADOS_REINTENTABLES = {408, 429, 502, 503, 504}
+# Las mismas cabeceras que usan idempotencia.py y perfilador.py en el servidor
+CABECERA_IDEMPOTENCIA = "Idempotency-Key"
+CABECERA_PERFIL = "X-Perfil-Token"
+
+# Estados del circuito
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class ErrorCliente(Exception):
+    pass
+
+
+class PlazoAgotado(ErrorCliente):
+    def __init__(self, operacion, plazo):
+        super().__init__(f"Plazo de {plazo:.3f} s agotado en '{operacion}'")
+        self.operacion = operacion
+        self.plazo = plazo
+
+
+class CircuitoAbierto(ErrorCliente):
+    def __init__(self, base_url, reintentar_en):
+        super().__init__(f"Circuito abierto para {base_url}")
+        self.base_url = base_url
+        self.reintentar_en = reintentar_en
+
+
+class ErrorHTTP(ErrorCliente):
+    """Respuesta con estado >= 400 en un método de endpoint. 'respuesta' es la
+    httpx.Response, por ejemplo para leer el "detail" de un 422."""
+
+    def __init__(self, respuesta):
+        super().__init__(f"HTTP {respuesta.status_code} en {respuesta.request.method} {respuesta.request.url}")
+        self.respuesta = respuesta
+        self.estado = respuesta.status_code
+
+
+class PoliticaReintentos:
+    """Como mucho 'intentos' envíos; antes del intento n se espera un tiempo al
+    azar entre 0 y min(maximo, base * 2**n) ("full jitter"), así los clientes
+    que fallaron a la vez no vuelven a llegar todos juntos."""
+
+    def __init__(self, intentos=3, base=0.05, maximo=1.0):
+        self.intentos = intentos
+        self.base = base
+        self.maximo = maximo
+
+    def espera(self, intento, azar=random):
+        return azar.uniform(0, min(self.maximo, self.base * 2 ** intento))
+
+
+class EstimadorLatencia:
+    """Latencias de las últimas 'ventana' respuestas con éxito de una operación.
+
+    retardo_cobertura() devuelve su percentil 'percentil' (el momento de enviar
+    el duplicado), o None mientras no haya 'minimo' muestras.
+    """
+
+    def __init__(self, ventana=256, minimo=20, percentil=95):
+        self.latencias = deque(maxlen=ventana)
+        self.minimo = minimo
+        self.percentil = percentil
+
+    def registrar(self, segundos):
+        self.latencias.append(segundos)
+
+    def retardo_cobertura(self):
+        if len(self.latencias) < self.minimo:
+            return None
+        ordenadas = sorted(self.latencias)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * self.percentil / 100))]
+
+
+class InterruptorCircuito:
+    def __init__(self, base_url, umbral_fallos=5, tiempo_abierto=5.0, reloj=time.monotonic):
+        self.base_url = base_url
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_abierto = tiempo_abierto
+        self._reloj = reloj
+        self.estado = CERRADO
+        self.fallos_seguidos = 0
+        self.aperturas = 0
+        self.rechazadas = 0
+        self._abierto_hasta = 0.0
+        self._prueba_en_curso = False
+
+    def permitir(self):
+        """Lanza CircuitoAbierto si ahora no se debe enviar nada a esta URL."""
+        if self.estado == ABIERTO:
+            restante = self._abierto_hasta - self._reloj()
+            if restante > 0:
+                self.rechazadas += 1
+                raise CircuitoAbierto(self.base_url, restante)
+            self.estado = SEMIABIERTO
+        if self.estado == SEMIABIERTO:
+            # Una sola solicitud de prueba a la vez; el resto falla al instante
+            if self._prueba_en_curso:
+                self.rechazadas += 1
+                raise CircuitoAbierto(self.base_url, self.tiempo_abierto)
+            self._prueba_en_curso = True
+
+    def exito(self):
+        self.estado = CERRADO
+        self.fallos_seguidos = 0
+        self._prueba_en_curso = False
+
+    def fallo(self):
+        self._prueba_en_curso = False
+        self.fallos_seguidos += 1
+        if self.estado == SEMIABIERTO or (self.estado == CERRADO and self.fallos_seguidos >= self.umbral_fallos):
+            self.estado = ABIERTO
+            self.aperturas += 1
+            self._abierto_hasta = self._reloj() + self.tiempo_abierto
+
+    def abandonado(self):
+        """El intento se canceló (perdió la carrera o se agotó el plazo) sin
+        saber si el servidor estaba bien: no cuenta como éxito ni como fallo."""
+        self._prueba_en_curso = False
+
+    def estadisticas(self):
+        return {"abierto": int(self.estado != CERRADO), "fallos_seguidos": self.fallos_seguidos,
+                "aperturas": self.aperturas, "rechazadas": self.rechazadas}
+
+
+_interruptores = {}
+
+
+def interruptor_para(base_url, **opciones):
+    """El InterruptorCircuito de 'base_url' en este proceso (se crea la primera vez)."""
+    base_url = base_url.rstrip("/")
+    interruptor = _interruptores.get(base_url)
+    if interruptor is None:
+        interruptor = _interruptores[base_url] = InterruptorCircuito(base_url, **opciones)
+    return interruptor
+
+
+def _es_idempotente(metodo, cabeceras):
+    if metodo in METODOS_IDEMPOTENTES:
+        return True
+    return any(nombre.lower() == CABECERA_IDEMPOTENCIA.lower() for nombre in (cabeceras or {}))
+
+
+def _segundos_retry_after(respuesta):
+    try:
+        return float(respuesta.headers.get("Retry-After", ""))
+    except ValueError:
+        return 0.0
+
+
+class ClienteAPI:
+    """Cliente de una URL base con plazos, reintentos, cobertura y circuit breaker.
+
+    'transporte' permite usar otro transporte de httpx, por ejemplo
+    httpx.ASGITransport(app=app) para llamar a la app en el mismo proceso.
+    """
+
+    def __init__(self, base_url, plazo=2.0, reintentos=None, cobertura=False, percentil_cobertura=95,
+                 fraccion_coberturas=0.1, interruptor=None, max_conexiones=100, transporte=None):
+        self.base_url = base_url.rstrip("/")
+        self.plazo = plazo
+        self.reintentos = reintentos or PoliticaReintentos()
+        self.cobertura = cobertura
+        self.percentil_cobertura = percentil_cobertura
+        self.fraccion_coberturas = fraccion_coberturas
+        self.interruptor = interruptor or interruptor_para(self.base_url)
+        # Sin timeout de httpx: el plazo de cada llamada lo controla solicitar()
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url, timeout=None, transport=transporte,
+            limits=httpx.Limits(max_connections=max_conexiones, max_keepalive_connections=max_conexiones))
+        self._estimadores = {}
+        self.solicitudes = 0
+        self.intentos = 0
+        self.reintentos_hechos = 0
+        self.coberturas = 0
+        self.coberturas_ganadas = 0
+        self.plazos_agotados = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+
+    async def cerrar(self):
+        await self._http.aclose()
+
+    def estadisticas(self):
+        return {
+            "solicitudes": self.solicitudes,
+            "intentos": self.intentos,
+            "reintentos": self.reintentos_hechos,
+            "coberturas": self.coberturas,
+            "coberturas_ganadas": self.coberturas_ganadas,
+            "plazos_agotados": self.plazos_agotados,
+            **{f"circuito_{nombre}": valor for nombre, valor in self.interruptor.estadisticas().items()},
+        }
+
+    async def solicitar(self, metodo, ruta, *, operacion=None, plazo=None, cobertura=None,
+                        idempotente=None, **kwargs):
+        """Envía la solicitud y devuelve la httpx.Response (con el cuerpo ya leído).
+
+        'operacion' agrupa las latencias para la cobertura; por defecto es
+        "METODO ruta", así que las rutas con ids deberían pasar su plantilla
+        (por ejemplo "GET /items/{item_id}"). Lanza PlazoAgotado,
+        CircuitoAbierto o el httpx.TransportError del último intento.
+        """
+        metodo = metodo.upper()
+        plazo = self.plazo if plazo is None else plazo
+        if idempotente is None:
+            idempotente = _es_idempotente(metodo, kwargs.get("headers"))
+        if cobertura is None:
+            cobertura = self.cobertura
+        operacion = operacion or f"{metodo} {ruta}"
+        estimador = self._estimadores.get(operacion)
+        if estimador is None:
+            estimador = self._estimadores[operacion] = EstimadorLatencia(percentil=self.percentil_cobertura)
+
+        async def hacer_intento():
+            return await self._intento(metodo, ruta, estimador, kwargs)
+
+        bucle = asyncio.get_running_loop()
+        limite = bucle.time() + plazo
+        self.solicitudes += 1
+        intento = 0
+        while True:
+            restante = limite - bucle.time()
+            if restante <= 0:
+                self.plazos_agotados += 1
+                raise PlazoAgotado(operacion, plazo)
+            respuesta = error = None
+            try:
+                if cobertura and metodo in METODOS_IDEMPOTENTES:
+                    respuesta = await asyncio.wait_for(self._con_cobertura(hacer_intento, estimador), restante)
+                else:
+                    respuesta = await asyncio.wait_for(hacer_intento(), restante)
+            except asyncio.TimeoutError:
+                self.plazos_agotados += 1
+                raise PlazoAgotado(operacion, plazo) from None
+            except httpx.TransportError as e:
+                error = e
+
+            if respuesta is not None and respuesta.status_code not in ESTADOS_REINTENTABLES:
+                return respuesta
+            # Sin respuesta de conexión no llegó nada al servidor: repetir es seguro siempre
+            seguro = idempotente or isinstance(error, httpx.ConnectError)
+            espera = self.reintentos.espera(intento)
+            if respuesta is not None:
+                espera = max(espera, _segundos_retry_after(respuesta))
+            if not seguro or intento + 1 >= self.reintentos.intentos or espera >= limite - bucle.time():
+                if error is not None:
+                    raise error
+                return respuesta
+            await asyncio.sleep(espera)
+            intento += 1
+            self.reintentos_hechos += 1
+
+    async def _intento(self, metodo, ruta, estimador, kwargs):
+        self.interruptor.permitir()
+        self.intentos += 1
+        inicio = time.perf_counter()
+        try:
+            respuesta = await self._http.request(metodo, ruta, **kwargs)
+        except httpx.TransportError:
+            self.interruptor.fallo()
+            raise
+        except BaseException:
+            self.interruptor.abandonado()
+            raise
+        if respuesta.status_code >= 500:
+            self.interruptor.fallo()
+        else:
+            self.interruptor.exito()
+            estimador.registrar(time.perf_counter() - inicio)
+        return respuesta
+
+    def _cobertura_permitida(self):
+        return self.coberturas < self.fraccion_coberturas * self.solicitudes
+
+    async def _con_cobertura(self, hacer_intento, estimador):
+        retardo = estimador.retardo_cobertura()
+        if retardo is None:
+            return await hacer_intento()
+        primera = asyncio.ensure_future(hacer_intento())
+        tareas = [primera]
+        try:
+            hechas, _ = await asyncio.wait(tareas, timeout=retardo)
+            if hechas or not self._cobertura_permitida():
+                return await primera
+            self.coberturas += 1
+            tareas.append(asyncio.ensure_future(hacer_intento()))
+            pendientes = set(tareas)
+            error = None
+            while pendientes:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechas:
+                    if tarea.exception() is None:
+                        if tarea is not primera:
+                            self.coberturas_ganadas += 1
+                        return tarea.result()
+                    # Si falla una (o el circuito rechaza el duplicado) esperamos a la otra
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in tareas:
+                if not tarea.done():
+                    tarea.cancel()
+
+    # --- Endpoints comunes a las dos apps ---
+
+    async def raiz(self, **opciones):
+        return _json_o_texto(await self.solicitar("GET", "/", **opciones))
+
+    async def metricas(self, **opciones):
+        """Texto de /metrics en formato Prometheus."""
+        return _comprobar(await self.solicitar("GET", "/metrics", **opciones)).text
+
+    async def perfiles(self, token, ruta=None, limpiar=False, **opciones):
+        """Pilas colapsadas de /admin/perfiles (requiere el token del perfilador)."""
+        params = {"limpiar": "1"} if limpiar else {}
+        if ruta:
+            params["ruta"] = ruta
+        # Con limpiar=1 la llamada cambia el estado: no se reintenta
+        respuesta = await self.solicitar("GET", "/admin/perfiles", params=params, idempotente=not limpiar,
+                                         headers={CABECERA_PERFIL: token}, **opciones)
+        return _comprobar(respuesta).text
+
+    async def _crear_saludo(self, ruta, datos, clave_idempotencia, opciones):
+        # Con una clave única por saludo (la misma en todos los reintentos) el
+        # servidor procesa el saludo una sola vez aunque lo reintentemos
+        cabeceras = {CABECERA_IDEMPOTENCIA: clave_idempotencia or uuid.uuid4().hex}
+        return _comprobar(await self.solicitar("POST", ruta, json=datos, headers=cabeceras, **opciones)).json()
+
+    async def _post_ndjson(self, ruta, saludos, opciones):
+        """Envía los saludos como NDJSON y devuelve la respuesta (sin reintentos:
+        los endpoints de lote y SSE no deduplican)."""
+        cuerpo = b"".join(json.dumps(saludo, ensure_ascii=False).encode("utf-8") + b"\n" for saludo in saludos)
+        respuesta = await self.solicitar("POST", ruta, content=cuerpo, idempotente=False,
+                                         headers={"Content-Type": "application/x-ndjson"}, **opciones)
+        return _comprobar(respuesta)
+
+
+def _comprobar(respuesta):
+    if respuesta.status_code >= 400:
+        raise ErrorHTTP(respuesta)
+    return respuesta
+
+
+def _json_o_texto(respuesta):
+    _comprobar(respuesta)
+    if respuesta.headers.get("content-type", "").startswith("application/json"):
+        return respuesta.json()
+    return respuesta.text
+
+
+def _lineas_ndjson(respuesta):
+    return [json.loads(linea) for linea in respuesta.text.splitlines() if linea.strip()]
+
+
+class ClienteFlask(ClienteAPI):
+    def __init__(self, base_url=URL_FLASK, **opciones):
+        super().__init__(base_url, **opciones)
+
+    async def saludo(self, **opciones):
+        return _comprobar(await self.solicitar("GET", "/api/saludo", **opciones)).json()
+
+    async def crear_saludo(self, nombre, clave_idempotencia=None, **opciones):
+        return await self._crear_saludo("/api/crear_saludo", {"nombre": nombre}, clave_idempotencia, opciones)
+
+    async def crear_saludos_lote(self, saludos, **opciones):
+        """Lista de resultados {"indice", ...} de /api/crear_saludo/lote, en orden.
+
+        httpx envía todo el cuerpo antes de leer la respuesta, así que es para
+        lotes que caben en los buffers de red; con lotes grandes el plazo
+        acaba en PlazoAgotado en lugar de en un bloqueo."""
+        return _lineas_ndjson(await self._post_ndjson("/api/crear_saludo/lote", saludos, opciones))
+
+
+class ClienteFastAPI(ClienteAPI):
+    def __init__(self, base_url=URL_FASTAPI, **opciones):
+        super().__init__(base_url, **opciones)
+
+    async def item(self, item_id, q=None, **opciones):
+        params = {"q": q} if q else None
+        respuesta = await self.solicitar("GET", f"/items/{item_id}", params=params,
+                                         operacion="GET /items/{item_id}", **opciones)
+        return _comprobar(respuesta).json()
+
+    async def items(self, ids, **opciones):
+        respuesta = await self.solicitar("GET", "/items", params={"ids": ",".join(map(str, ids))}, **opciones)
+        return _comprobar(respuesta).json()
+
+    async def crear_saludo(self, nombre, edad=None, clave_idempotencia=None, **opciones):
+        datos = {"nombre": nombre} if edad is None else {"nombre": nombre, "edad": edad}
+        return await self._crear_saludo("/api/crear_saludo_fastapi", datos, clave_idempotencia, opciones)
+
+    async def crear_saludos_lote(self, saludos, **opciones):
+        """Como ClienteFlask.crear_saludos_lote, contra /api/crear_saludo_fastapi/lote."""
+        return _lineas_ndjson(await self._post_ndjson("/api/crear_saludo_fastapi/lote", saludos, opciones))
+
+    async def saludos_sse(self, saludos, **opciones):
+        """Envía los saludos a /sse/saludos y devuelve el "data" de cada evento, en orden."""
+        respuesta = await self._post_ndjson("/sse/saludos", saludos, opciones)
+        return [json.loads(linea[5:]) for linea in respuesta.text.splitlines() if linea.startswith("data:")]
+
+    async def saludos_websocket(self, saludos, plazo=None):
+        """Envía los saludos por /ws/saludos y devuelve las respuestas, en orden.
+
+        Una tarea envía mientras se leen las respuestas, como hace el servidor. El plazo
+        cubre la conexión y todo el intercambio; el circuito de la URL base se
+        consulta y se actualiza igual que con las solicitudes HTTP."""
+        from websockets.asyncio.client import connect
+
+        plazo = self.plazo if plazo is None else plazo
+        url = self.base_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1) + "/ws/saludos"
+
+        async def intercambio():
+            async with connect(url) as conexion:
+                async def enviar():
+                    for saludo in saludos:
+                        await conexion.send(json.dumps(saludo, ensure_ascii=False))
+
+                emisor = asyncio.ensure_future(enviar())
+                try:
+                    return [json.loads(await conexion.recv()) for _ in saludos]
+                finally:
+                    emisor.cancel()
+
+        self.interruptor.permitir()
+        self.solicitudes += 1
+        try:
+            resultados = await asyncio.wait_for(intercambio(), plazo)
+        except asyncio.TimeoutError:
+            self.interruptor.abandonado()
+            self.plazos_agotados += 1
+            raise PlazoAgotado("WS /ws/saludos", plazo) from None
+        except Exception:
+            self.interruptor.fallo()
+            raise
+        except BaseException:
+            self.interruptor.abandonado()
+            raise
+        self.interruptor.exito()
+        return resultados
@@ -0,0 +1,96 @@
+import asyncio
+
+"""Coalescencia de solicitudes idénticas en vuelo ("single flight").
+
+Si llegan 500 solicitudes a /items/42 a la vez y el item no está en caché,
+sin coalescencia cada corutina haría su propia consulta al almacenamiento
+(estampida o "thundering herd"). Con Coalescedor solo la primera lanza el
+trabajo; las demás esperan el resultado de esa misma tarea.
+
+Detalles que importan con asyncio:
+- El trabajo se ejecuta en una tarea propia y cada solicitud la espera a través
+  de asyncio.shield(): si se cancela una solicitud (el cliente cerró la
+  conexión o venció su timeout), no se cancela el trabajo que comparten las
+  demás.
+- Si se van todas las solicitudes que esperaban, el trabajo se cancela: ya no
+  le interesa a nadie.
+- La entrada se elimina al terminar la tarea, también si lanzó una excepción,
+  así una clave que falla no se queda "atascada" devolviendo el mismo error.
+"""
+
+
+class _Vuelo:
+    __slots__ = ("tarea", "esperando")
+
+    def __init__(self, tarea):
+        self.tarea = tarea
+        self.esperando = 0
+
+
+class Coalescedor:
+    """Comparte una única ejecución entre las llamadas concurrentes con la misma clave."""
+
+    # Claves de estadisticas() que solo crecen (se exportan como counter)
+    CONTADORES = ("ejecuciones", "deduplicadas", "timeouts", "abandonadas")
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._en_vuelo = {}
+        self.ejecuciones = 0
+        self.deduplicadas = 0
+        self.timeouts = 0
+        self.abandonadas = 0
+
+    async def ejecutar(self, clave, fabrica, timeout=None):
+        """Devuelve el resultado de 'await fabrica()', compartido entre llamadas
+        concurrentes con la misma 'clave'.
+
+        'fabrica' es una función sin argumentos que devuelve una corutina; solo
+        se llama si no hay ya una ejecución en vuelo para esa clave. Lanza
+        asyncio.TimeoutError si el resultado no llega en 'timeout' segundos.
+        """
+        vuelo = self._en_vuelo.get(clave)
+        if vuelo is None:
+            vuelo = _Vuelo(asyncio.ensure_future(fabrica()))
+            self._en_vuelo[clave] = vuelo
+            vuelo.tarea.add_done_callback(lambda tarea: self._terminar(clave, vuelo))
+            self.ejecuciones += 1
+        else:
+            self.deduplicadas += 1
+
+        vuelo.esperando += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(vuelo.tarea),
+                                          timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            vuelo.esperando -= 1
+            if vuelo.esperando == 0 and not vuelo.tarea.done():
+                # Nadie más espera este resultado: cancelamos el trabajo y
+                # liberamos la clave para que la próxima llamada empiece de cero.
+                self.abandonadas += 1
+                vuelo.tarea.cancel()
+                self._terminar(clave, vuelo)
+
+    def _terminar(self, clave, vuelo):
+        if self._en_vuelo.get(clave) is vuelo:
+            del self._en_vuelo[clave]
+        tarea = vuelo.tarea
+        if tarea.done() and not tarea.cancelled():
+            # Marcamos la excepción como recuperada: ya se propagó a quienes esperaban
+            # (o no esperaba nadie), y así asyncio no avisa de "exception never retrieved".
+            tarea.exception()
+
+    def en_vuelo(self):
+        return len(self._en_vuelo)
+
+    def estadisticas(self):
+        return {
+            "en_vuelo": len(self._en_vuelo),
+            "ejecuciones": self.ejecuciones,
+            "deduplicadas": self.deduplicadas,
+            "timeouts": self.timeouts,
+            "abandonadas": self.abandonadas,
+        }
@@ -0,0 +1,544 @@
+import gzip
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional
+    zstandard = None
+
+"""Compresión de respuestas negociada con Accept-Encoding, para las dos apps.
+
+Las respuestas de lote y de multi-item viajan por un enlace medido y con poco
+ancho de banda, y JSON se comprime muy bien. Los middlewares de este módulo:
+
+- Eligen la codificación a partir de Accept-Encoding (respetando los q=): gzip
+  siempre, y br (brotli) o zstd si esos paquetes están instalados. Con empate,
+  se prefiere el orden de PREFERENCIA.
+- Solo comprimen tipos de texto (JSON, NDJSON, text/*...) que no vengan ya
+  codificados, y no comprimen cuerpos por debajo de 'umbral' bytes
+  (COMPRESION_UMBRAL, 1024 por defecto): ahí las cabeceras gzip y el tiempo de
+  CPU cuestan más de lo que se ahorra.
+- Las respuestas en streaming (sin Content-Length, como los lotes NDJSON o los
+  eventos SSE) se comprimen trozo a trozo con un compresor incremental, sin
+  reunir el cuerpo entero. Tras cada trozo que entrega la app se fuerza un
+  flush (Z_SYNC_FLUSH en gzip): el cliente recibe cada resultado o evento en
+  cuanto se produce, igual que sin compresión. Cuesta unos bytes por trozo,
+  pero si el compresor se guardara la salida hasta juntar un bloque, un SSE
+  solo llegaría al final del flujo.
+- Las respuestas cacheables con ETag fuerte (las de cache_respuestas.py, como
+  api_saludo) guardan su forma comprimida por (ETag, codificación): el mismo
+  cuerpo no se vuelve a comprimir en cada solicitud.
+
+El ETag de una respuesta comprimida lleva un sufijo ("abc" pasa a "abc-gzip"),
+porque es otra representación con otros bytes. Al recibir If-None-Match el
+middleware quita ese sufijo antes de pasar la solicitud a la app, así las
+comparaciones de ETag de la app siguen funcionando y el 304 se conserva.
+
+Métricas (por codificación): respuestas comprimidas, bytes antes y después, y
+segundos de CPU gastados en comprimir. El ratio de compresión en Prometheus:
+    sum(rate(compresion_bytes_originales_total[5m])) / sum(rate(compresion_bytes_comprimidos_total[5m]))
+"""
+
+PREFERENCIA = ("br", "zstd", "gzip")
+UMBRAL_POR_DEFECTO = 1024
+TIPOS_COMPRIMIBLES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "application/xml", "image/svg+xml")
+_RE_SUFIJO_ETAG = re.compile(r'-(?:%s)"' % "|".join(PREFERENCIA))
+
+
+# --- Codificaciones ---
+
+class _FlujoZlib:
+    def __init__(self, compresor):
+        self._compresor = compresor
+
+    def comprimir(self, datos, descargar=False):
+        salida = self._compresor.compress(datos)
+        if descargar:
+            salida += self._compresor.flush(zlib.Z_SYNC_FLUSH)
+        return salida
+
+    def terminar(self):
+        return self._compresor.flush(zlib.Z_FINISH)
+
+
+class CodificacionGzip:
+    nombre = "gzip"
+
+    def __init__(self, nivel=6):
+        self.nivel = nivel
+
+    def comprimir(self, datos):
+        # mtime=0: la misma entrada da siempre los mismos bytes
+        return gzip.compress(datos, compresslevel=self.nivel, mtime=0)
+
+    def flujo(self):
+        # wbits=31: formato gzip (cabecera y CRC) en lugar de zlib
+        return _FlujoZlib(zlib.compressobj(self.nivel, zlib.DEFLATED, 31))
+
+
+class _FlujoBrotli:
+    def __init__(self, calidad):
+        self._compresor = brotli.Compressor(quality=calidad)
+
+    def comprimir(self, datos, descargar=False):
+        salida = self._compresor.process(datos)
+        if descargar:
+            salida += self._compresor.flush()
+        return salida
+
+    def terminar(self):
+        return self._compresor.finish()
+
+
+class CodificacionBrotli:
+    nombre = "br"
+
+    def __init__(self, calidad=4):
+        # La calidad 11 (la de por defecto) es para contenido estático: demasiado lenta aquí
+        self.calidad = calidad
+
+    def comprimir(self, datos):
+        return brotli.compress(datos, quality=self.calidad)
+
+    def flujo(self):
+        return _FlujoBrotli(self.calidad)
+
+
+class _FlujoZstd:
+    def __init__(self, compresor):
+        self._compresor = compresor
+
+    def comprimir(self, datos, descargar=False):
+        salida = self._compresor.compress(datos)
+        if descargar:
+            salida += self._compresor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return salida
+
+    def terminar(self):
+        return self._compresor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class CodificacionZstd:
+    nombre = "zstd"
+
+    def __init__(self, nivel=3):
+        self.nivel = nivel
+        self._compresor = zstandard.ZstdCompressor(level=nivel)
+
+    def comprimir(self, datos):
+        return self._compresor.compress(datos)
+
+    def flujo(self):
+        return _FlujoZstd(zstandard.ZstdCompressor(level=self.nivel).compressobj())
+
+
+CODIFICACIONES = {"gzip": CodificacionGzip()}
+if brotli is not None:
+    CODIFICACIONES["br"] = CodificacionBrotli()
+if zstandard is not None:
+    CODIFICACIONES["zstd"] = CodificacionZstd()
+
+
+def negociar(accept_encoding):
+    """Codificación a usar según la cabecera Accept-Encoding, o None (sin comprimir)."""
+    if not accept_encoding:
+        return None
+    calidades = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        calidad = 1.0
+        for parametro in parametros.split(";"):
+            clave, _, valor = parametro.partition("=")
+            if clave.strip().lower() == "q":
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        calidades["gzip" if nombre == "x-gzip" else nombre] = calidad
+    comodin = calidades.get("*", 0.0)
+    elegida, mejor = None, 0.0
+    for nombre in PREFERENCIA:
+        if nombre not in CODIFICACIONES:
+            continue
+        calidad = calidades.get(nombre, comodin)
+        if calidad > mejor:
+            elegida, mejor = nombre, calidad
+    return elegida
+
+
+def etag_con_sufijo(etag, codificacion):
+    """'"abc"' -> '"abc-gzip"' (y 'W/"abc"' -> 'W/"abc-gzip"')."""
+    if not etag or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{codificacion}"'
+
+
+def quitar_sufijos_etag(if_none_match):
+    """Quita los sufijos de codificación de una cabecera If-None-Match."""
+    return _RE_SUFIJO_ETAG.sub('"', if_none_match)
+
+
+# --- Lógica común a los dos middlewares ---
+
+class CompresorRespuestas:
+    def __init__(self, umbral=None, max_cache=256):
+        self.umbral = int(os.environ.get("COMPRESION_UMBRAL", UMBRAL_POR_DEFECTO)) if umbral is None else umbral
+        self.max_cache = max_cache
+        self._cache = OrderedDict()  # (etag, codificación) -> bytes comprimidos
+        self._lock = threading.Lock()
+        self.omitidas_umbral = 0
+        self._estadisticas = {
+            nombre: {"respuestas": 0, "bytes_originales": 0, "bytes_comprimidos": 0,
+                     "segundos_cpu": 0.0, "aciertos_cache": 0}
+            for nombre in CODIFICACIONES
+        }
+
+    def tipo_comprimible(self, cabeceras):
+        """cabeceras: dict con nombres en minúsculas."""
+        if "content-encoding" in cabeceras or "content-range" in cabeceras:
+            return False
+        if "no-transform" in cabeceras.get("cache-control", ""):
+            return False
+        tipo = cabeceras.get("content-type", "").split(";", 1)[0].strip().lower()
+        return (tipo.startswith("text/") or tipo in TIPOS_COMPRIMIBLES
+                or tipo.endswith("+json") or tipo.endswith("+xml"))
+
+    def bajo_umbral(self, longitud):
+        if longitud < self.umbral:
+            with self._lock:
+                self.omitidas_umbral += 1
+            return True
+        return False
+
+    def comprimir_cuerpo(self, codificacion, cuerpo, cabeceras):
+        """Comprime un cuerpo completo. Si la respuesta es cacheable y tiene ETag
+        fuerte, reutiliza (y guarda) su forma comprimida."""
+        etag = cabeceras.get("etag")
+        control = cabeceras.get("cache-control", "")
+        clave = None
+        if etag and not etag.startswith("W/") and "no-store" not in control and "private" not in control:
+            clave = (etag, codificacion)
+            with self._lock:
+                comprimido = self._cache.get(clave)
+                if comprimido is not None:
+                    self._cache.move_to_end(clave)
+                    estadisticas = self._estadisticas[codificacion]
+                    estadisticas["aciertos_cache"] += 1
+                    estadisticas["respuestas"] += 1
+                    estadisticas["bytes_originales"] += len(cuerpo)
+                    estadisticas["bytes_comprimidos"] += len(comprimido)
+                    return comprimido
+        inicio = time.thread_time()
+        comprimido = CODIFICACIONES[codificacion].comprimir(cuerpo)
+        self._anotar(codificacion, len(cuerpo), len(comprimido), time.thread_time() - inicio, 1)
+        if clave is not None:
+            with self._lock:
+                self._cache[clave] = comprimido
+                while len(self._cache) > self.max_cache:
+                    self._cache.popitem(last=False)
+        return comprimido
+
+    def flujo(self, codificacion):
+        return _FlujoMedido(self, codificacion)
+
+    def _anotar(self, codificacion, originales, comprimidos, segundos, respuestas=0):
+        with self._lock:
+            estadisticas = self._estadisticas[codificacion]
+            estadisticas["respuestas"] += respuestas
+            estadisticas["bytes_originales"] += originales
+            estadisticas["bytes_comprimidos"] += comprimidos
+            estadisticas["segundos_cpu"] += segundos
+
+    def estadisticas(self):
+        with self._lock:
+            resultado = {nombre: dict(e) for nombre, e in self._estadisticas.items()}
+            omitidas = self.omitidas_umbral
+        for e in resultado.values():
+            e["ratio"] = e["bytes_originales"] / e["bytes_comprimidos"] if e["bytes_comprimidos"] else 0.0
+        return {"omitidas_umbral": omitidas, "codificaciones": resultado}
+
+    def muestras(self):
+        """Colector para RegistroMetricas.registrar_colector."""
+        estadisticas = self.estadisticas()
+        # Todas son totales acumulados: counters
+        muestras = [("compresion_omitidas_umbral_total", "counter",
+                     "Respuestas no comprimidas por estar bajo el umbral.", {}, estadisticas["omitidas_umbral"])]
+        for nombre, e in estadisticas["codificaciones"].items():
+            for clave, valor in e.items():
+                if clave != "ratio":  # el ratio no se puede sumar entre procesos: se calcula con los bytes
+                    muestras.append((f"compresion_{clave}_total", "counter", "Compresión de respuestas.",
+                                     {"codificacion": nombre}, valor))
+        return muestras
+
+
+class _FlujoMedido:
+    """Compresor incremental de una respuesta en streaming; anota bytes y CPU.
+    Cada trozo sale comprimido entero (con flush), sin esperar a los siguientes."""
+
+    def __init__(self, compresor, codificacion):
+        self._compresor = compresor
+        self._codificacion = codificacion
+        self._flujo = CODIFICACIONES[codificacion].flujo()
+        self.originales = 0
+        self.comprimidos = 0
+        self.segundos = 0.0
+
+    def comprimir(self, trozo):
+        if not trozo:
+            return b""
+        inicio = time.thread_time()
+        salida = self._flujo.comprimir(trozo, descargar=True)
+        self.segundos += time.thread_time() - inicio
+        self.originales += len(trozo)
+        self.comprimidos += len(salida)
+        return salida
+
+    def terminar(self):
+        inicio = time.thread_time()
+        salida = self._flujo.terminar()
+        self.segundos += time.thread_time() - inicio
+        self.comprimidos += len(salida)
+        self._compresor._anotar(self._codificacion, self.originales, self.comprimidos, self.segundos, 1)
+        return salida
+
+
+def _agregar_vary(valor):
+    if not valor:
+        return "Accept-Encoding"
+    if "accept-encoding" in valor.lower() or valor.strip() == "*":
+        return valor
+    return f"{valor}, Accept-Encoding"
+
+
+def _sufijo_304(codificacion, if_none_match):
+    """En un 304, el ETag lleva el sufijo si el cliente guardó la versión comprimida."""
+    return codificacion if codificacion and if_none_match and f'-{codificacion}"' in if_none_match else None
+
+
+# --- WSGI (Flask) ---
+
+class _CuerpoComprimido:
+    """Iterable de respuesta WSGI que comprime trozo a trozo y cierra el original."""
+
+    def __init__(self, iterable, flujo):
+        self._iterable = iterable
+        self._flujo = flujo
+
+    def __iter__(self):
+        for trozo in self._iterable:
+            salida = self._flujo.comprimir(trozo)
+            if salida:
+                yield salida
+        yield self._flujo.terminar()
+
+    def close(self):
+        if hasattr(self._iterable, "close"):
+            self._iterable.close()
+
+
+class MiddlewareCompresionWSGI:
+    """Envuelve una app WSGI. La app tiene que llamar a start_response antes de
+    devolver el cuerpo (Flask/Werkzeug siempre lo hace); si no, la respuesta
+    pasa sin comprimir."""
+
+    def __init__(self, app, compresor):
+        self.app = app
+        self.compresor = compresor
+
+    def __call__(self, environ, start_response):
+        compresor = self.compresor
+        codificacion = negociar(environ.get("HTTP_ACCEPT_ENCODING"))
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            environ["HTTP_IF_NONE_MATCH"] = quitar_sufijos_etag(if_none_match)
+        capturado = []
+
+        def start_response_diferido(status, headers, exc_info=None):
+            if capturado and capturado[0] is None:  # modo directo (ver abajo)
+                return start_response(status, headers, exc_info)
+            capturado[:] = [status, headers, exc_info]
+            return _escribir_no_soportado
+
+        iterable = self.app(environ, start_response_diferido)
+        if not capturado:
+            capturado.append(None)
+            return iterable
+        status, headers, exc_info = capturado
+        cabeceras = {nombre.lower(): valor for nombre, valor in headers}
+        estado = int(status[:3])
+        if estado == 304:
+            # Un 304 no lleva Content-Type: ajustamos el ETag a la versión que tiene el
+            # cliente y añadimos el mismo Vary que tendría el 200 (RFC 9110, 15.4.5),
+            # para que una caché no lo asocie a la representación con otra codificación.
+            sufijo = _sufijo_304(codificacion, if_none_match)
+            if sufijo and "etag" in cabeceras:
+                headers = _reemplazar(headers, "ETag", etag_con_sufijo(cabeceras["etag"], sufijo))
+            headers = _reemplazar(headers, "Vary", _agregar_vary(cabeceras.get("vary")))
+            start_response(status, headers, exc_info)
+            return iterable
+        if not compresor.tipo_comprimible(cabeceras):
+            start_response(status, headers, exc_info)
+            return iterable
+
+        headers = [(n, v) for n, v in headers if n.lower() != "vary"]
+        headers.append(("Vary", _agregar_vary(cabeceras.get("vary"))))
+        if (codificacion is None or environ.get("REQUEST_METHOD") == "HEAD"
+                or estado < 200 or estado == 204):
+            start_response(status, headers, exc_info)
+            return iterable
+
+        longitud = cabeceras.get("content-length")
+        if longitud is not None:
+            if compresor.bajo_umbral(int(longitud)):
+                start_response(status, headers, exc_info)
+                return iterable
+            # Cuerpo de tamaño conocido (ya está en memoria): se comprime de una vez
+            try:
+                cuerpo = b"".join(iterable)
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+            comprimido = compresor.comprimir_cuerpo(codificacion, cuerpo, cabeceras)
+            headers = _reemplazar(headers, "Content-Length", str(len(comprimido)))
+            headers = _cabeceras_codificadas(headers, cabeceras, codificacion)
+            start_response(status, headers, exc_info)
+            return [comprimido]
+
+        headers = _cabeceras_codificadas(headers, cabeceras, codificacion)
+        start_response(status, headers, exc_info)
+        return _CuerpoComprimido(iterable, compresor.flujo(codificacion))
+
+
+def _escribir_no_soportado(datos):
+    raise RuntimeError("MiddlewareCompresionWSGI no admite el write() de start_response")
+
+
+def _reemplazar(headers, nombre, valor):
+    minusculas = nombre.lower()
+    return [(n, v) for n, v in headers if n.lower() != minusculas] + [(nombre, valor)]
+
+
+def _cabeceras_codificadas(headers, cabeceras, codificacion):
+    headers = _reemplazar(headers, "Content-Encoding", codificacion)
+    if "etag" in cabeceras:
+        headers = _reemplazar(headers, "ETag", etag_con_sufijo(cabeceras["etag"], codificacion))
+    return headers
+
+
+# --- ASGI (FastAPI) ---
+
+class MiddlewareCompresionASGI:
+    def __init__(self, app, compresor):
+        self.app = app
+        self.compresor = compresor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        compresor = self.compresor
+        codificacion = None
+        if_none_match = None
+        for nombre, valor in scope["headers"]:
+            if nombre == b"accept-encoding":
+                codificacion = negociar(valor.decode("latin-1"))
+            elif nombre == b"if-none-match":
+                if_none_match = valor.decode("latin-1")
+        if if_none_match:
+            # Se cambian las cabeceras del mismo scope (no de una copia): el enrutador
+            # escribe en él scope["route"], y el middleware de métricas, que va por
+            # fuera, lo lee después para etiquetar la ruta.
+            scope["headers"] = [
+                (n, quitar_sufijos_etag(if_none_match).encode("latin-1") if n == b"if-none-match" else v)
+                for n, v in scope["headers"]
+            ]
+
+        inicio = None  # mensaje http.response.start retenido
+        cabeceras = None
+        flujo = None
+        pasar = False  # True: el resto de mensajes se reenvían sin tocar
+
+        async def send_comprimido(mensaje):
+            nonlocal inicio, cabeceras, flujo, pasar
+            tipo = mensaje["type"]
+            if pasar:
+                await send(mensaje)
+                return
+            if tipo == "http.response.start":
+                cabeceras = {n.decode("latin-1").lower(): v.decode("latin-1") for n, v in mensaje["headers"]}
+                estado = mensaje["status"]
+                if estado == 304:
+                    # Igual que en WSGI: ETag de la versión del cliente y el Vary del 200
+                    headers = mensaje["headers"]
+                    sufijo = _sufijo_304(codificacion, if_none_match)
+                    if sufijo and "etag" in cabeceras:
+                        headers = _reemplazar_asgi(headers, b"etag", etag_con_sufijo(cabeceras["etag"], sufijo))
+                    headers = _reemplazar_asgi(headers, b"vary", _agregar_vary(cabeceras.get("vary")))
+                    mensaje = {**mensaje, "headers": headers}
+                    pasar = True
+                    await send(mensaje)
+                    return
+                if not compresor.tipo_comprimible(cabeceras):
+                    pasar = True
+                    await send(mensaje)
+                    return
+                headers = [(n, v) for n, v in mensaje["headers"] if n != b"vary"]
+                headers.append((b"vary", _agregar_vary(cabeceras.get("vary")).encode("latin-1")))
+                mensaje = {**mensaje, "headers": headers}
+                longitud = cabeceras.get("content-length")
+                if (codificacion is None or scope["method"] == "HEAD" or estado < 200 or estado == 204
+                        or (longitud is not None and compresor.bajo_umbral(int(longitud)))):
+                    pasar = True
+                    await send(mensaje)
+                    return
+                # Esperamos al primer trozo del cuerpo para saber si es completo o streaming
+                inicio = mensaje
+                return
+            if tipo != "http.response.body":
+                await send(mensaje)
+                return
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+            if flujo is None and not mas:
+                # Cuerpo completo en un solo mensaje (Response, JSONResponse...)
+                comprimido = compresor.comprimir_cuerpo(codificacion, cuerpo, cabeceras)
+                headers = _reemplazar_asgi(inicio["headers"], b"content-length", str(len(comprimido)))
+                await send({**inicio, "headers": _cabeceras_codificadas_asgi(headers, cabeceras, codificacion)})
+                await send({"type": "http.response.body", "body": comprimido})
+                return
+            if flujo is None:
+                flujo = compresor.flujo(codificacion)
+                headers = [(n, v) for n, v in inicio["headers"] if n != b"content-length"]
+                await send({**inicio, "headers": _cabeceras_codificadas_asgi(headers, cabeceras, codificacion)})
+            salida = flujo.comprimir(cuerpo)
+            if not mas:
+                salida += flujo.terminar()
+            if salida or not mas:
+                await send({"type": "http.response.body", "body": salida, "more_body": mas})
+
+        await self.app(scope, receive, send_comprimido)
+
+
+def _reemplazar_asgi(headers, nombre, valor):
+    return [(n, v) for n, v in headers if n != nombre] + [(nombre, valor.encode("latin-1"))]
+
+
+def _cabeceras_codificadas_asgi(headers, cabeceras, codificacion):
+    headers = _reemplazar_asgi(headers, b"content-encoding", codificacion)
+    if "etag" in cabeceras:
+        headers = _reemplazar_asgi(headers, b"etag", etag_con_sufijo(cabeceras["etag"], codificacion))
+    return headers
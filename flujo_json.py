@@ -0,0 +1,183 @@
+import codecs
+import json
+
+"""Lectura incremental de registros JSON para los endpoints de lote.
+
+Los endpoints de lote reciben cuerpos que pueden pesar cientos de MB, así que
+no podemos hacer request.get_json() / await request.json(): eso cargaría todo
+el cuerpo en memoria antes de procesar el primer registro. LectorRegistros
+recibe el cuerpo trozo a trozo (tal como llega del socket) y va entregando los
+registros completos en cuanto los tiene, guardando en memoria como mucho un
+registro a medio llegar.
+
+Acepta dos formatos, que detecta por el primer carácter no blanco:
+- NDJSON: un objeto JSON por línea.
+- Un array JSON: [ {...}, {...}, ... ]
+
+Lo usan tanto app_flask (con request.stream) como app_fastapi (con
+request.stream()), por eso no depende de ninguno de los dos frameworks.
+"""
+
+# Tamaño máximo de un registro individual. Si un registro no termina antes de
+# este límite lo tratamos como error, para que un cuerpo malformado no haga
+# crecer el buffer sin límite.
+MAX_BYTES_REGISTRO = 1024 * 1024
+
+_BLANCOS = " \t\r\n"
+
+
+class ErrorRegistro:
+    """Marca un registro que no se pudo parsear (en lugar de lanzar una excepción,
+    así un registro roto no interrumpe el resto del lote)."""
+
+    def __init__(self, mensaje, fatal=False, tipo="json_invalid", texto=None):
+        self.mensaje = mensaje
+        # Tipo de error con los nombres de Pydantic (json_invalid, too_long), para
+        # que las apps lo devuelvan con la misma forma que un error de validación.
+        self.tipo = tipo
+        # fatal=True indica que el resto del cuerpo ya no se puede leer
+        # (por ejemplo, un array JSON con la sintaxis rota).
+        self.fatal = fatal
+        # Texto de la línea NDJSON que no era JSON válido (None si no se conoce),
+        # para que la validación pueda dar el mismo error que con un cuerpo suelto.
+        self.texto = texto
+
+    def __repr__(self):
+        return f"ErrorRegistro({self.mensaje!r})"
+
+
+class LectorRegistros:
+    """Parser incremental: alimentar() con cada trozo de bytes y finalizar() al terminar.
+
+    Ambos métodos devuelven la lista de registros completados en esa llamada;
+    cada registro es el valor JSON decodificado o un ErrorRegistro.
+    """
+
+    def __init__(self, max_bytes_registro=MAX_BYTES_REGISTRO):
+        self.max_bytes_registro = max_bytes_registro
+        self._decodificador_utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._decodificador_json = json.JSONDecoder()
+        self._buffer = ""
+        self._formato = None  # "ndjson" o "array", se decide con el primer carácter
+        self._esperando_valor = True  # solo en modo array: valor vs. separador
+        self._descartando_linea = False  # solo en modo NDJSON: tras una línea demasiado larga
+        self._terminado = False
+
+    def alimentar(self, trozo):
+        if self._terminado:
+            return []
+        self._buffer += self._decodificador_utf8.decode(trozo)
+        return self._procesar(final=False)
+
+    def finalizar(self):
+        if self._terminado:
+            return []
+        self._buffer += self._decodificador_utf8.decode(b"", final=True)
+        registros = self._procesar(final=True)
+        if self._formato == "array" and not self._terminado:
+            registros.append(ErrorRegistro("El array JSON no está cerrado", fatal=True))
+        self._terminado = True
+        return registros
+
+    def _procesar(self, final):
+        if self._formato is None:
+            inicio = self._buffer.lstrip(_BLANCOS)
+            if not inicio:
+                self._buffer = ""
+                return []
+            if inicio[0] == "[":
+                self._formato = "array"
+                self._buffer = inicio[1:]
+            else:
+                self._formato = "ndjson"
+        if self._formato == "ndjson":
+            return self._procesar_ndjson(final)
+        return self._procesar_array(final)
+
+    def _procesar_ndjson(self, final):
+        registros = []
+        *lineas, resto = self._buffer.split("\n")
+        if final:
+            lineas.append(resto)
+            resto = ""
+        for linea in lineas:
+            if self._descartando_linea:
+                # Es el final de la línea demasiado larga que ya reportamos.
+                self._descartando_linea = False
+                continue
+            linea = linea.strip(_BLANCOS)
+            if not linea:
+                continue
+            try:
+                registros.append(json.loads(linea))
+            except json.JSONDecodeError as error:
+                registros.append(ErrorRegistro(f"JSON inválido: {error.msg}", texto=linea))
+        if len(resto) > self.max_bytes_registro:
+            if not self._descartando_linea:
+                registros.append(ErrorRegistro("El registro supera el tamaño máximo permitido",
+                                               tipo="too_long"))
+            self._descartando_linea = True
+            resto = ""
+        self._buffer = resto
+        return registros
+
+    def _procesar_array(self, final):
+        registros = []
+        buffer = self._buffer
+        posicion = 0
+        while True:
+            while posicion < len(buffer) and buffer[posicion] in _BLANCOS:
+                posicion += 1
+            if posicion >= len(buffer):
+                break
+            if self._esperando_valor:
+                if buffer[posicion] == "]":
+                    # Array vacío ("[]") o con una coma final, que toleramos.
+                    self._terminado = True
+                    break
+                try:
+                    valor, fin = self._decodificador_json.raw_decode(buffer, posicion)
+                except json.JSONDecodeError as error:
+                    if final or len(buffer) - posicion > self.max_bytes_registro:
+                        registros.append(ErrorRegistro(f"JSON inválido: {error.msg}", fatal=True))
+                        self._terminado = True
+                    # Si no, el valor probablemente está incompleto: esperamos más datos.
+                    break
+                if fin == len(buffer) and not final:
+                    # Un número al final del buffer podría continuar en el siguiente trozo.
+                    break
+                registros.append(valor)
+                posicion = fin
+                self._esperando_valor = False
+            else:
+                caracter = buffer[posicion]
+                posicion += 1
+                if caracter == ",":
+                    self._esperando_valor = True
+                elif caracter == "]":
+                    self._terminado = True
+                    break
+                else:
+                    registros.append(ErrorRegistro(f"Se esperaba ',' o ']' y llegó {caracter!r}", fatal=True))
+                    self._terminado = True
+                    break
+        self._buffer = "" if self._terminado else buffer[posicion:]
+        return registros
+
+
+def iterar_registros(trozos, max_bytes_registro=MAX_BYTES_REGISTRO):
+    """Generador síncrono: recibe un iterable de bytes y produce registros."""
+    lector = LectorRegistros(max_bytes_registro)
+    for trozo in trozos:
+        yield from lector.alimentar(trozo)
+    yield from lector.finalizar()
+
+
+async def iterar_registros_async(trozos, max_bytes_registro=MAX_BYTES_REGISTRO):
+    """Igual que iterar_registros, pero sobre un iterable asíncrono de bytes."""
+    lector = LectorRegistros(max_bytes_registro)
+    async for trozo in trozos:
+        for registro in lector.alimentar(trozo):
+            yield registro
+    for registro in lector.finalizar():
+        yield registro
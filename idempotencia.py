@@ -0,0 +1,465 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import serializacion
+
+"""Deduplicación de POST con la cabecera Idempotency-Key.
+
+Los productores reintentan POST /api/crear_saludo y /api/crear_saludo_fastapi
+cuando vence su timeout, y sin esto cada reintento vuelve a procesar la
+solicitud completa. Si el cliente envía "Idempotency-Key: <valor único>":
+
+- La primera solicitud con esa clave "reclama" la clave, se procesa y su
+  respuesta (estado, cabeceras y bytes del cuerpo) se guarda durante 'ttl'
+  segundos.
+- Una repetición dentro del TTL recibe la respuesta guardada sin llegar al
+  handler, con la cabecera Idempotent-Replayed: true.
+- Un duplicado que llega mientras la primera sigue en curso espera (hasta
+  'espera_max' segundos) a que termine y recibe su resultado, en lugar de
+  ejecutarse otra vez. Si se agota la espera: 409 con Retry-After.
+- La misma clave con otro cuerpo es un error del cliente: 422.
+- Para calcular la huella hay que tener el cuerpo entero en memoria, así que
+  con Idempotency-Key el cuerpo no puede pasar de 'max_bytes_cuerpo'
+  (IDEMPOTENCIA_MAX_BYTES, 1 MiB por defecto): si lo supera se responde 413 y
+  la clave no se reclama ni se guarda nada.
+
+Solo se guardan respuestas definitivas. Los 5xx, 408, 409 y 429 liberan la
+clave para que el reintento se procese de verdad. Si el handler lanza una
+excepción, también se libera. Si un worker muere con una clave en curso, la
+reclamación caduca tras 'max_en_curso' segundos y otra solicitud la retoma.
+
+La clave se guarda junto con la ruta y el cliente (X-API-Key), así dos clientes
+no chocan aunque elijan el mismo valor. Hay dos almacenes, los dos acotados:
+- AlmacenMemoria: LRU en memoria, por proceso (lo normal con un solo worker).
+  Al desalojar se salta las claves en curso: si se olvidara una, su reintento
+  ejecutaría el handler otra vez. Si todas están en curso no se admite una
+  clave nueva (503 con Retry-After).
+- AlmacenSQLite: un archivo SQLite local que comparten todos los workers de
+  servidor.py (IDEMPOTENCIA_DB=idempotencia.db). La purga tampoco borra las
+  claves en curso.
+
+Los duplicados en curso se esperan consultando el almacén cada pocos
+milisegundos (con espera creciente), lo que sirve igual para hilos, para
+asyncio y entre procesos.
+
+asyncio y sqlite3 se importan solo donde se usan (los métodos *_async y
+AlmacenSQLite), así importar este módulo no los carga en un worker Flask con
+el almacén en memoria.
+"""
+
+CABECERA = "Idempotency-Key"
+CABECERA_REPETIDA = "Idempotent-Replayed"
+MAX_LONGITUD_CLAVE = 255
+MAX_BYTES_CUERPO = int(os.environ.get("IDEMPOTENCIA_MAX_BYTES", 1024 * 1024))
+DETALLE_DEMASIADO_GRANDE = f"El cuerpo de una solicitud con {CABECERA} no puede superar {{}} bytes"
+DETALLE_LLENO = f"Demasiadas solicitudes con {CABECERA} en curso"
+# No se guardan en la respuesta reproducida: el servidor las vuelve a generar
+_CABECERAS_NO_GUARDADAS = {"content-length", "date", "server", "connection", "transfer-encoding"}
+
+# Resultados de reclamar()
+NUEVA = "nueva"
+EN_CURSO = "en_curso"
+COMPLETADA = "completada"
+CONFLICTO = "conflicto"
+LLENO = "lleno"  # el almacén solo tiene claves en curso y no cabe otra
+
+
+class RespuestaGuardada:
+    __slots__ = ("estado", "cabeceras", "cuerpo")
+
+    def __init__(self, estado, cabeceras, cuerpo):
+        self.estado = estado
+        self.cabeceras = cabeceras  # [(nombre, valor)] como str
+        self.cuerpo = cuerpo
+
+
+def huella(cuerpo):
+    """Resumen del cuerpo: detecta una clave reutilizada con otra solicitud."""
+    return hashlib.blake2b(cuerpo, digest_size=16).hexdigest()
+
+
+def clave_completa(ruta, cliente, clave):
+    return f"{ruta}|{cliente}|{clave}"
+
+
+def es_definitiva(estado):
+    """Las respuestas que tiene sentido reproducir; las demás invitan a reintentar."""
+    return estado < 500 and estado not in (408, 409, 429)
+
+
+def cabeceras_guardables(cabeceras):
+    return [(n, v) for n, v in cabeceras if n.lower() not in _CABECERAS_NO_GUARDADAS]
+
+
+class AlmacenMemoria:
+    """LRU en memoria con TTL, de como mucho 'max_entradas' claves."""
+
+    bloqueante = False
+
+    def __init__(self, ttl=86400.0, max_entradas=10_000, max_en_curso=60.0):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_en_curso = max_en_curso
+        self._entradas = OrderedDict()  # clave -> [huella, RespuestaGuardada | None, expira]
+        self._lock = threading.Lock()
+
+    def reclamar(self, clave, huella_cuerpo):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[2] > ahora:
+                self._entradas.move_to_end(clave)
+                if entrada[0] != huella_cuerpo:
+                    return CONFLICTO, None
+                if entrada[1] is None:
+                    return EN_CURSO, None
+                return COMPLETADA, entrada[1]
+            if entrada is None and len(self._entradas) >= self.max_entradas and not self._desalojar(ahora):
+                return LLENO, None
+            self._entradas[clave] = [huella_cuerpo, None, ahora + self.max_en_curso]
+            self._entradas.move_to_end(clave)
+            return NUEVA, None
+
+    def _desalojar(self, ahora):
+        """Quita la entrada menos usada que no esté en curso (o ya caducada)."""
+        for clave, entrada in self._entradas.items():
+            if entrada[1] is not None or entrada[2] <= ahora:
+                del self._entradas[clave]
+                return True
+        return False
+
+    def completar(self, clave, respuesta):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                entrada[1] = respuesta
+                entrada[2] = time.monotonic() + self.ttl
+
+    def liberar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {"entradas": len(self._entradas)}
+
+
+class AlmacenSQLite:
+    """Tabla SQLite local compartida entre procesos. Las reclamaciones usan
+    BEGIN IMMEDIATE, así dos workers no pueden reclamar la misma clave a la vez."""
+
+    bloqueante = True
+
+    def __init__(self, ruta, ttl=86400.0, max_entradas=100_000, max_en_curso=60.0, purgar_cada=1000):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_en_curso = max_en_curso
+        self.purgar_cada = purgar_cada
+        self._local = threading.local()
+        self._escrituras = 0
+        conexion = self._conexion()
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS idempotencia (
+                clave TEXT PRIMARY KEY,
+                huella TEXT NOT NULL,
+                estado INTEGER,  -- NULL mientras la solicitud está en curso
+                cabeceras TEXT,
+                cuerpo BLOB,
+                expira REAL NOT NULL
+            )""")
+        conexion.execute("CREATE INDEX IF NOT EXISTS idempotencia_expira ON idempotencia (expira)")
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (no deben cruzar un fork)
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None or self._local.pid != os.getpid():
+            import sqlite3
+
+            conexion = sqlite3.connect(self.ruta, timeout=10.0, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def reclamar(self, clave, huella_cuerpo):
+        # Hora de pared (no monotonic): la comparten varios procesos
+        ahora = time.time()
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conexion.execute(
+                "SELECT huella, estado, cabeceras, cuerpo FROM idempotencia WHERE clave = ? AND expira > ?",
+                (clave, ahora)).fetchone()
+            if fila is None:
+                conexion.execute(
+                    "INSERT OR REPLACE INTO idempotencia (clave, huella, estado, cabeceras, cuerpo, expira) "
+                    "VALUES (?, ?, NULL, NULL, NULL, ?)", (clave, huella_cuerpo, ahora + self.max_en_curso))
+                resultado = (NUEVA, None)
+            elif fila[0] != huella_cuerpo:
+                resultado = (CONFLICTO, None)
+            elif fila[1] is None:
+                resultado = (EN_CURSO, None)
+            else:
+                resultado = (COMPLETADA, RespuestaGuardada(fila[1], [tuple(c) for c in json.loads(fila[2])],
+                                                           fila[3]))
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        return resultado
+
+    def completar(self, clave, respuesta):
+        conexion = self._conexion()
+        conexion.execute(
+            "UPDATE idempotencia SET estado = ?, cabeceras = ?, cuerpo = ?, expira = ? WHERE clave = ?",
+            (respuesta.estado, json.dumps(respuesta.cabeceras), respuesta.cuerpo, time.time() + self.ttl, clave))
+        self._escrituras += 1
+        if self._escrituras % self.purgar_cada == 0:
+            self.purgar()
+
+    def liberar(self, clave):
+        self._conexion().execute("DELETE FROM idempotencia WHERE clave = ?", (clave,))
+
+    def purgar(self):
+        """Borra las claves caducadas y, si aún sobran, las completadas que caducan
+        antes. Las que siguen en curso no se tocan."""
+        conexion = self._conexion()
+        conexion.execute("DELETE FROM idempotencia WHERE expira <= ?", (time.time(),))
+        conexion.execute(
+            "DELETE FROM idempotencia WHERE clave IN (SELECT clave FROM idempotencia "
+            "WHERE estado IS NOT NULL ORDER BY expira DESC LIMIT -1 OFFSET ?)", (self.max_entradas,))
+
+    def estadisticas(self):
+        return {"entradas": self._conexion().execute("SELECT COUNT(*) FROM idempotencia").fetchone()[0]}
+
+
+def crear_almacen():
+    """SQLite si IDEMPOTENCIA_DB está definida (compartido entre workers), si no memoria.
+    IDEMPOTENCIA_TTL fija los segundos que se recuerda cada clave."""
+    ttl = float(os.environ.get("IDEMPOTENCIA_TTL", "86400"))
+    ruta = os.environ.get("IDEMPOTENCIA_DB")
+    if ruta:
+        return AlmacenSQLite(ruta, ttl=ttl)
+    return AlmacenMemoria(ttl=ttl)
+
+
+class Deduplicador:
+    """Reclama claves en un almacén y espera a los duplicados en curso.
+    Tiene versión síncrona (Flask) y asíncrona (FastAPI), como ControlAdmision."""
+
+    # Claves de estadisticas() que solo crecen (se exportan como counter)
+    CONTADORES = ("nuevas", "repetidas", "esperadas", "conflictos", "esperas_agotadas", "almacen_lleno")
+
+    def __init__(self, almacen, espera_max=10.0, max_bytes_cuerpo=MAX_BYTES_CUERPO):
+        self.almacen = almacen
+        self.espera_max = espera_max
+        self.max_bytes_cuerpo = max_bytes_cuerpo
+        # Protege los contadores: Flask los actualiza desde varios hilos a la vez
+        self._lock = threading.Lock()
+        self.nuevas = 0
+        self.repetidas = 0
+        self.esperadas = 0
+        self.conflictos = 0
+        self.esperas_agotadas = 0
+        self.almacen_lleno = 0
+
+    def _contar(self, resultado, espero):
+        with self._lock:
+            if resultado == NUEVA:
+                self.nuevas += 1
+            elif resultado == COMPLETADA:
+                self.repetidas += 1
+                if espero:
+                    self.esperadas += 1
+            elif resultado == CONFLICTO:
+                self.conflictos += 1
+            elif resultado == LLENO:
+                self.almacen_lleno += 1
+            else:
+                self.esperas_agotadas += 1
+
+    def reclamar(self, clave, huella_cuerpo):
+        """Devuelve (resultado, RespuestaGuardada | None). EN_CURSO solo si se agotó la espera."""
+        limite = time.monotonic() + self.espera_max
+        pausa = 0.005
+        espero = False
+        while True:
+            resultado, guardada = self.almacen.reclamar(clave, huella_cuerpo)
+            if resultado != EN_CURSO or time.monotonic() >= limite:
+                self._contar(resultado, espero)
+                return resultado, guardada
+            espero = True
+            time.sleep(pausa)
+            pausa = min(pausa * 2, 0.1)
+
+    async def reclamar_async(self, clave, huella_cuerpo):
+        import asyncio
+
+        limite = time.monotonic() + self.espera_max
+        pausa = 0.005
+        espero = False
+        while True:
+            if self.almacen.bloqueante:
+                resultado, guardada = await asyncio.to_thread(self.almacen.reclamar, clave, huella_cuerpo)
+            else:
+                resultado, guardada = self.almacen.reclamar(clave, huella_cuerpo)
+            if resultado != EN_CURSO or time.monotonic() >= limite:
+                self._contar(resultado, espero)
+                return resultado, guardada
+            espero = True
+            await asyncio.sleep(pausa)
+            pausa = min(pausa * 2, 0.1)
+
+    def terminar(self, clave, estado, cabeceras, cuerpo):
+        """Guarda la respuesta si es definitiva; si no, libera la clave."""
+        if es_definitiva(estado):
+            self.almacen.completar(clave, RespuestaGuardada(estado, cabeceras_guardables(cabeceras), cuerpo))
+        else:
+            self.almacen.liberar(clave)
+
+    async def terminar_async(self, clave, estado, cabeceras, cuerpo):
+        import asyncio
+
+        if self.almacen.bloqueante:
+            await asyncio.to_thread(self.terminar, clave, estado, cabeceras, cuerpo)
+        else:
+            self.terminar(clave, estado, cabeceras, cuerpo)
+
+    async def liberar_async(self, clave):
+        import asyncio
+
+        if self.almacen.bloqueante:
+            await asyncio.to_thread(self.almacen.liberar, clave)
+        else:
+            self.almacen.liberar(clave)
+
+    def estadisticas(self):
+        with self._lock:
+            contadores = {
+                "nuevas": self.nuevas,
+                "repetidas": self.repetidas,
+                "esperadas": self.esperadas,
+                "conflictos": self.conflictos,
+                "esperas_agotadas": self.esperas_agotadas,
+                "almacen_lleno": self.almacen_lleno,
+            }
+        return {**contadores, **self.almacen.estadisticas()}
+
+
+# --- ASGI (FastAPI) ---
+
+class MiddlewareIdempotenciaASGI:
+    """Aplica Idempotency-Key a los POST de las rutas indicadas (paths exactos).
+
+    Lee el cuerpo completo para calcular su huella y se lo vuelve a entregar a
+    la app; está pensado para rutas con cuerpos pequeños como crear_saludo. Un
+    cuerpo de más de deduplicador.max_bytes_cuerpo recibe un 413 (mirando
+    Content-Length antes de leer, y contando los bytes si no lo hay).
+    """
+
+    def __init__(self, app, deduplicador, rutas):
+        self.app = app
+        self.deduplicador = deduplicador
+        self.rutas = frozenset(rutas)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.rutas:
+            await self.app(scope, receive, send)
+            return
+        clave = cliente = None
+        for nombre, valor in scope["headers"]:
+            if nombre == b"idempotency-key":
+                clave = valor.decode("latin-1")
+            elif nombre == b"x-api-key":
+                cliente = valor.decode("latin-1")
+        if clave is None:
+            await self.app(scope, receive, send)
+            return
+        if not clave or len(clave) > MAX_LONGITUD_CLAVE:
+            await _enviar_json(send, 400, {"detail": f"{CABECERA} debe tener entre 1 y {MAX_LONGITUD_CLAVE} caracteres"})
+            return
+
+        deduplicador = self.deduplicador
+        maximo = deduplicador.max_bytes_cuerpo
+        demasiado_grande = {"detail": DETALLE_DEMASIADO_GRANDE.format(maximo)}
+        for nombre, valor in scope["headers"]:
+            if nombre == b"content-length" and valor.isdigit() and int(valor) > maximo:
+                await _enviar_json(send, 413, demasiado_grande)
+                return
+        trozos = []
+        leidos = 0
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                return
+            trozo = mensaje.get("body", b"")
+            leidos += len(trozo)
+            if leidos > maximo:
+                await _enviar_json(send, 413, demasiado_grande)
+                return
+            trozos.append(trozo)
+            if not mensaje.get("more_body", False):
+                break
+        cuerpo = b"".join(trozos)
+
+        clave = clave_completa(scope["path"], cliente or "", clave)
+        resultado, guardada = await deduplicador.reclamar_async(clave, huella(cuerpo))
+        if resultado == COMPLETADA:
+            cabeceras = [(n.encode("latin-1"), v.encode("latin-1")) for n, v in guardada.cabeceras]
+            cabeceras.append((CABECERA_REPETIDA.lower().encode("latin-1"), b"true"))
+            await _enviar(send, guardada.estado, cabeceras, guardada.cuerpo)
+            return
+        if resultado == CONFLICTO:
+            await _enviar_json(send, 422, {"detail": f"{CABECERA} ya usada con otra solicitud"})
+            return
+        if resultado == EN_CURSO:
+            await _enviar_json(send, 409, {"detail": f"La solicitud con esta {CABECERA} sigue en curso"},
+                               [(b"retry-after", b"1")])
+            return
+        if resultado == LLENO:
+            await _enviar_json(send, 503, {"detail": DETALLE_LLENO}, [(b"retry-after", b"1")])
+            return
+
+        entregado = False
+
+        async def receive_repetido():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        respuesta = {"estado": 500, "cabeceras": [], "cuerpo": []}
+
+        async def send_capturado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta["estado"] = mensaje["status"]
+                respuesta["cabeceras"] = [(n.decode("latin-1"), v.decode("latin-1")) for n, v in mensaje["headers"]]
+            elif mensaje["type"] == "http.response.body":
+                respuesta["cuerpo"].append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive_repetido, send_capturado)
+        except BaseException:
+            await deduplicador.liberar_async(clave)
+            raise
+        await deduplicador.terminar_async(clave, respuesta["estado"], respuesta["cabeceras"],
+                                          b"".join(respuesta["cuerpo"]))
+
+
+async def _enviar(send, estado, cabeceras, cuerpo):
+    await send({"type": "http.response.start", "status": estado,
+                "headers": [*cabeceras, (b"content-length", str(len(cuerpo)).encode("latin-1"))]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def _enviar_json(send, estado, contenido, cabeceras=()):
+    cuerpo = serializacion.dumps(contenido)
+    await _enviar(send, estado, [(b"content-type", b"application/json"), *cabeceras], cuerpo)
@@ -0,0 +1,507 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # fcntl solo existe en Unix
+    fcntl = None
+
+"""Métricas por ruta para app_flask y app_fastapi, en formato de texto de Prometheus.
+
+Para cada ruta (la plantilla, por ejemplo /items/{item_id}, no el path real,
+para no crear una serie por cada id) registramos:
+- solicitudes por código de estado,
+- histograma de latencia con cubetas fijas,
+- histogramas del tamaño del cuerpo de la solicitud y de la respuesta,
+y para toda la app, cuántas solicitudes hay en vuelo.
+
+El camino de registro es corto a propósito: las series se crean una vez por
+ruta y después cada solicitud solo incrementa enteros de listas ya existentes
+dentro de un único lock (bisect sobre tuplas fijas para elegir la cubeta).
+
+Varios procesos: con Gunicorn o con servidor.py cada worker tiene su propia
+memoria, y Prometheus solo ve al worker que atiende el scrape. Si se define la
+variable de entorno METRICAS_DIR, cada proceso vuelca sus contadores a un
+archivo propio (metricas_<app>_<pid>_<arranque>.json) cada segundo y al salir,
+y /metrics suma los archivos de todos los procesos. El nombre lleva también el
+momento en que arrancó el proceso: si el sistema reutiliza el pid de un worker
+muerto, el nuevo proceso no pisa el archivo del anterior.
+
+Los contadores de procesos que ya terminaron se siguen sumando (un contador no
+debe retroceder); los gauges (las solicitudes en vuelo, las plazas ocupadas de
+un control de admisión...) son valores del momento y solo se suman de procesos
+vivos. Para que el directorio no crezca con cada reinicio, el primer /metrics
+que encuentra el archivo de un proceso muerto suma sus contadores al archivo
+metricas_<app>_retirados.json y lo borra (con un flock, para que dos workers no
+lo sumen dos veces).
+"""
+
+CUBETAS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CUBETAS_BYTES = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+RUTA_DESCONOCIDA = "sin_ruta"
+CLAVE_RUTA_WSGI = "metricas.ruta"
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Serie:
+    """Contadores de una combinación (método, ruta)."""
+
+    __slots__ = ("latencia", "suma_latencia", "bytes_entrada", "suma_bytes_entrada",
+                 "bytes_salida", "suma_bytes_salida", "estados")
+
+    def __init__(self):
+        self.latencia = [0] * (len(CUBETAS_LATENCIA) + 1)
+        self.suma_latencia = 0.0
+        self.bytes_entrada = [0] * (len(CUBETAS_BYTES) + 1)
+        self.suma_bytes_entrada = 0
+        self.bytes_salida = [0] * (len(CUBETAS_BYTES) + 1)
+        self.suma_bytes_salida = 0
+        self.estados = {}
+
+    def a_dict(self):
+        return {nombre: getattr(self, nombre) for nombre in self.__slots__}
+
+
+# Registros con METRICAS_DIR de este proceso (ver volcar_todos)
+_registros_multiproceso = []
+
+
+def volcar_todos():
+    """Vuelca ya la instantánea de cada registro multiproceso de este proceso.
+
+    Los registros se vuelcan solos al salir con atexit, pero un proceso que
+    termina con os._exit() (los workers de servidor.py) no ejecuta los atexit:
+    sin esta llamada perdería lo contado desde el último volcado periódico.
+    """
+    for registro in list(_registros_multiproceso):
+        try:
+            registro.volcar()
+        except OSError:
+            pass
+
+
+class RegistroMetricas:
+    def __init__(self, app, directorio=None, intervalo_volcado=1.0):
+        self.app = app
+        self.directorio = directorio if directorio is not None else os.environ.get("METRICAS_DIR")
+        self.intervalo_volcado = intervalo_volcado
+        self._colectores = []
+        self._lock = threading.Lock()
+        self._reiniciar()
+        if self.directorio:
+            os.makedirs(self.directorio, exist_ok=True)
+            atexit.register(self.volcar)
+            _registros_multiproceso.append(self)
+            # Tras un fork (servidor.py precarga la app y luego crea los workers)
+            # cada hijo empieza de cero con su propio archivo y su propio hilo.
+            os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._arranque = time.time_ns()
+        self._series = {}  # {ruta: {metodo: _Serie}}
+        self.en_vuelo = 0
+        self._hilo_volcado = None
+
+    def registrar_colector(self, colector):
+        """Añade una función que devuelve muestras extra para /metrics.
+
+        Cada muestra es (nombre, tipo, ayuda, etiquetas, valor); por ejemplo las
+        estadísticas de una caché. El tipo es "counter" para valores que solo
+        crecen (su nombre debe acabar en _total) y "gauge" para valores del
+        momento. En modo multiproceso se suman entre procesos; los gauges de
+        procesos que ya terminaron se descartan.
+        """
+        self._colectores.append(colector)
+
+    # --- Camino de cada solicitud ---
+
+    def entrar(self):
+        with self._lock:
+            self.en_vuelo += 1
+        if self.directorio and self._hilo_volcado is None:
+            self._arrancar_volcado()
+
+    def salir(self, metodo, ruta, estado, duracion, bytes_entrada, bytes_salida):
+        por_metodo = self._series.get(ruta)
+        serie = por_metodo.get(metodo) if por_metodo is not None else None
+        if serie is None:
+            serie = self._crear_serie(metodo, ruta)
+        i_latencia = bisect.bisect_left(CUBETAS_LATENCIA, duracion)
+        i_entrada = bisect.bisect_left(CUBETAS_BYTES, bytes_entrada)
+        i_salida = bisect.bisect_left(CUBETAS_BYTES, bytes_salida)
+        with self._lock:
+            self.en_vuelo -= 1
+            serie.latencia[i_latencia] += 1
+            serie.suma_latencia += duracion
+            serie.bytes_entrada[i_entrada] += 1
+            serie.suma_bytes_entrada += bytes_entrada
+            serie.bytes_salida[i_salida] += 1
+            serie.suma_bytes_salida += bytes_salida
+            serie.estados[estado] = serie.estados.get(estado, 0) + 1
+
+    def _crear_serie(self, metodo, ruta):
+        with self._lock:
+            return self._series.setdefault(ruta, {}).setdefault(metodo, _Serie())
+
+    # --- Multiproceso ---
+
+    def _archivo_propio(self):
+        return os.path.join(self.directorio, f"metricas_{self.app}_{os.getpid()}_{self._arranque}.json")
+
+    def _archivo_retirados(self):
+        return os.path.join(self.directorio, f"metricas_{self.app}_retirados.json")
+
+    def _instantanea(self):
+        with self._lock:
+            series = [
+                {"metodo": metodo, "ruta": ruta, **serie.a_dict()}
+                for ruta, por_metodo in self._series.items()
+                for metodo, serie in por_metodo.items()
+            ]
+            en_vuelo = self.en_vuelo
+        for serie in series:
+            serie["estados"] = {str(k): v for k, v in serie["estados"].items()}
+        muestras = [list(muestra) for colector in self._colectores for muestra in colector()]
+        return {"pid": os.getpid(), "en_vuelo": en_vuelo, "series": series, "muestras": muestras}
+
+    def volcar(self):
+        """Escribe la instantánea de este proceso (de forma atómica: tmp + rename)."""
+        if not self.directorio:
+            return
+        destino = self._archivo_propio()
+        temporal = destino + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(self._instantanea(), archivo)
+        os.replace(temporal, destino)
+
+    def _arrancar_volcado(self):
+        with self._lock:
+            if self._hilo_volcado is not None:
+                return
+            self._hilo_volcado = threading.Thread(target=self._bucle_volcado, daemon=True,
+                                                  name="metricas-volcado")
+        self._hilo_volcado.start()
+
+    def _bucle_volcado(self):
+        while True:
+            time.sleep(self.intervalo_volcado)
+            try:
+                self.volcar()
+            except OSError:
+                pass
+
+    def _instantaneas(self):
+        """Instantánea propia (en vivo), las de los demás procesos vivos (desde
+        disco) y la suma de los procesos retirados."""
+        instantaneas = [self._instantanea()]
+        if not self.directorio:
+            return instantaneas
+        propio = self._archivo_propio()
+        retirados = self._archivo_retirados()
+        muertos = []
+        for ruta in glob.glob(os.path.join(self.directorio, f"metricas_{self.app}_*.json")):
+            if ruta == propio or ruta == retirados:
+                continue
+            instantanea = _leer_instantanea(ruta)
+            if instantanea is None:
+                continue
+            if _proceso_vivo(instantanea["pid"]):
+                instantaneas.append(instantanea)
+            else:
+                muertos.append((ruta, instantanea))
+        if muertos:
+            if fcntl is None:
+                # Sin flock no se puede retirar sin riesgo de sumar dos veces
+                instantaneas.extend(_solo_contadores(i) for _, i in muertos)
+            else:
+                self._retirar(muertos)
+        instantanea = _leer_instantanea(retirados)
+        if instantanea is not None:
+            instantaneas.append(instantanea)
+        return instantaneas
+
+    def _retirar(self, muertos):
+        """Suma los contadores de procesos muertos al archivo de retirados y borra
+        sus archivos. Lo hace un solo proceso a la vez (flock)."""
+        with open(os.path.join(self.directorio, f"metricas_{self.app}.lock"), "a") as cerrojo:
+            fcntl.flock(cerrojo, fcntl.LOCK_EX)
+            # Otro worker pudo retirarlos mientras esperábamos el flock
+            muertos = [(ruta, i) for ruta, i in muertos if os.path.exists(ruta)]
+            if not muertos:
+                return
+            retirados = self._archivo_retirados()
+            anteriores = _leer_instantanea(retirados)
+            suma = _combinar(([anteriores] if anteriores else []) + [_solo_contadores(i) for _, i in muertos])
+            temporal = retirados + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump(suma, archivo)
+            os.replace(temporal, retirados)
+            for ruta, _ in muertos:
+                os.remove(ruta)
+
+    # --- Exportación ---
+
+    def exportar(self):
+        """Texto de Prometheus con las métricas agregadas de todos los procesos."""
+        total = _combinar(self._instantaneas())
+        series = {(s["metodo"], s["ruta"]): s for s in total["series"]}
+        en_vuelo = total["en_vuelo"]
+        muestras = {(nombre, tuple(sorted(etiquetas.items()))): (nombre, tipo, ayuda, valor)
+                    for nombre, tipo, ayuda, etiquetas, valor in total["muestras"]}
+
+        app = _etiqueta("app", self.app)
+        lineas = [
+            "# HELP http_solicitudes_en_vuelo Solicitudes que se están atendiendo ahora.",
+            "# TYPE http_solicitudes_en_vuelo gauge",
+            f"http_solicitudes_en_vuelo{{{app}}} {en_vuelo}",
+            "# HELP http_solicitudes_total Solicitudes atendidas por ruta y código de estado.",
+            "# TYPE http_solicitudes_total counter",
+        ]
+        for (metodo, ruta), s in sorted(series.items()):
+            base = f"{app},{_etiqueta('metodo', metodo)},{_etiqueta('ruta', ruta)}"
+            for estado, n in sorted(s["estados"].items()):
+                lineas.append(f"http_solicitudes_total{{{base},{_etiqueta('estado', estado)}}} {n}")
+        for nombre, ayuda, cubetas, campo, campo_suma in (
+            ("http_duracion_segundos", "Latencia de las solicitudes.", CUBETAS_LATENCIA,
+             "latencia", "suma_latencia"),
+            ("http_bytes_solicitud", "Tamaño del cuerpo de la solicitud.", CUBETAS_BYTES,
+             "bytes_entrada", "suma_bytes_entrada"),
+            ("http_bytes_respuesta", "Tamaño del cuerpo de la respuesta.", CUBETAS_BYTES,
+             "bytes_salida", "suma_bytes_salida"),
+        ):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} histogram")
+            for (metodo, ruta), s in sorted(series.items()):
+                base = f"{app},{_etiqueta('metodo', metodo)},{_etiqueta('ruta', ruta)}"
+                acumulado = 0
+                for limite, n in zip(cubetas, s[campo]):
+                    acumulado += n
+                    lineas.append(f'{nombre}_bucket{{{base},le="{limite}"}} {acumulado}')
+                acumulado += s[campo][-1]
+                lineas.append(f'{nombre}_bucket{{{base},le="+Inf"}} {acumulado}')
+                lineas.append(f"{nombre}_sum{{{base}}} {s[campo_suma]}")
+                lineas.append(f"{nombre}_count{{{base}}} {acumulado}")
+
+        anunciadas = set()
+        for (nombre, etiquetas), (_, tipo, ayuda, valor) in sorted(muestras.items()):
+            if nombre not in anunciadas:
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                anunciadas.add(nombre)
+            todas = ",".join([app] + [_etiqueta(k, v) for k, v in etiquetas])
+            lineas.append(f"{nombre}{{{todas}}} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def _combinar(instantaneas):
+    """Suma varias instantáneas en una (con el mismo formato, sin pid)."""
+    series = {}
+    en_vuelo = 0
+    muestras = {}
+    for instantanea in instantaneas:
+        en_vuelo += instantanea["en_vuelo"]
+        for s in instantanea["series"]:
+            acumulada = series.get((s["metodo"], s["ruta"]))
+            if acumulada is None:
+                series[(s["metodo"], s["ruta"])] = {
+                    k: (list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v)
+                    for k, v in s.items()
+                }
+                continue
+            for clave, valor in s.items():
+                if isinstance(valor, list):
+                    acumulada[clave] = [a + b for a, b in zip(acumulada[clave], valor)]
+                elif isinstance(valor, dict):
+                    for estado, n in valor.items():
+                        acumulada[clave][estado] = acumulada[clave].get(estado, 0) + n
+                elif clave not in ("metodo", "ruta"):
+                    acumulada[clave] += valor
+        for nombre, tipo, ayuda, etiquetas, valor in instantanea["muestras"]:
+            clave = (nombre, tuple(sorted(etiquetas.items())))
+            if clave in muestras:
+                muestras[clave][4] += valor
+            else:
+                muestras[clave] = [nombre, tipo, ayuda, dict(etiquetas), valor]
+    return {"pid": None, "en_vuelo": en_vuelo, "series": list(series.values()), "muestras": list(muestras.values())}
+
+
+def _solo_contadores(instantanea):
+    """Lo que cuenta de un proceso muerto: sus contadores, no sus gauges."""
+    return {**instantanea, "en_vuelo": 0,
+            "muestras": [m for m in instantanea["muestras"] if m[1] != "gauge"]}
+
+
+def _leer_instantanea(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _etiqueta(nombre, valor):
+    valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{nombre}="{valor}"'
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def muestras_de(prefijo, ayuda, estadisticas, contadores=(), **etiquetas):
+    """Convierte un dict de estadísticas (por ejemplo CacheRespuestas.estadisticas())
+    en muestras de colector: una métrica por entrada.
+
+    Las claves de 'contadores' (normalmente el CONTADORES de la clase que da las
+    estadísticas) solo crecen: se exportan como counter '<prefijo>_<clave>_total',
+    así rate() e increase() de Prometheus funcionan. El resto son gauges
+    '<prefijo>_<clave>'."""
+    return [(f"{prefijo}_{clave}_total", "counter", ayuda, etiquetas, valor) if clave in contadores
+            else (f"{prefijo}_{clave}", "gauge", ayuda, etiquetas, valor)
+            for clave, valor in estadisticas.items()]
+
+
+# --- WSGI (Flask) ---
+
+class _EntradaContada:
+    """Envuelve wsgi.input para contar los bytes del cuerpo que la app lee de verdad
+    (sirve también para cuerpos sin Content-Length, como los de los lotes)."""
+
+    def __init__(self, entrada):
+        self._entrada = entrada
+        self.leidos = 0
+
+    def read(self, *args):
+        datos = self._entrada.read(*args)
+        self.leidos += len(datos)
+        return datos
+
+    def readline(self, *args):
+        datos = self._entrada.readline(*args)
+        self.leidos += len(datos)
+        return datos
+
+    def readlines(self, *args):
+        lineas = self._entrada.readlines(*args)
+        self.leidos += sum(len(linea) for linea in lineas)
+        return lineas
+
+    def __iter__(self):
+        for linea in self._entrada:
+            self.leidos += len(linea)
+            yield linea
+
+
+class _CuerpoMedido:
+    """Iterable de respuesta WSGI que cuenta los bytes enviados y registra la
+    solicitud al terminar de enviar (o al cerrarse, si se corta antes)."""
+
+    def __init__(self, iterable, al_terminar):
+        self._iterable = iterable
+        self._al_terminar = al_terminar
+        self.enviados = 0
+
+    def __iter__(self):
+        for trozo in self._iterable:
+            self.enviados += len(trozo)
+            yield trozo
+        self._terminar()
+
+    def _terminar(self):
+        if self._al_terminar is not None:
+            al_terminar, self._al_terminar = self._al_terminar, None
+            al_terminar(self.enviados)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            self._terminar()
+
+
+class MiddlewareMetricasWSGI:
+    """Envuelve una app WSGI. La ruta se lee de environ[CLAVE_RUTA_WSGI], que la
+    app debe rellenar con la plantilla de la ruta (app_flask lo hace en un
+    before_request con request.url_rule.rule)."""
+
+    def __init__(self, app, registro):
+        self.app = app
+        self.registro = registro
+
+    def __call__(self, environ, start_response):
+        registro = self.registro
+        inicio = time.perf_counter()
+        registro.entrar()
+        entrada = _EntradaContada(environ["wsgi.input"])
+        environ["wsgi.input"] = entrada
+        estado = [500]
+
+        def start_response_medido(status, headers, exc_info=None):
+            estado[0] = int(status[:3])
+            return start_response(status, headers, exc_info)
+
+        def al_terminar(enviados):
+            registro.salir(environ.get("REQUEST_METHOD", "GET"),
+                           environ.get(CLAVE_RUTA_WSGI, RUTA_DESCONOCIDA), estado[0],
+                           time.perf_counter() - inicio, entrada.leidos, enviados)
+
+        try:
+            iterable = self.app(environ, start_response_medido)
+        except BaseException:
+            al_terminar(0)
+            raise
+        return _CuerpoMedido(iterable, al_terminar)
+
+
+# --- ASGI (FastAPI) ---
+
+class MiddlewareMetricasASGI:
+    """Middleware ASGI. La ruta se toma de scope["route"], que el router de
+    Starlette deja en el scope al encontrar la ruta que atiende la solicitud."""
+
+    def __init__(self, app, registro):
+        self.app = app
+        self.registro = registro
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        registro = self.registro
+        inicio = time.perf_counter()
+        registro.entrar()
+        contadores = [500, 0, 0]  # estado, bytes recibidos, bytes enviados
+
+        async def receive_medido():
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                contadores[1] += len(mensaje.get("body", b""))
+            return mensaje
+
+        async def send_medido(mensaje):
+            if mensaje["type"] == "http.response.start":
+                contadores[0] = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                contadores[2] += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive_medido, send_medido)
+        finally:
+            ruta = scope.get("route")
+            registro.salir(scope["method"], getattr(ruta, "path", RUTA_DESCONOCIDA), contadores[0],
+                           time.perf_counter() - inicio, contadores[1], contadores[2])
@@ -0,0 +1,256 @@
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+
+from metricas import CLAVE_RUTA_WSGI, RUTA_DESCONOCIDA
+
+"""Perfilador muestreado por solicitud, con exportación a flamegraph.
+
+Cuando una ruta se vuelve lenta bajo carga queremos ver dónde se va el tiempo:
+en el handler, en la validación o en la serialización. Perfilar todas las
+solicitudes es demasiado caro, así que solo se perfila una muestra:
+- 1 de cada N solicitudes (PERFIL_CADA_N=N), y/o
+- las solicitudes que traen la cabecera X-Perfil-Token con el token
+  configurado (PERFIL_TOKEN=...), para depurar una llamada concreta.
+
+Con el muestreo apagado (lo normal) los middlewares solo consultan un booleano
+y llaman a la app directamente, así que se puede dejar instalado en producción.
+
+Para las solicitudes elegidas se instala un trazador con sys.setprofile que
+anota el tiempo propio de cada pila de llamadas. Las pilas se agregan por ruta
+y se exportan en formato "colapsado" (una línea "ruta;f1;f2;f3 microsegundos"),
+que entienden flamegraph.pl, speedscope o inferno:
+
+    curl -H "X-Perfil-Token: $TOKEN" localhost:8000/admin/perfiles > perfil.txt
+    flamegraph.pl perfil.txt > perfil.svg
+
+/admin/perfiles exige siempre el token: las pilas muestran nombres de funciones
+y rutas de archivos internos. Sin PERFIL_TOKEN (por ejemplo, solo con
+PERFIL_CADA_N) el endpoint responde 403 a todo el mundo.
+
+Con asyncio el trazador filtra por tarea: solo cuenta los eventos que ocurren
+mientras se ejecuta la tarea de la solicitud perfilada, no los de otras
+solicitudes que se intercalan en el mismo bucle de eventos. asyncio se importa
+al perfilar la primera tarea, así la app Flask no lo carga.
+"""
+
+CABECERA_TOKEN = "X-Perfil-Token"
+_CLAVE_WSGI_TOKEN = "HTTP_" + CABECERA_TOKEN.upper().replace("-", "_")
+_CABECERA_ASGI_TOKEN = CABECERA_TOKEN.lower().encode("latin-1")
+
+
+def _etiqueta(frame, evento, arg):
+    if evento == "c_call":
+        return f"{getattr(arg, '__qualname__', repr(arg))} (builtin)"
+    codigo = frame.f_code
+    # ';' separa marcos en el formato colapsado, no puede aparecer en una etiqueta
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})".replace(";", ",")
+
+
+class _Sesion:
+    """Pila de llamadas y tiempos propios de una solicitud perfilada."""
+
+    def __init__(self):
+        self.pilas = {}
+        self._pila = []  # [etiqueta, inicio, tiempo de los hijos]
+
+    def evento(self, frame, evento, arg):
+        ahora = time.perf_counter()
+        if arg is sys.setprofile:
+            # La llamada que desactiva el trazador nunca tendría su c_return
+            return
+        if evento == "call" or evento == "c_call":
+            self._pila.append([_etiqueta(frame, evento, arg), ahora, 0.0])
+        elif self._pila:  # return, c_return, c_exception
+            self._cerrar_marco(ahora)
+
+    def _cerrar_marco(self, ahora):
+        etiqueta, inicio, hijos = self._pila.pop()
+        total = ahora - inicio
+        clave = tuple(marco[0] for marco in self._pila) + (etiqueta,)
+        self.pilas[clave] = self.pilas.get(clave, 0.0) + (total - hijos)
+        if self._pila:
+            self._pila[-1][2] += total
+
+    def cerrar(self):
+        ahora = time.perf_counter()
+        while self._pila:
+            self._cerrar_marco(ahora)
+
+
+class PerfiladorMuestreado:
+    def __init__(self, cada_n=None, token=None):
+        self.cada_n = int(os.environ.get("PERFIL_CADA_N", "0")) if cada_n is None else cada_n
+        self.token = os.environ.get("PERFIL_TOKEN") if token is None else token
+        self.activo = bool(self.cada_n) or bool(self.token)
+        self._contador = itertools.count(1)
+        self._lock = threading.Lock()
+        self._por_ruta = {}  # {ruta: {pila: segundos}}
+        self.solicitudes = {}  # {ruta: solicitudes perfiladas}
+        # Sesiones asíncronas activas, por tarea; el trazador global las despacha
+        self._sesiones_por_tarea = {}
+        self._tarea_actual = None  # asyncio.current_task, al perfilar la primera tarea
+
+    def debe_perfilar(self, token_recibido=None):
+        if not self.activo:
+            return False
+        if self.token and token_recibido == self.token:
+            return True
+        # next() sobre itertools.count es atómico bajo el GIL
+        return bool(self.cada_n) and next(self._contador) % self.cada_n == 0
+
+    def autorizado(self, token_recibido):
+        """Acceso a /admin/perfiles: hay que enviar el token configurado. Sin token
+        configurado nadie tiene acceso."""
+        if not self.token or token_recibido is None:
+            return False
+        return hmac.compare_digest(token_recibido.encode("utf-8"), self.token.encode("utf-8"))
+
+    # --- Trazado síncrono (un hilo por solicitud, como Flask) ---
+
+    def iniciar_en_hilo(self):
+        sesion = _Sesion()
+        sys.setprofile(sesion.evento)
+        return sesion
+
+    # --- Trazado asíncrono (muchas solicitudes en un hilo, como FastAPI) ---
+
+    def iniciar_en_tarea(self):
+        if self._tarea_actual is None:
+            import asyncio
+            self._tarea_actual = asyncio.current_task
+        sesion = _Sesion()
+        if not self._sesiones_por_tarea:
+            sys.setprofile(self._despachar)
+        self._sesiones_por_tarea[self._tarea_actual()] = sesion
+        return sesion
+
+    def detener_en_tarea(self, sesion):
+        self._sesiones_por_tarea.pop(self._tarea_actual(), None)
+        if not self._sesiones_por_tarea:
+            sys.setprofile(None)
+        sesion.cerrar()
+
+    def _despachar(self, frame, evento, arg):
+        try:
+            sesion = self._sesiones_por_tarea.get(self._tarea_actual())
+        except RuntimeError:  # sin bucle de eventos en marcha
+            return
+        if sesion is not None:
+            sesion.evento(frame, evento, arg)
+
+    # --- Agregación y exportación ---
+
+    def agregar(self, ruta, sesion):
+        with self._lock:
+            pilas = self._por_ruta.setdefault(ruta, {})
+            for pila, segundos in sesion.pilas.items():
+                pilas[pila] = pilas.get(pila, 0.0) + segundos
+            self.solicitudes[ruta] = self.solicitudes.get(ruta, 0) + 1
+
+    def colapsado(self, ruta=None):
+        """Pilas agregadas en formato colapsado (microsegundos), con la ruta como raíz."""
+        with self._lock:
+            rutas = {r: dict(p) for r, p in self._por_ruta.items() if ruta is None or r == ruta}
+        lineas = []
+        for nombre_ruta, pilas in sorted(rutas.items()):
+            raiz = nombre_ruta.replace(";", ",")
+            for pila, segundos in sorted(pilas.items()):
+                microsegundos = int(segundos * 1_000_000)
+                if microsegundos:
+                    lineas.append(f"{raiz};{';'.join(pila)} {microsegundos}")
+        return "\n".join(lineas) + "\n" if lineas else ""
+
+    def limpiar(self):
+        with self._lock:
+            self._por_ruta.clear()
+            self.solicitudes.clear()
+
+
+# --- WSGI (Flask) ---
+
+class _CuerpoPerfilado:
+    """Perfila también la generación del cuerpo (las respuestas en streaming
+    producen su contenido mientras se itera) y agrega al terminar."""
+
+    def __init__(self, iterable, perfilador, sesion, environ):
+        self._iterable = iterable
+        self._perfilador = perfilador
+        self._sesion = sesion
+        self._environ = environ
+
+    def __iter__(self):
+        sesion = self._sesion
+        iterador = iter(self._iterable)
+        while True:
+            sys.setprofile(sesion.evento)
+            try:
+                trozo = next(iterador)
+            except StopIteration:
+                break
+            finally:
+                sys.setprofile(None)
+            yield trozo
+        self._terminar()
+
+    def _terminar(self):
+        if self._sesion is not None:
+            sesion, self._sesion = self._sesion, None
+            sesion.cerrar()
+            self._perfilador.agregar(self._environ.get(CLAVE_RUTA_WSGI, RUTA_DESCONOCIDA), sesion)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            self._terminar()
+
+
+class MiddlewarePerfilWSGI:
+    def __init__(self, app, perfilador):
+        self.app = app
+        self.perfilador = perfilador
+
+    def __call__(self, environ, start_response):
+        perfilador = self.perfilador
+        if not perfilador.activo or not perfilador.debe_perfilar(environ.get(_CLAVE_WSGI_TOKEN)):
+            return self.app(environ, start_response)
+        sesion = perfilador.iniciar_en_hilo()
+        try:
+            iterable = self.app(environ, start_response)
+        finally:
+            sys.setprofile(None)
+        return _CuerpoPerfilado(iterable, perfilador, sesion, environ)
+
+
+# --- ASGI (FastAPI) ---
+
+class MiddlewarePerfilASGI:
+    def __init__(self, app, perfilador):
+        self.app = app
+        self.perfilador = perfilador
+
+    async def __call__(self, scope, receive, send):
+        perfilador = self.perfilador
+        if not perfilador.activo or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = None
+        for nombre, valor in scope["headers"]:
+            if nombre == _CABECERA_ASGI_TOKEN:
+                token = valor.decode("latin-1")
+                break
+        if not perfilador.debe_perfilar(token):
+            await self.app(scope, receive, send)
+            return
+        sesion = perfilador.iniciar_en_tarea()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            perfilador.detener_en_tarea(sesion)
+            ruta = scope.get("route")
+            perfilador.agregar(getattr(ruta, "path", RUTA_DESCONOCIDA), sesion)
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import random
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+"""Repositorio de items detrás de /items/{item_id} y /items?ids=...
+
+leer_item empezó devolviendo solo el item_id y q, pero en producción esa ruta
+está delante de un catálogo real. Aquí definimos una interfaz asíncrona
+pequeña (obtener / obtener_varios) con varias implementaciones:
+
+- RepositorioEco: el comportamiento original (el item es solo su id). Es el
+  que se usa si no se configura ninguna base de datos.
+- RepositorioMemoria: un diccionario, útil para pruebas.
+- RepositorioSQLite: un archivo SQLite local con un pool de conexiones de solo
+  lectura. sqlite3 es bloqueante, así que las consultas se ejecutan en un pool
+  de hilos (del mismo tamaño que el pool de conexiones) para no bloquear el
+  bucle de eventos. Las sentencias SQL son constantes, así que cada conexión
+  las prepara una vez y las reutiliza desde su caché de sentencias.
+
+La multi-lectura usa una sola consulta con json_each(?): el parámetro es la
+lista de ids en JSON, así la sentencia es la misma (y se reutiliza preparada)
+pida 1 id o 500, en vez de hacer N consultas.
+
+Generar datos de prueba:
+    python repositorio_items.py items.db --cantidad 1000000
+y arrancar la app con ITEMS_DB=items.db.
+"""
+
+SQL_CREAR = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    precio REAL NOT NULL,
+    stock INTEGER NOT NULL
+)
+"""
+SQL_INSERTAR = "INSERT OR REPLACE INTO items (id, nombre, precio, stock) VALUES (?, ?, ?, ?)"
+SQL_OBTENER = "SELECT id, nombre, precio, stock FROM items WHERE id = ?"
+SQL_OBTENER_VARIOS = "SELECT id, nombre, precio, stock FROM items WHERE id IN (SELECT value FROM json_each(?))"
+
+
+def _fila_a_item(fila):
+    return {"item_id": fila[0], "nombre": fila[1], "precio": fila[2], "stock": fila[3]}
+
+
+class RepositorioItems(ABC):
+    """Interfaz común. obtener_varios devuelve {id: item} solo con los ids encontrados.
+
+    Una implementación a la que le falte alguno de los métodos abstractos falla
+    al crearse (TypeError), no en la primera solicitud que lo necesite."""
+
+    @abstractmethod
+    async def obtener(self, item_id):
+        """Devuelve el item o None si no existe."""
+
+    @abstractmethod
+    async def obtener_varios(self, ids):
+        """Devuelve {id: item} con los ids que existen."""
+
+    def cerrar(self):
+        pass
+
+
+class RepositorioEco(RepositorioItems):
+    async def obtener(self, item_id):
+        return {"item_id": item_id}
+
+    async def obtener_varios(self, ids):
+        return {item_id: {"item_id": item_id} for item_id in ids}
+
+
+class RepositorioMemoria(RepositorioItems):
+    def __init__(self, items=None):
+        self.items = dict(items or {})
+
+    async def obtener(self, item_id):
+        return self.items.get(item_id)
+
+    async def obtener_varios(self, ids):
+        return {item_id: self.items[item_id] for item_id in ids if item_id in self.items}
+
+
+class RepositorioSQLite(RepositorioItems):
+    def __init__(self, ruta, tam_pool=4):
+        self.ruta = ruta
+        self.tam_pool = tam_pool
+        self._pid = None
+        self._conexiones = None
+        self._ejecutor = None
+
+    def _preparar(self):
+        """Abre el pool en el primer uso de cada proceso. Las conexiones SQLite no
+        deben cruzar un fork(), y servidor.py importa la app antes de crear los workers."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._conexiones = queue.Queue()
+        for _ in range(self.tam_pool):
+            # Solo lectura: varios workers pueden compartir el mismo archivo sin bloquearse
+            conexion = sqlite3.connect(f"file:{os.path.abspath(self.ruta)}?mode=ro", uri=True,
+                                       check_same_thread=False, cached_statements=32)
+            self._conexiones.put(conexion)
+        self._ejecutor = ThreadPoolExecutor(max_workers=self.tam_pool, thread_name_prefix="sqlite-items")
+
+    def _consultar(self, sql, parametros):
+        conexion = self._conexiones.get()
+        try:
+            return conexion.execute(sql, parametros).fetchall()
+        finally:
+            self._conexiones.put(conexion)
+
+    async def obtener(self, item_id):
+        self._preparar()
+        filas = await asyncio.get_running_loop().run_in_executor(
+            self._ejecutor, self._consultar, SQL_OBTENER, (item_id,))
+        return _fila_a_item(filas[0]) if filas else None
+
+    async def obtener_varios(self, ids):
+        if not ids:
+            return {}
+        self._preparar()
+        filas = await asyncio.get_running_loop().run_in_executor(
+            self._ejecutor, self._consultar, SQL_OBTENER_VARIOS, (json.dumps(list(ids)),))
+        return {fila[0]: _fila_a_item(fila) for fila in filas}
+
+    def cerrar(self):
+        if self._pid != os.getpid():
+            return
+        self._ejecutor.shutdown(wait=True)
+        while not self._conexiones.empty():
+            self._conexiones.get_nowait().close()
+        self._pid = None
+
+
+def crear_repositorio():
+    """SQLite si ITEMS_DB apunta a una base de datos, si no el eco original."""
+    ruta = os.environ.get("ITEMS_DB")
+    if ruta:
+        return RepositorioSQLite(ruta, tam_pool=int(os.environ.get("ITEMS_POOL", "4")))
+    return RepositorioEco()
+
+
+def generar_items(ruta, cantidad, lote=50_000, semilla=42):
+    """Crea (o rellena) la base de datos con 'cantidad' items sintéticos."""
+    azar = random.Random(semilla)
+    conexion = sqlite3.connect(ruta)
+    try:
+        # Carga masiva: sin fsync por transacción; si se corta, se regenera
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=OFF")
+        conexion.execute(SQL_CREAR)
+        for inicio in range(1, cantidad + 1, lote):
+            fin = min(cantidad + 1, inicio + lote)
+            conexion.executemany(SQL_INSERTAR, (
+                (i, f"item {i}", round(azar.uniform(1, 1000), 2), azar.randint(0, 500))
+                for i in range(inicio, fin)
+            ))
+            conexion.commit()
+    finally:
+        conexion.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera una base de datos SQLite de items de prueba")
+    parser.add_argument("ruta")
+    parser.add_argument("--cantidad", type=int, default=100_000)
+    args = parser.parse_args()
+    inicio = time.perf_counter()
+    generar_items(args.ruta, args.cantidad)
+    print(f"{args.cantidad} items generados en {args.ruta} ({time.perf_counter() - inicio:.1f} s)")
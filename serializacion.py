@@ -0,0 +1,124 @@
+import json
+import math
+import os
+
+"""Capa de serialización JSON común para app_flask y app_fastapi.
+
+Por defecto Flask serializa con el módulo json de la biblioteca estándar
+(jsonify) y FastAPI pasa cada respuesta por jsonable_encoder antes de
+JSONResponse. Aquí centralizamos la codificación: si orjson está instalado lo
+usamos (está escrito en Rust y es varias veces más rápido), si no, caemos al
+json estándar. Ambos producen el mismo JSON compacto en UTF-8, también en los
+casos en que orjson y json se comportan distinto por defecto, para que la
+respuesta no dependa de qué paquetes hay instalados:
+- claves que no son str (1, None, True...): se convierten a texto como hace
+  json ("1", "null", "true"); orjson necesita OPT_NON_STR_KEYS;
+- ordenar=True ordena las claves (el sort_keys de json, OPT_SORT_KEYS);
+- datetime, date y time pasan por 'default' en los dos (orjson los
+  convertiría él mismo a ISO 8601), así el proveedor de Flask los sigue
+  formateando como jsonify de siempre;
+- NaN e infinito se escriben como null, como hace orjson (json con
+  allow_nan=False lanzaría ValueError).
+
+Cada app adapta esta capa a su framework (ProveedorJSONRapido en app_flask,
+RespuestaJSONRapida en app_fastapi). El codificador se puede forzar con la
+variable de entorno SERIALIZADOR=json|orjson, o con usar().
+"""
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+
+def _por_defecto(objeto):
+    # Modelos Pydantic: así podemos serializarlos sin pasar por jsonable_encoder
+    if hasattr(objeto, "model_dump"):
+        return objeto.model_dump()
+    raise TypeError(f"El objeto de tipo {type(objeto).__name__} no es serializable a JSON")
+
+
+def _sin_no_finitos(objeto):
+    """Copia de 'objeto' con NaN e infinitos cambiados por None."""
+    if isinstance(objeto, float):
+        return objeto if math.isfinite(objeto) else None
+    if isinstance(objeto, dict):
+        return {clave: _sin_no_finitos(valor) for clave, valor in objeto.items()}
+    if isinstance(objeto, (list, tuple)):
+        return [_sin_no_finitos(valor) for valor in objeto]
+    return objeto
+
+
+class CodificadorJSON:
+    """json de la biblioteca estándar, con la misma salida compacta que orjson."""
+
+    nombre = "json"
+
+    def dumps(self, contenido, default=None, ordenar=False):
+        opciones = {"ensure_ascii": False, "allow_nan": False, "separators": (",", ":"),
+                    "sort_keys": ordenar, "default": default or _por_defecto}
+        try:
+            return json.dumps(contenido, **opciones).encode("utf-8")
+        except ValueError as error:
+            if not str(error).startswith("Out of range float"):
+                raise
+        # Solo si había NaN o infinitos: se repite cambiándolos por null
+        return json.dumps(_sin_no_finitos(contenido), **opciones).encode("utf-8")
+
+    def loads(self, datos):
+        return json.loads(datos)
+
+
+class CodificadorOrjson:
+    nombre = "orjson"
+
+    def dumps(self, contenido, default=None, ordenar=False):
+        return orjson.dumps(contenido, default=default or _por_defecto,
+                            option=_OPCIONES_ORDENADAS if ordenar else _OPCIONES)
+
+    def loads(self, datos):
+        return orjson.loads(datos)
+
+
+if orjson is not None:
+    # OPT_NON_STR_KEYS no cuesta nada con claves str: solo actúa con las demás
+    _OPCIONES = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    _OPCIONES_ORDENADAS = _OPCIONES | orjson.OPT_SORT_KEYS
+
+CODIFICADORES = {"json": CodificadorJSON()}
+if orjson is not None:
+    CODIFICADORES["orjson"] = CodificadorOrjson()
+
+_codificador = CODIFICADORES.get(os.environ.get("SERIALIZADOR", ""),
+                                 CODIFICADORES.get("orjson", CODIFICADORES["json"]))
+
+
+def usar(nombre):
+    """Cambia el codificador activo ("json" u "orjson")."""
+    global _codificador
+    if nombre not in CODIFICADORES:
+        raise ValueError(f"Codificador JSON no disponible: {nombre}")
+    _codificador = CODIFICADORES[nombre]
+
+
+def codificador_activo():
+    return _codificador.nombre
+
+
+def dumps(contenido, default=None, ordenar=False):
+    """Serializa a bytes JSON (UTF-8, compacto) con el codificador activo.
+    ordenar=True ordena las claves de los diccionarios."""
+    return _codificador.dumps(contenido, default, ordenar)
+
+
+def loads(datos):
+    return _codificador.loads(datos)
+
+
+def pre_serializar(contenido):
+    """Serializa una respuesta constante una sola vez (al importar el módulo).
+
+    Las rutas que siempre devuelven el mismo cuerpo responden directamente con
+    estos bytes, sin construir ni codificar nada por solicitud.
+    """
+    return dumps(contenido)
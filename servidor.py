@@ -0,0 +1,213 @@
+import argparse
+import importlib
+import inspect
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import metricas
+
+"""Lanzador multiproceso para app_flask (WSGI) y app_fastapi (ASGI).
+
+app.run(debug=True) arranca un único proceso, y "uvicorn app_fastapi:app" por
+defecto también. Con un solo proceso Python usa un solo núcleo (por el GIL),
+así que en una máquina de 8 núcleos desperdiciamos 7. Este lanzador:
+
+1. Importa la app una sola vez en el proceso maestro ("preload"): los workers
+   nacen con fork() y comparten esa memoria ya inicializada (copy-on-write), así
+   que arrancan mucho más rápido que importando cada uno por su cuenta. Leer
+   'app' la crea con crear_app(calentar=True) (ver app_flask.py y
+   app_fastapi.py), así el calentamiento también se hace una sola vez aquí;
+   APP_CALENTAR=0 lo desactiva.
+2. Crea N workers (por defecto uno por núcleo). Cada uno abre su propio socket
+   en el mismo puerto con SO_REUSEPORT, y el kernel reparte las conexiones
+   entrantes entre ellos.
+3. Vigila a los workers y vuelve a crear los que mueren (con una espera
+   creciente si mueren nada más arrancar, para no entrar en un bucle).
+4. Con SIGTERM o SIGINT hace un apagado ordenado: reenvía SIGTERM a los
+   workers, que dejan de aceptar conexiones y terminan las solicitudes en curso;
+   si alguno no termina en --gracia segundos, recibe SIGKILL.
+
+Uso:
+    python servidor.py app_fastapi:app --port 8000
+    python servidor.py app_flask:app --port 5000 --workers 4
+
+Los workers Flask usan el servidor con hilos de Werkzeug y los de FastAPI usan
+Uvicorn; ambos se importan solo dentro del worker que los necesita.
+"""
+
+
+def importar_app(objetivo):
+    """Importa "modulo:atributo" y devuelve el objeto (por ejemplo app_flask:app)."""
+    nombre_modulo, _, atributo = objetivo.partition(":")
+    modulo = importlib.import_module(nombre_modulo)
+    return getattr(modulo, atributo or "app")
+
+
+def es_asgi(app):
+    """Las apps ASGI se llaman con await (FastAPI.__call__ es async def); las WSGI no."""
+    llamada = app if inspect.isfunction(app) else getattr(app, "__call__", None)
+    return inspect.iscoroutinefunction(llamada)
+
+
+def crear_socket(host, port, backlog=2048):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("Este sistema no soporta SO_REUSEPORT")
+    familia = socket.AF_INET6 if ":" in host else socket.AF_INET
+    # proto explícito: asyncio solo activa TCP_NODELAY en las conexiones aceptadas si
+    # proto == IPPROTO_TCP; con proto=0 Nagle + ACK retardado añade ~40 ms por respuesta
+    sock = socket.socket(familia, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _servir_wsgi(app, sock, host, port, gracia):
+    from werkzeug.serving import make_server
+
+    servidor = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # Al cerrar, esperar a los hilos que todavía atienden solicitudes (drenado)
+    servidor.daemon_threads = False
+    servidor.block_on_close = True
+
+    def al_terminar(signum, frame):
+        # shutdown() espera a que serve_forever() salga: hay que llamarlo desde otro hilo
+        threading.Thread(target=servidor.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, al_terminar)
+    signal.signal(signal.SIGINT, al_terminar)
+    servidor.serve_forever()
+    servidor.server_close()
+
+
+def _servir_asgi(app, sock, host, port, gracia):
+    import uvicorn
+
+    config = uvicorn.Config(app, host=host, port=port, timeout_graceful_shutdown=gracia,
+                            access_log=False)
+    # Uvicorn instala sus propios manejadores de SIGTERM/SIGINT y drena las conexiones
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _worker(app, host, port, gracia):
+    """Código del proceso hijo: abre su socket y atiende hasta recibir SIGTERM."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    sock = crear_socket(host, port)
+    servir = _servir_asgi if es_asgi(app) else _servir_wsgi
+    try:
+        servir(app, sock, host, port, gracia)
+    finally:
+        sock.close()
+
+
+class Supervisor:
+    def __init__(self, app, host, port, workers, gracia=30.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.gracia = gracia
+        self.workers = {}  # pid -> hora de arranque
+        self.terminando = False
+        self._espera_reinicio = 0.5
+
+    def lanzar_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            codigo = 0
+            try:
+                _worker(self.app, self.host, self.port, self.gracia)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                codigo = 1
+            finally:
+                # _exit: el hijo no debe ejecutar los atexit ni el resto del código del
+                # maestro. Por eso las métricas del worker (METRICAS_DIR) se vuelcan a mano.
+                metricas.volcar_todos()
+                os._exit(codigo)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def _al_terminar(self, signum, frame):
+        if self.terminando:
+            return
+        self.terminando = True
+        self.limite_gracia = time.monotonic() + self.gracia
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def ejecutar(self):
+        # Comprobamos el puerto antes de crear workers, para fallar con un error claro
+        crear_socket(self.host, self.port).close()
+        signal.signal(signal.SIGTERM, self._al_terminar)
+        signal.signal(signal.SIGINT, self._al_terminar)
+        for _ in range(self.num_workers):
+            self.lanzar_worker()
+        print(f"Maestro {os.getpid()}: {self.num_workers} workers en http://{self.host}:{self.port}",
+              file=sys.stderr)
+
+        while self.workers:
+            try:
+                pid, estado = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if self.terminando and time.monotonic() > self.limite_gracia:
+                    for restante in list(self.workers):
+                        try:
+                            os.kill(restante, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                time.sleep(0.1)
+                continue
+            arranque = self.workers.pop(pid, None)
+            if self.terminando or arranque is None:
+                continue
+            vivio = time.monotonic() - arranque
+            print(f"Worker {pid} terminó ({_describir_estado(estado)}) tras {vivio:.1f} s; reiniciando",
+                  file=sys.stderr)
+            if vivio < 1.0:
+                # Muere nada más arrancar: esperamos cada vez más antes de reintentar
+                time.sleep(self._espera_reinicio)
+                self._espera_reinicio = min(self._espera_reinicio * 2, 30.0)
+            else:
+                self._espera_reinicio = 0.5
+            if not self.terminando:
+                self.lanzar_worker()
+
+
+def _describir_estado(estado):
+    if os.WIFSIGNALED(estado):
+        return f"señal {os.WTERMSIG(estado)}"
+    return f"código {os.WEXITSTATUS(estado)}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor multiproceso para las apps WSGI/ASGI")
+    parser.add_argument("app", help='Objetivo "modulo:atributo", por ejemplo app_fastapi:app')
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--gracia", type=float, default=30.0,
+                        help="Segundos para terminar las solicitudes en curso al apagar")
+    args = parser.parse_args(argv)
+
+    # El directorio actual en sys.path, igual que hace uvicorn, para encontrar app_*.py
+    sys.path.insert(0, os.getcwd())
+    app = importar_app(args.app)
+    Supervisor(app, args.host, args.port, args.workers, args.gracia).ejecutar()
+
+
+if __name__ == '__main__':
+    main()
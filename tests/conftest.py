@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los módulos del proyecto están en la raíz del repositorio (no es un paquete):
+# la añadimos al path para que los tests puedan importarlos por su nombre.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import admision
+from admision import ControlAdmision, LimitadorTasa, Rechazada
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_rechazada_redondea_retry_after_hacia_arriba():
+    assert Rechazada("x", 0.2).reintentar_en == 1
+    assert Rechazada("x", 2.1).reintentar_en == 3
+
+
+def test_sincrono_cola_llena_y_espera_agotada():
+    control = ControlAdmision("prueba", limite=1, max_cola=1, espera_max=0.05)
+    control.entrar()  # ocupa la única plaza
+
+    en_espera = threading.Thread(target=lambda: pytest.raises(Rechazada, control.entrar))
+    en_espera.start()
+    while control._en_cola == 0:
+        pass
+    # La cola (de 1) está llena: rechazo inmediato
+    with pytest.raises(Rechazada):
+        control.entrar()
+    en_espera.join()  # y la que esperaba agota su espera_max
+
+    control.salir()
+    control.entrar()
+    control.salir()
+    assert control.estadisticas() == {"en_curso": 0, "en_cola": 0, "admitidas": 2,
+                                      "rechazadas_cola_llena": 1, "rechazadas_espera": 1}
+
+
+def test_sincrono_la_plaza_pasa_al_que_espera():
+    control = ControlAdmision("prueba", limite=1, max_cola=1, espera_max=5)
+    control.entrar()
+    admitida = threading.Event()
+
+    def esperar():
+        control.entrar()
+        admitida.set()
+
+    hilo = threading.Thread(target=esperar)
+    hilo.start()
+    while control._en_cola == 0:
+        pass
+    control.salir()
+    assert admitida.wait(1)
+    hilo.join()
+    assert control.en_curso == 1
+
+
+def test_asincrono_fifo_y_rechazos():
+    async def principal():
+        control = ControlAdmision("prueba", limite=1, max_cola=2, espera_max=0.05)
+        await control.entrar_async()
+        orden = []
+
+        async def esperar(nombre):
+            await control.entrar_async()
+            orden.append(nombre)
+
+        primera = asyncio.ensure_future(esperar("primera"))
+        segunda = asyncio.ensure_future(esperar("segunda"))
+        await asyncio.sleep(0)
+        with pytest.raises(Rechazada):
+            await control.entrar_async()  # cola llena
+        control.salir_async()  # la plaza pasa a "primera"
+        await primera
+        control.salir_async()  # y luego a "segunda"
+        await segunda
+        control.salir_async()
+        return control, orden
+
+    control, orden = asyncio.run(principal())
+    assert orden == ["primera", "segunda"]
+    assert control.estadisticas()["en_curso"] == 0
+    assert control.estadisticas()["admitidas"] == 3
+    assert control.estadisticas()["rechazadas_cola_llena"] == 1
+
+
+def test_asincrono_espera_agotada_no_pierde_la_plaza():
+    async def principal():
+        control = ControlAdmision("prueba", limite=1, max_cola=1, espera_max=0.01)
+        await control.entrar_async()
+        with pytest.raises(Rechazada):
+            await control.entrar_async()
+        control.salir_async()
+        await control.entrar_async()  # la plaza sigue disponible
+        control.salir_async()
+        return control
+
+    control = asyncio.run(principal())
+    assert control.en_curso == 0
+    assert control.rechazadas_espera == 1
+
+
+def test_limitador_rafaga_y_recarga(monkeypatch):
+    ahora = [100.0]
+    monkeypatch.setattr(admision.time, "monotonic", lambda: ahora[0])
+    limitador = LimitadorTasa(tasa=2, rafaga=2)
+    assert limitador.consumir("a") == 0
+    assert limitador.consumir("a") == 0
+    assert limitador.consumir("a") == pytest.approx(0.5)
+    assert limitador.consumir("b") == 0  # otra clave tiene su propia cubeta
+    ahora[0] += 0.5
+    assert limitador.consumir("a") == 0
+    assert limitador.estadisticas() == {"clientes": 2, "rechazadas": 1}
+
+
+def test_limitador_acota_las_claves():
+    limitador = LimitadorTasa(tasa=1, max_claves=2)
+    for clave in "abc":
+        limitador.consumir(clave)
+    assert limitador.estadisticas()["clientes"] == 2
+
+
+def test_limitador_desde_entorno(monkeypatch):
+    monkeypatch.delenv("LIMITE_TASA", raising=False)
+    assert LimitadorTasa.desde_entorno() is None
+    monkeypatch.setenv("LIMITE_TASA", "5")
+    monkeypatch.setenv("LIMITE_RAFAGA", "10")
+    limitador = LimitadorTasa.desde_entorno()
+    assert (limitador.tasa, limitador.rafaga) == (5.0, 10.0)
+    # LIMITE_TASA=0 desactiva el límite en vez de dividir por cero
+    monkeypatch.setenv("LIMITE_TASA", "0")
+    assert LimitadorTasa.desde_entorno() is None
+
+
+def test_limitador_rechaza_tasa_no_positiva():
+    for tasa in (0, 0.0, -1):
+        with pytest.raises(ValueError):
+            LimitadorTasa(tasa)
+
+
+SONDA_METRICAS = """
+import app_flask, app_fastapi
+from fastapi.testclient import TestClient
+
+flask = app_flask.crear_app().test_client()
+for _ in range(3):
+    flask.post("/api/crear_saludo", json={"nombre": "Ana"})
+print([l for l in flask.get("/metrics").get_data(as_text=True).splitlines() if l.startswith("limite_tasa")])
+
+with TestClient(app_fastapi.crear_app()) as fastapi:
+    for _ in range(3):
+        fastapi.post("/api/crear_saludo_fastapi", json={"nombre": "Ana"})
+    print([l for l in fastapi.get("/metrics").text.splitlines() if l.startswith("limite_tasa")])
+"""
+
+
+def test_rechazos_del_limitador_aparecen_en_metrics():
+    # El limitador se crea al importar las apps, así que se prueba en un proceso nuevo
+    entorno = dict(os.environ, LIMITE_TASA="0.001", LIMITE_RAFAGA="1")
+    salida = subprocess.run([sys.executable, "-c", SONDA_METRICAS], cwd=RAIZ, env=entorno,
+                            capture_output=True, text=True, check=True).stdout.splitlines()
+    assert 'limite_tasa_rechazadas_total{app="flask",ruta="/api/crear_saludo"} 2' in salida[0]
+    assert 'limite_tasa_rechazadas_total{app="fastapi",ruta="/api/crear_saludo_fastapi"} 2' in salida[1]
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app_fastapi
+
+
+@pytest.fixture
+def cliente():
+    with TestClient(app_fastapi.crear_app()) as cliente:
+        yield cliente
+
+
+def test_errores_de_lote_con_la_misma_forma_que_el_post(cliente):
+    individual = cliente.post("/api/crear_saludo_fastapi", json={"edad": 3})
+    assert individual.status_code == 422
+    errores_post = individual.json()["detail"]
+
+    lote = cliente.post("/api/crear_saludo_fastapi/lote", content=b'{"edad": 3}\n{roto\n{"nombre": "Ana"}\n')
+    invalido, roto, valido = [json.loads(linea) for linea in lote.text.splitlines()]
+    assert invalido == {"indice": 0, "error": errores_post}
+    assert [(e["type"], e["loc"]) for e in roto["error"]] == [("json_invalid", ["body"])]
+    assert sorted(roto["error"][0]) == sorted(errores_post[0])
+    assert valido["indice"] == 2 and "error" not in valido
+
+
+@pytest.mark.parametrize("cuerpo", [b'{"edad": 3}', b'{"nombre": 1}', b'{"nombre": "a"', b"{roto"])
+def test_post_websocket_y_sse_dan_el_mismo_error(cliente, cuerpo):
+    errores_post = cliente.post("/api/crear_saludo_fastapi", content=cuerpo,
+                                headers={"Content-Type": "application/json"}).json()["detail"]
+
+    with cliente.websocket_connect("/ws/saludos") as ws:
+        ws.send_bytes(cuerpo)
+        por_websocket = json.loads(ws.receive_text())
+
+    sse = cliente.post("/sse/saludos", content=cuerpo + b"\n")
+    evento = next(linea for linea in sse.text.splitlines() if linea.startswith("data: "))
+    por_sse = json.loads(evento[len("data: "):])
+
+    assert por_websocket == por_sse == {"indice": 0, "error": errores_post}
+
+
+def test_304_se_cuenta_en_la_ruta_de_la_plantilla(cliente):
+    etag = cliente.get("/items/7").headers["etag"]
+    respuesta = cliente.get("/items/7", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert respuesta.status_code == 304
+    metricas = cliente.get("/metrics").text
+    assert 'http_solicitudes_total{app="fastapi",metodo="GET",ruta="/items/{item_id}",estado="304"} 1' in metricas
+    assert "sin_ruta" not in metricas
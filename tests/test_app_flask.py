@@ -0,0 +1,43 @@
+import pytest
+
+import app_flask
+import metricas
+
+
+@pytest.fixture
+def cliente():
+    return app_flask.crear_app().test_client()
+
+
+def test_metrics_content_type_sin_charset_duplicado(cliente):
+    respuesta = cliente.get("/metrics")
+    assert respuesta.status_code == 200
+    assert respuesta.headers["Content-Type"] == metricas.TIPO_CONTENIDO
+
+
+def lineas(respuesta):
+    import json
+    return [json.loads(linea) for linea in respuesta.get_data().splitlines()]
+
+
+def test_errores_de_lote_con_la_misma_forma_que_el_post(cliente):
+    individual = cliente.post("/api/crear_saludo", json={"edad": 3})
+    assert individual.status_code == 422
+    errores_post = individual.get_json()["detail"]
+
+    lote = cliente.post("/api/crear_saludo/lote", data=b'{"edad": 3}\n{roto\n{"nombre": "Ana"}\n')
+    invalido, roto, valido = lineas(lote)
+    assert invalido == {"indice": 0, "error": errores_post}
+    assert roto["indice"] == 1
+    assert [(e["type"], e["loc"]) for e in roto["error"]] == [("json_invalid", ["body"])]
+    assert sorted(roto["error"][0]) == sorted(errores_post[0])
+    assert valido["indice"] == 2 and "error" not in valido
+
+
+def test_304_negociado_lleva_vary(cliente):
+    primera = cliente.get("/api/saludo", headers={"Accept-Encoding": "gzip"})
+    etag = primera.headers["ETag"]
+    segunda = cliente.get("/api/saludo", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert segunda.status_code == 304
+    assert segunda.headers["ETag"] == etag
+    assert "Accept-Encoding" in segunda.headers["Vary"]
@@ -0,0 +1,43 @@
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+
+RAIZ = benchmark.__file__.rsplit("/", 1)[0]
+
+
+def ejecutar(codigo):
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True, cwd=RAIZ)
+    return salida.stdout.strip()
+
+
+def test_importar_y_crear_app_flask_no_carga_pydantic():
+    codigo = "import sys, app_flask; app_flask.crear_app(); print('pydantic' in sys.modules)"
+    assert ejecutar(codigo) == "False"
+
+
+def test_importar_y_crear_app_fastapi_no_compila_el_validador():
+    codigo = ("import app_fastapi, validacion; app = app_fastapi.crear_app(); "
+              "print(validacion._validador_saludo is None, "
+              "'schema' in app.openapi()['paths']['/api/crear_saludo_fastapi']['post']"
+              "['requestBody']['content']['application/json'])")
+    assert ejecutar(codigo) == "True True"
+
+
+@pytest.mark.parametrize("calentar", [False, True], ids=["frio", "caliente"])
+@pytest.mark.parametrize("modulo, rutas", [("app_flask", benchmark.RUTAS_FLASK),
+                                           ("app_fastapi", benchmark.RUTAS_FASTAPI)])
+def test_presupuesto_de_arranque(modulo, rutas, calentar):
+    """Importar + crear la app no puede tardar más que importar solo el framework
+    más su margen (ver benchmark.MARGEN_ARRANQUE_MS). Cada medida de la app se
+    empareja con una del framework hecha justo antes, para que el ruido de la
+    máquina afecte a las dos por igual."""
+    margen = benchmark.MARGEN_ARRANQUE_MS[modulo] + (benchmark.MARGEN_CALENTAR_MS if calentar else 0.0)
+    diferencias = []
+    for _ in range(5):
+        base = benchmark.medir_importacion_base(benchmark.FRAMEWORK[modulo], 1)
+        diferencias.append(benchmark.medir_arranque(modulo, rutas, calentar, 1)["arranque_ms"] - base)
+    assert statistics.median(diferencias) <= margen
@@ -0,0 +1,49 @@
+import cache_respuestas
+from cache_respuestas import CacheRespuestas, clave_cache, coincide_if_none_match, etag_fuerte
+
+
+def test_clave_normaliza_el_orden_de_la_query():
+    assert clave_cache("/items/1", "b=2&a=1") == clave_cache("/items/1", b"a=1&b=2")
+    assert clave_cache("/items/1", "") == "/items/1"
+    assert clave_cache("/items/1", "q=") != clave_cache("/items/1", "")
+
+
+def test_if_none_match():
+    etag = etag_fuerte(b"cuerpo")
+    assert coincide_if_none_match(etag, etag)
+    assert coincide_if_none_match(f'"otro", W/{etag}', etag)
+    assert coincide_if_none_match("*", etag)
+    assert not coincide_if_none_match(None, etag)
+    assert not coincide_if_none_match('"otro"', etag)
+
+
+def test_etag_cambia_con_el_cuerpo():
+    assert etag_fuerte(b"a") != etag_fuerte(b"b")
+    assert etag_fuerte(b"a") == etag_fuerte(b"a")
+
+
+def test_lru_desaloja_la_menos_usada():
+    cache = CacheRespuestas(max_entradas=2)
+    cache.guardar("a", b"1")
+    cache.guardar("b", b"2")
+    assert cache.obtener("a").cuerpo == b"1"  # "a" pasa a ser la más reciente
+    cache.guardar("c", b"3")
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") is not None and cache.obtener("c") is not None
+    estadisticas = cache.estadisticas()
+    assert estadisticas["desalojos"] == 1
+    assert estadisticas["entradas"] == 2
+    assert (estadisticas["aciertos"], estadisticas["fallos"]) == (3, 1)
+
+
+def test_ttl(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(cache_respuestas.time, "monotonic", lambda: ahora[0])
+    cache = CacheRespuestas(ttl=10)
+    cache.guardar("a", b"1")
+    ahora[0] += 9.9
+    assert cache.obtener("a") is not None
+    ahora[0] += 0.2
+    assert cache.obtener("a") is None
+    assert cache.estadisticas()["expiradas"] == 1
+    assert cache.cache_control == "public, max-age=10"
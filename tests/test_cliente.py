@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+
+import pytest
+
+import cliente
+
+
+class SesionLenta:
+    """Sustituye a requests.Session: cada solicitud tarda 'demora' segundos."""
+
+    def __init__(self, demora):
+        self.demora = demora
+
+    def request(self, metodo, url, json=None, timeout=None):
+        time.sleep(self.demora)
+        return RespuestaFalsa()
+
+
+class RespuestaFalsa:
+    status_code = 200
+    content = b"{}"
+
+
+def escribir_trafico(ruta, total):
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        for _ in range(total):
+            archivo.write(json.dumps({"method": "GET", "path": "/"}) + "\n")
+        archivo.write("esto no es json\n")
+        archivo.write(json.dumps({"sin": "ruta"}) + "\n")
+
+
+def test_leer_trafico_ignora_lineas_que_no_son_solicitudes(tmp_path):
+    ruta = tmp_path / "trafico.jsonl"
+    escribir_trafico(ruta, 3)
+    assert len(list(cliente.leer_trafico(ruta))) == 3
+
+
+def test_reproducir_saturado_mide_la_espera_desde_la_hora_prevista(tmp_path, monkeypatch):
+    ruta = tmp_path / "trafico.jsonl"
+    escribir_trafico(ruta, 10)
+    monkeypatch.setattr(cliente, "crear_sesion", lambda: SesionLenta(0.2))
+
+    # 10 solicitudes en 0.05 s con 2 plazas que tardan 0.2 s cada una: el
+    # servidor no sigue el ritmo, y la última no puede salir hasta ~0.8 s
+    histograma, enviadas, errores, retrasadas = cliente.reproducir_trafico(
+        ruta, tasa=200, max_en_vuelo=2)
+
+    assert (enviadas, errores) == (10, 0)
+    assert retrasadas >= 7
+    # Todas están en el histograma, con la espera por una plaza incluida
+    assert histograma.total == 10
+    assert histograma.valor_en_percentil(100) >= 800_000
+
+
+def test_reproducir_falla_si_no_hay_solicitudes(tmp_path):
+    ruta = tmp_path / "vacio.jsonl"
+    ruta.write_text('{"request_id": "x", "title": "no es una solicitud"}\n')
+    with pytest.raises(ValueError):
+        cliente.reproducir_trafico(ruta)
+
+
+def test_reproducir_sin_saturacion_envia_todo(tmp_path, monkeypatch):
+    ruta = tmp_path / "trafico.jsonl"
+    escribir_trafico(ruta, 10)
+    monkeypatch.setattr(cliente, "crear_sesion", lambda: SesionLenta(0.0))
+
+    _, enviadas, errores, retrasadas = cliente.reproducir_trafico(ruta, tasa=500, max_en_vuelo=4)
+
+    assert (enviadas, errores, retrasadas) == (10, 0, 0)
+
+
+def test_histograma_percentiles_con_error_acotado():
+    histograma = cliente.HistogramaHDR(digitos=2)
+    for valor in range(1, 10_001):
+        histograma.registrar(valor)
+    assert histograma.total == 10_000
+    for p in (50, 90, 99):
+        esperado = p * 100
+        assert abs(histograma.valor_en_percentil(p) - esperado) / esperado < 0.01
+    assert histograma.valor_en_percentil(100) == 10_000
+
+
+def test_histograma_es_seguro_entre_hilos():
+    histograma = cliente.HistogramaHDR()
+    hilos = [threading.Thread(target=lambda: [histograma.registrar(5) for _ in range(1000)])
+             for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert histograma.total == 8000
+
+
+def test_percentil_por_rango_mas_cercano():
+    diez = list(range(1, 11))
+    assert [cliente.percentil(diez, p) for p in (0, 10, 50, 90, 100)] == [1, 1, 5, 9, 10]
+    cien = list(range(1, 101))
+    assert [cliente.percentil(cien, p) for p in (50, 90, 99, 99.9, 100)] == [50, 90, 99, 100, 100]
+    assert cliente.percentil([7], 99) == 7
+    assert cliente.percentil([], 50) == 0.0
+
+
+class SesionFalsa:
+    """Sustituye a requests.Session en generar_carga: 500 en las URL de 'fallan'."""
+
+    def __init__(self, fallan=()):
+        self.fallan = fallan
+        self.cerrada = False
+
+    def request(self, metodo, url, json=None, timeout=None):
+        respuesta = RespuestaFalsa()
+        if url in self.fallan:
+            respuesta.status_code = 500
+        return respuesta
+
+    def close(self):
+        self.cerrada = True
+
+
+ENDPOINTS_PRUEBA = [
+    ("bien", "GET", "http://prueba/bien", None, 3),
+    ("mal", "GET", "http://prueba/mal", None, 1),
+]
+
+
+def test_generar_carga_cuenta_cada_solicitud_una_vez(monkeypatch):
+    sesiones = []
+
+    def crear_sesion():
+        sesiones.append(SesionFalsa(fallan=("http://prueba/mal",)))
+        return sesiones[-1]
+
+    monkeypatch.setattr(cliente, "crear_sesion", crear_sesion)
+    transcurrido, resultados = cliente.generar_carga(ENDPOINTS_PRUEBA, concurrencia=4, total=200)
+
+    assert transcurrido > 0
+    assert resultados["mal"]["latencias"] == []
+    assert resultados["bien"]["errores"] == 0
+    assert len(resultados["bien"]["latencias"]) + resultados["mal"]["errores"] == 200
+    # La mezcla respeta los pesos (3:1) aproximadamente
+    assert 100 < len(resultados["bien"]["latencias"]) < 190
+    assert len(sesiones) == 4 and all(s.cerrada for s in sesiones)
+
+
+def test_generar_carga_por_duracion(monkeypatch):
+    monkeypatch.setattr(cliente, "crear_sesion", lambda: SesionFalsa())
+    inicio = time.perf_counter()
+    _, resultados = cliente.generar_carga(ENDPOINTS_PRUEBA[:1], concurrencia=2, duracion=0.1)
+    assert 0.1 <= time.perf_counter() - inicio < 1.0
+    assert len(resultados["bien"]["latencias"]) > 0
@@ -0,0 +1,203 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+import cliente_async
+from cliente_async import (ABIERTO, CERRADO, SEMIABIERTO, CircuitoAbierto, ClienteAPI, ClienteFastAPI,
+                           EstimadorLatencia, ErrorHTTP, InterruptorCircuito, PlazoAgotado, PoliticaReintentos)
+
+
+def test_espera_con_jitter_acotada():
+    politica = PoliticaReintentos(base=0.1, maximo=0.3)
+    azar = random.Random(1)
+    for intento in range(6):
+        tope = min(0.3, 0.1 * 2 ** intento)
+        assert all(0 <= politica.espera(intento, azar) <= tope for _ in range(50))
+
+
+def test_estimador_necesita_un_minimo_de_muestras():
+    estimador = EstimadorLatencia(minimo=10, percentil=90)
+    for i in range(9):
+        estimador.registrar(i / 100)
+    assert estimador.retardo_cobertura() is None
+    estimador.registrar(0.09)
+    assert estimador.retardo_cobertura() == 0.09
+
+
+def test_interruptor_abre_prueba_y_cierra():
+    ahora = [0.0]
+    interruptor = InterruptorCircuito("http://x", umbral_fallos=2, tiempo_abierto=5, reloj=lambda: ahora[0])
+    interruptor.permitir()
+    interruptor.fallo()
+    interruptor.permitir()
+    interruptor.fallo()
+    assert interruptor.estado == ABIERTO
+    with pytest.raises(CircuitoAbierto):
+        interruptor.permitir()
+
+    ahora[0] = 6
+    interruptor.permitir()  # la solicitud de prueba
+    assert interruptor.estado == SEMIABIERTO
+    with pytest.raises(CircuitoAbierto):
+        interruptor.permitir()  # solo una prueba a la vez
+    interruptor.fallo()
+    assert interruptor.estado == ABIERTO and interruptor.aperturas == 2
+
+    ahora[0] = 12
+    interruptor.permitir()
+    interruptor.exito()
+    assert interruptor.estado == CERRADO
+    assert interruptor.estadisticas() == {"abierto": 0, "fallos_seguidos": 0, "aperturas": 2, "rechazadas": 2}
+
+
+def cliente_con(manejador, **opciones):
+    opciones.setdefault("reintentos", PoliticaReintentos(intentos=3, base=0.001, maximo=0.001))
+    return ClienteFastAPI("http://prueba", transporte=httpx.MockTransport(manejador),
+                          interruptor=InterruptorCircuito("http://prueba"), **opciones)
+
+
+def respuestas(*estados):
+    """Manejador que devuelve los estados en orden y cuenta las llamadas."""
+    pendientes = list(estados)
+    llamadas = []
+
+    def manejador(request):
+        llamadas.append(request)
+        estado = pendientes.pop(0) if len(pendientes) > 1 else pendientes[0]
+        if isinstance(estado, Exception):
+            raise estado
+        return httpx.Response(estado, json={"estado": estado}, headers={"Retry-After": "0"})
+
+    return manejador, llamadas
+
+
+def test_reintenta_get_ante_503():
+    manejador, llamadas = respuestas(503, 503, 200)
+
+    async def probar():
+        async with cliente_con(manejador) as cliente:
+            assert await cliente.raiz() == {"estado": 200}
+            return cliente.estadisticas()
+
+    estadisticas = asyncio.run(probar())
+    assert len(llamadas) == 3
+    assert (estadisticas["solicitudes"], estadisticas["reintentos"]) == (1, 2)
+
+
+def test_post_sin_clave_no_se_reintenta_y_con_clave_si():
+    manejador, llamadas = respuestas(503, 503, 201)
+
+    async def probar():
+        async with cliente_con(manejador) as cliente:
+            respuesta = await cliente.solicitar("POST", "/api/crear_saludo_fastapi", json={})
+            assert respuesta.status_code == 503
+            saludo = await cliente.crear_saludo("Ana", clave_idempotencia="k")
+            assert saludo == {"estado": 201}
+
+    asyncio.run(probar())
+    assert len(llamadas) == 3
+    assert [r.headers.get("Idempotency-Key") for r in llamadas[1:]] == ["k", "k"]
+
+
+def test_error_de_conexion_se_reintenta_aunque_sea_post():
+    manejador, llamadas = respuestas(httpx.ConnectError("rechazada"), 201)
+
+    async def probar():
+        async with cliente_con(manejador) as cliente:
+            return await cliente.solicitar("POST", "/api/crear_saludo_fastapi", json={})
+
+    assert asyncio.run(probar()).status_code == 201
+    assert len(llamadas) == 2
+
+
+def test_error_http_con_la_respuesta():
+    manejador, _ = respuestas(422)
+
+    async def probar():
+        async with cliente_con(manejador) as cliente:
+            with pytest.raises(ErrorHTTP) as error:
+                await cliente.item(1)
+            return error.value
+
+    error = asyncio.run(probar())
+    assert error.estado == 422 and error.respuesta.json() == {"estado": 422}
+
+
+def test_plazo_agotado():
+    async def lento(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200)
+
+    async def probar():
+        async with cliente_con(lento, plazo=0.05) as cliente:
+            with pytest.raises(PlazoAgotado):
+                await cliente.raiz()
+            return cliente.estadisticas()
+
+    estadisticas = asyncio.run(probar())
+    assert estadisticas["plazos_agotados"] == 1
+    assert estadisticas["circuito_fallos_seguidos"] == 0  # cancelado: no cuenta como fallo
+
+
+def test_circuito_abierto_falla_sin_enviar():
+    manejador, llamadas = respuestas(500)
+
+    async def probar():
+        async with cliente_con(manejador, reintentos=PoliticaReintentos(intentos=1)) as cliente:
+            cliente.interruptor.umbral_fallos = 2
+            for _ in range(2):
+                await cliente.solicitar("GET", "/")
+            with pytest.raises(CircuitoAbierto):
+                await cliente.solicitar("GET", "/")
+
+    asyncio.run(probar())
+    assert len(llamadas) == 2
+
+
+def test_cobertura_envia_un_duplicado_que_gana():
+    llamadas = []
+
+    async def manejador(request):
+        llamadas.append(request)
+        if len(llamadas) == 1:
+            await asyncio.sleep(1)  # la primera se queda colgada
+        return httpx.Response(200, json={"llamada": len(llamadas)})
+
+    async def probar():
+        async with cliente_con(manejador, cobertura=True, fraccion_coberturas=1.0, plazo=0.5) as cliente:
+            estimador = cliente._estimadores["GET /items/{item_id}"] = EstimadorLatencia(minimo=1)
+            estimador.registrar(0.01)
+            resultado = await cliente.item(7)
+            return resultado, cliente.estadisticas()
+
+    resultado, estadisticas = asyncio.run(probar())
+    assert resultado == {"llamada": 2}
+    assert (estadisticas["coberturas"], estadisticas["coberturas_ganadas"]) == (1, 1)
+
+
+def test_contra_la_app_fastapi_en_proceso():
+    import app_fastapi
+
+    async def probar():
+        transporte = httpx.ASGITransport(app=app_fastapi.crear_app())
+        async with ClienteFastAPI("http://app", transporte=transporte,
+                                  interruptor=InterruptorCircuito("http://app")) as cliente:
+            creado = await cliente.crear_saludo("Ana", edad=3)
+            lote = await cliente.crear_saludos_lote([{"nombre": "Eva"}, {}])
+            return creado, lote
+
+    creado, lote = asyncio.run(probar())
+    assert creado["datos_recibidos"] == {"nombre": "Ana", "edad": 3}
+    assert [("error" in r) for r in lote] == [False, True]
+
+
+def test_cliente_no_importa_httpx_hasta_el_modo_async():
+    import subprocess
+    import sys
+
+    codigo = "import sys, cliente; print('httpx' in sys.modules)"
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True,
+                            cwd=cliente_async.__file__.rsplit("/", 1)[0])
+    assert salida.stdout.strip() == "False"
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from coalescencia import Coalescedor
+
+
+def test_llamadas_concurrentes_comparten_una_ejecucion():
+    llamadas = 0
+
+    async def cargar():
+        nonlocal llamadas
+        llamadas += 1
+        await asyncio.sleep(0.01)
+        return {"item": 42}
+
+    async def principal():
+        coalescedor = Coalescedor()
+        resultados = await asyncio.gather(*(coalescedor.ejecutar("42", cargar) for _ in range(50)))
+        return coalescedor, resultados
+
+    coalescedor, resultados = asyncio.run(principal())
+    assert llamadas == 1
+    assert all(r == {"item": 42} for r in resultados)
+    estadisticas = coalescedor.estadisticas()
+    assert (estadisticas["ejecuciones"], estadisticas["deduplicadas"], estadisticas["en_vuelo"]) == (1, 49, 0)
+
+
+def test_una_excepcion_no_deja_la_clave_atascada():
+    intentos = 0
+
+    async def cargar():
+        nonlocal intentos
+        intentos += 1
+        if intentos == 1:
+            raise ValueError("fallo")
+        return "ok"
+
+    async def principal():
+        coalescedor = Coalescedor()
+        with pytest.raises(ValueError):
+            await coalescedor.ejecutar("k", cargar)
+        return await coalescedor.ejecutar("k", cargar)
+
+    assert asyncio.run(principal()) == "ok"
+
+
+def test_cancelar_una_espera_no_cancela_el_trabajo_compartido():
+    async def principal():
+        coalescedor = Coalescedor()
+        terminado = asyncio.Event()
+
+        async def cargar():
+            await asyncio.sleep(0.02)
+            terminado.set()
+            return "valor"
+
+        primera = asyncio.ensure_future(coalescedor.ejecutar("k", cargar))
+        segunda = asyncio.ensure_future(coalescedor.ejecutar("k", cargar))
+        await asyncio.sleep(0)
+        primera.cancel()
+        resultado = await segunda
+        return primera, resultado, terminado.is_set(), coalescedor
+
+    primera, resultado, terminado, coalescedor = asyncio.run(principal())
+    assert primera.cancelled()
+    assert resultado == "valor" and terminado
+    assert coalescedor.estadisticas()["abandonadas"] == 0
+
+
+def test_si_todos_abandonan_se_cancela_el_trabajo():
+    async def principal():
+        coalescedor = Coalescedor()
+        empezado = asyncio.Event()
+        cancelado = asyncio.Event()
+
+        async def cargar():
+            empezado.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelado.set()
+                raise
+
+        espera = asyncio.ensure_future(coalescedor.ejecutar("k", cargar))
+        await empezado.wait()
+        espera.cancel()
+        await asyncio.gather(espera, return_exceptions=True)
+        await asyncio.sleep(0)
+        return coalescedor, cancelado.is_set()
+
+    coalescedor, cancelado = asyncio.run(principal())
+    assert cancelado
+    assert coalescedor.en_vuelo() == 0
+    assert coalescedor.estadisticas()["abandonadas"] == 1
+
+
+def test_timeout():
+    async def lento():
+        await asyncio.sleep(1)
+
+    async def principal():
+        coalescedor = Coalescedor(timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await coalescedor.ejecutar("k", lento)
+        return coalescedor
+
+    coalescedor = asyncio.run(principal())
+    assert coalescedor.estadisticas()["timeouts"] == 1
+    assert coalescedor.en_vuelo() == 0
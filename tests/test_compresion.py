@@ -0,0 +1,191 @@
+import asyncio
+import gzip
+import zlib
+
+import compresion
+from compresion import (CompresorRespuestas, MiddlewareCompresionASGI, MiddlewareCompresionWSGI,
+                        etag_con_sufijo, negociar, quitar_sufijos_etag)
+
+CUERPO = b'{"mensaje": "hola"}' * 200
+
+
+def test_negociar():
+    assert negociar(None) is None
+    assert negociar("gzip") == "gzip"
+    assert negociar("x-gzip") == "gzip"
+    assert negociar("gzip;q=0, identity") is None
+    assert negociar("identity") is None
+    assert negociar("*;q=0.5") in compresion.CODIFICACIONES
+    assert negociar("gzip;q=abc") is None
+
+
+def test_sufijos_etag():
+    assert etag_con_sufijo('"abc"', "gzip") == '"abc-gzip"'
+    assert etag_con_sufijo('W/"abc"', "br") == 'W/"abc-br"'
+    assert quitar_sufijos_etag('"abc-gzip", W/"def-br"') == '"abc", W/"def"'
+
+
+def llamar_wsgi(app, **environ):
+    capturado = {}
+
+    def start_response(status, headers, exc_info=None):
+        capturado["status"] = status
+        capturado["headers"] = dict(headers)
+
+    cuerpo = b"".join(app({"REQUEST_METHOD": "GET", **environ}, start_response))
+    return capturado["status"], capturado["headers"], cuerpo
+
+
+def app_wsgi(status="200 OK", headers=None, cuerpo=CUERPO, streaming=False):
+    def app(environ, start_response):
+        app.if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        cabeceras = [("Content-Type", "application/json")] + list(headers or [])
+        if not streaming:
+            cabeceras.append(("Content-Length", str(len(cuerpo))))
+        start_response(status, cabeceras)
+        return [cuerpo[:100], cuerpo[100:]] if streaming else [cuerpo]
+    return app
+
+
+def test_wsgi_comprime_y_anota_vary():
+    middleware = MiddlewareCompresionWSGI(app_wsgi(headers=[("ETag", '"e"')]), CompresorRespuestas(umbral=10))
+    status, headers, cuerpo = llamar_wsgi(middleware, HTTP_ACCEPT_ENCODING="gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert headers["ETag"] == '"e-gzip"'
+    assert int(headers["Content-Length"]) == len(cuerpo)
+    assert gzip.decompress(cuerpo) == CUERPO
+
+
+def test_wsgi_streaming_y_umbral():
+    compresor = CompresorRespuestas(umbral=10_000)
+    _, headers, cuerpo = llamar_wsgi(MiddlewareCompresionWSGI(app_wsgi(), compresor), HTTP_ACCEPT_ENCODING="gzip")
+    assert "Content-Encoding" not in headers and cuerpo == CUERPO  # bajo el umbral
+    assert headers["Vary"] == "Accept-Encoding"
+
+    _, headers, cuerpo = llamar_wsgi(MiddlewareCompresionWSGI(app_wsgi(streaming=True), compresor),
+                                     HTTP_ACCEPT_ENCODING="gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(cuerpo) == CUERPO
+
+
+def test_wsgi_304_lleva_vary_y_etag_del_cliente():
+    app = app_wsgi(status="304 Not Modified", headers=[("ETag", '"e"')], cuerpo=b"")
+    middleware = MiddlewareCompresionWSGI(app, CompresorRespuestas())
+    status, headers, _ = llamar_wsgi(middleware, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH='"e-gzip"')
+    assert status.startswith("304")
+    assert app.if_none_match == '"e"'  # la app compara sin el sufijo
+    assert headers["ETag"] == '"e-gzip"'
+    assert headers["Vary"] == "Accept-Encoding"
+
+
+def llamar_asgi(app, cabeceras):
+    mensajes = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": cabeceras}
+    asyncio.run(app(scope, receive, send))
+    return dict(mensajes[0]["headers"]), b"".join(m.get("body", b"") for m in mensajes[1:]), mensajes[0]
+
+
+def app_asgi(estado=200, cuerpo=CUERPO):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": estado,
+                    "headers": [(b"content-type", b"application/json"), (b"etag", b'"e"'),
+                                (b"content-length", str(len(cuerpo)).encode())]})
+        await send({"type": "http.response.body", "body": cuerpo})
+    return app
+
+
+def test_asgi_comprime_y_304_con_vary():
+    middleware = MiddlewareCompresionASGI(app_asgi(), CompresorRespuestas(umbral=10))
+    headers, cuerpo, _ = llamar_asgi(middleware, [(b"accept-encoding", b"gzip")])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert gzip.decompress(cuerpo) == CUERPO
+
+    middleware = MiddlewareCompresionASGI(app_asgi(304, b""), CompresorRespuestas())
+    headers, _, inicio = llamar_asgi(middleware, [(b"accept-encoding", b"gzip"), (b"if-none-match", b'"e-gzip"')])
+    assert inicio["status"] == 304
+    assert headers[b"etag"] == b'"e-gzip"'
+    assert headers[b"vary"] == b"Accept-Encoding"
+
+
+def test_estadisticas_y_cache_por_etag():
+    compresor = CompresorRespuestas(umbral=10)
+    cabeceras = {"etag": '"e"', "content-type": "application/json"}
+    primero = compresor.comprimir_cuerpo("gzip", CUERPO, cabeceras)
+    assert compresor.comprimir_cuerpo("gzip", CUERPO, cabeceras) == primero
+    gz = compresor.estadisticas()["codificaciones"]["gzip"]
+    assert gz["respuestas"] == 2 and gz["aciertos_cache"] == 1
+    assert gz["bytes_originales"] == 2 * len(CUERPO)
+
+
+def test_wsgi_streaming_entrega_cada_trozo_sin_esperar():
+    trozos = [b'{"indice": 0}\n', b'{"indice": 1}\n']
+    producidos = []
+
+    def generar():
+        for trozo in trozos:
+            producidos.append(trozo)
+            yield trozo
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "application/x-ndjson")])
+        return generar()
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    cuerpo = iter(MiddlewareCompresionWSGI(app, CompresorRespuestas(umbral=0))(
+        {"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": "gzip"}, start_response))
+    descompresor = zlib.decompressobj(31)
+    assert descompresor.decompress(next(cuerpo)) == trozos[0]
+    assert len(producidos) == 1  # el segundo trozo aún no se ha pedido a la app
+
+
+def test_sse_comprimido_entrega_el_primer_evento_antes_del_final():
+    import app_fastapi
+
+    app = app_fastapi.crear_app()
+
+    async def probar():
+        primer_evento = asyncio.Event()
+        recibido = []
+        descompresor = zlib.decompressobj(31)
+        lineas = [b'{"nombre": "Ana"}\n', b'{"nombre": "Eva"}\n']
+
+        async def receive():
+            if len(lineas) == 2:
+                return {"type": "http.request", "body": lineas.pop(0), "more_body": True}
+            if lineas:
+                # El segundo saludo solo se envía cuando el cliente ha visto el primer evento
+                await asyncio.wait_for(primer_evento.wait(), 2)
+                return {"type": "http.request", "body": lineas.pop(0), "more_body": False}
+            await asyncio.sleep(3600)
+
+        async def send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                recibido.append(dict(mensaje["headers"]))
+            elif mensaje["type"] == "http.response.body":
+                recibido.append(descompresor.decompress(mensaje.get("body", b"")))
+                if b"data: " in b"".join(recibido[1:]):
+                    primer_evento.set()
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+                 "scheme": "http", "path": "/sse/saludos", "raw_path": b"/sse/saludos", "query_string": b"",
+                 "root_path": "", "client": ("127.0.0.1", 1), "server": ("prueba", 80),
+                 "headers": [(b"host", b"prueba"), (b"accept-encoding", b"gzip"),
+                             (b"content-type", b"application/x-ndjson")]}
+        await asyncio.wait_for(app(scope, receive, send), 5)
+        return recibido
+
+    cabeceras, *cuerpo = asyncio.run(probar())
+    assert cabeceras[b"content-encoding"] == b"gzip"
+    eventos = b"".join(cuerpo).decode().split("\n\n")
+    assert [e.split("\n")[0] for e in eventos if e] == ["id: 0", "id: 1"]
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+
+from flujo_json import ErrorRegistro, LectorRegistros, iterar_registros, iterar_registros_async
+
+
+def en_trozos(datos, tam):
+    return [datos[i:i + tam] for i in range(0, len(datos), tam)]
+
+
+REGISTROS = [{"nombre": "Ana"}, {"nombre": "Eva", "edad": 30}, {"nombre": "ñandú ☃"}, 12345, [1, 2]]
+
+
+@pytest.mark.parametrize("tam", [1, 2, 7, 1000])
+def test_ndjson_en_cualquier_particion(tam):
+    cuerpo = "\n".join(json.dumps(r, ensure_ascii=False) for r in REGISTROS).encode()
+    assert list(iterar_registros(en_trozos(cuerpo, tam))) == REGISTROS
+
+
+@pytest.mark.parametrize("tam", [1, 3, 1000])
+def test_array_en_cualquier_particion(tam):
+    cuerpo = json.dumps(REGISTROS, ensure_ascii=False).encode()
+    assert list(iterar_registros(en_trozos(cuerpo, tam))) == REGISTROS
+
+
+def test_numero_al_final_de_un_trozo_no_se_corta():
+    assert list(iterar_registros([b"[12", b"34, 5", b"6]"])) == [1234, 56]
+
+
+def test_array_vacio_y_coma_final():
+    assert list(iterar_registros([b"  []"])) == []
+    assert list(iterar_registros([b'[{"a": 1},]'])) == [{"a": 1}]
+
+
+def test_cuerpo_vacio():
+    assert list(iterar_registros([b"", b"  \n "])) == []
+
+
+def test_ndjson_linea_rota_no_interrumpe_el_lote():
+    registros = list(iterar_registros([b'{"a": 1}\n{roto\n\n{"b": 2}\n']))
+    assert registros[0] == {"a": 1}
+    assert isinstance(registros[1], ErrorRegistro)
+    assert not registros[1].fatal
+    assert registros[1].mensaje.startswith("JSON inválido")
+    assert registros[1].tipo == "json_invalid"
+    assert registros[2] == {"b": 2}
+
+
+def test_ndjson_linea_demasiado_larga_se_descarta_una_sola_vez():
+    lector = LectorRegistros(max_bytes_registro=10)
+    registros = lector.alimentar(b'{"nombre": "' + b"x" * 20)
+    registros += lector.alimentar(b"y" * 50)
+    registros += lector.alimentar(b'"}\n{"a": 1}\n')
+    registros += lector.finalizar()
+    assert len(registros) == 2
+    assert isinstance(registros[0], ErrorRegistro)
+    assert "tamaño máximo" in registros[0].mensaje
+    assert registros[0].tipo == "too_long"
+    assert registros[1] == {"a": 1}
+    # El buffer nunca guarda más que el límite (más el trozo que llega)
+    assert lector._buffer == ""
+
+
+def test_array_valor_demasiado_largo_es_fatal():
+    lector = LectorRegistros(max_bytes_registro=10)
+    registros = lector.alimentar(b'[{"nombre": "' + b"x" * 20)
+    assert len(registros) == 1 and registros[0].fatal
+    # Después de un error fatal no se lee nada más
+    assert lector.alimentar(b'"}]') == []
+    assert lector.finalizar() == []
+
+
+def test_array_sin_cerrar_o_separador_invalido():
+    registros = list(iterar_registros([b'[{"a": 1}, {"b": 2}']))
+    assert registros[:2] == [{"a": 1}, {"b": 2}]
+    assert registros[2].fatal and "no está cerrado" in registros[2].mensaje
+
+    registros = list(iterar_registros([b'[{"a": 1} {"b": 2}]']))
+    assert registros[0] == {"a": 1}
+    assert registros[1].fatal and "Se esperaba" in registros[1].mensaje
+
+
+def test_utf8_partido_entre_trozos():
+    cuerpo = '{"nombre": "ñ"}\n'.encode()
+    corte = cuerpo.index("ñ".encode()) + 1  # a mitad del carácter de dos bytes
+    assert list(iterar_registros([cuerpo[:corte], cuerpo[corte:]])) == [{"nombre": "ñ"}]
+
+
+def test_version_asincrona():
+    async def trozos():
+        for trozo in en_trozos(b'{"a": 1}\n{"b": 2}', 3):
+            yield trozo
+
+    async def leer():
+        return [r async for r in iterar_registros_async(trozos())]
+
+    assert asyncio.run(leer()) == [{"a": 1}, {"b": 2}]
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import idempotencia
+from idempotencia import (COMPLETADA, CONFLICTO, EN_CURSO, LLENO, NUEVA, AlmacenMemoria, AlmacenSQLite,
+                          Deduplicador, MiddlewareIdempotenciaASGI, RespuestaGuardada, huella)
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def almacen(request, tmp_path):
+    if request.param == "memoria":
+        return AlmacenMemoria(ttl=60)
+    return AlmacenSQLite(str(tmp_path / "idempotencia.db"), ttl=60)
+
+
+def test_ciclo_de_una_clave(almacen):
+    h = huella(b"cuerpo")
+    assert almacen.reclamar("k", h) == (NUEVA, None)
+    assert almacen.reclamar("k", h) == (EN_CURSO, None)
+    assert almacen.reclamar("k", huella(b"otro")) == (CONFLICTO, None)
+    almacen.completar("k", idempotencia.RespuestaGuardada(201, [("Content-Type", "application/json")], b"{}"))
+    resultado, guardada = almacen.reclamar("k", h)
+    assert resultado == COMPLETADA
+    assert (guardada.estado, guardada.cuerpo) == (201, b"{}")
+    almacen.liberar("k")
+    assert almacen.reclamar("k", h) == (NUEVA, None)
+
+
+def test_memoria_acotada():
+    almacen = AlmacenMemoria(max_entradas=2)
+    for clave in "abc":
+        almacen.reclamar(clave, "h")
+        almacen.completar(clave, RespuestaGuardada(201, [], b"{}"))
+    assert almacen.estadisticas() == {"entradas": 2}
+    assert almacen.reclamar("a", "h") == (NUEVA, None)  # "a" fue desalojada
+
+
+def test_memoria_no_desaloja_claves_en_curso():
+    almacen = AlmacenMemoria(max_entradas=2)
+    almacen.reclamar("a", "h")  # en curso, la menos usada
+    almacen.reclamar("b", "h")
+    almacen.completar("b", RespuestaGuardada(201, [], b"{}"))
+    assert almacen.reclamar("c", "h") == (NUEVA, None)
+    # Se desalojó "b" (completada), no "a": su reintento sigue esperando
+    assert almacen.reclamar("a", "h") == (EN_CURSO, None)
+    # Con todas en curso no cabe otra
+    assert almacen.reclamar("d", "h") == (LLENO, None)
+    assert almacen.estadisticas() == {"entradas": 2}
+    almacen.liberar("c")
+    assert almacen.reclamar("d", "h") == (NUEVA, None)
+
+
+def test_sqlite_purga_no_borra_claves_en_curso(tmp_path):
+    almacen = AlmacenSQLite(str(tmp_path / "idempotencia.db"), ttl=60, max_entradas=1)
+    almacen.reclamar("a", "h")
+    for clave in "bc":
+        almacen.reclamar(clave, "h")
+        almacen.completar(clave, RespuestaGuardada(201, [], b"{}"))
+    almacen.purgar()
+    assert almacen.reclamar("a", "h") == (EN_CURSO, None)
+    assert almacen.reclamar("b", "h") == (NUEVA, None)
+    assert almacen.reclamar("c", "h")[0] == COMPLETADA
+
+
+def test_reclamacion_caducada_se_retoma(monkeypatch):
+    ahora = [0.0]
+    monkeypatch.setattr(idempotencia.time, "monotonic", lambda: ahora[0])
+    almacen = AlmacenMemoria(max_en_curso=5)
+    almacen.reclamar("k", "h")
+    ahora[0] = 6
+    assert almacen.reclamar("k", "h") == (NUEVA, None)
+
+
+def test_solo_se_guardan_respuestas_definitivas():
+    deduplicador = Deduplicador(AlmacenMemoria(), espera_max=0)
+    for estado, guardada in ((201, True), (422, True), (409, False), (429, False), (503, False)):
+        clave = f"k{estado}"
+        deduplicador.reclamar(clave, "h")
+        deduplicador.terminar(clave, estado, [("Date", "x"), ("X-Uno", "1")], b"c")
+        resultado, respuesta = deduplicador.reclamar(clave, "h")
+        assert (resultado == COMPLETADA) is guardada
+        if guardada:
+            assert respuesta.cabeceras == [("X-Uno", "1")]  # Date no se guarda
+
+
+def test_duplicado_en_curso_espera_el_resultado():
+    deduplicador = Deduplicador(AlmacenMemoria(), espera_max=2)
+    assert deduplicador.reclamar("k", "h") == (NUEVA, None)
+    threading.Timer(0.05, deduplicador.terminar, ("k", 201, [], b"ok")).start()
+    resultado, guardada = deduplicador.reclamar("k", "h")
+    assert resultado == COMPLETADA and guardada.cuerpo == b"ok"
+    estadisticas = deduplicador.estadisticas()
+    assert (estadisticas["nuevas"], estadisticas["repetidas"], estadisticas["esperadas"]) == (1, 1, 1)
+
+
+def test_espera_agotada():
+    deduplicador = Deduplicador(AlmacenMemoria(), espera_max=0.02)
+    deduplicador.reclamar("k", "h")
+    assert deduplicador.reclamar("k", "h") == (EN_CURSO, None)
+    assert deduplicador.estadisticas()["esperas_agotadas"] == 1
+
+
+# --- Middleware ASGI ---
+
+class AppContadora:
+    def __init__(self, estado=201):
+        self.llamadas = 0
+        self.estado = estado
+
+    async def __call__(self, scope, receive, send):
+        self.llamadas += 1
+        mensaje = await receive()
+        cuerpo = json.dumps({"llamada": self.llamadas, "eco": mensaje["body"].decode()}).encode()
+        await send({"type": "http.response.start", "status": self.estado,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+def post(middleware, cuerpo, clave="k", trozos=None, cabeceras=()):
+    pendientes = list(trozos) if trozos is not None else [cuerpo]
+    enviados = []
+
+    async def receive():
+        if not pendientes:
+            return {"type": "http.disconnect"}
+        trozo = pendientes.pop(0)
+        return {"type": "http.request", "body": trozo, "more_body": bool(pendientes)}
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    headers = [(b"idempotency-key", clave.encode())] if clave is not None else []
+    headers += list(cabeceras)
+    scope = {"type": "http", "method": "POST", "path": "/saludo", "headers": headers}
+    asyncio.run(middleware(scope, receive, send))
+    inicio = enviados[0]
+    return inicio["status"], dict(inicio["headers"]), b"".join(m.get("body", b"") for m in enviados[1:])
+
+
+def test_asgi_repeticion_y_conflicto():
+    app = AppContadora()
+    middleware = MiddlewareIdempotenciaASGI(app, Deduplicador(AlmacenMemoria()), ["/saludo"])
+    estado, _, primera = post(middleware, b'{"nombre": "Ana"}')
+    estado2, cabeceras, repetida = post(middleware, b'{"nombre": "Ana"}')
+    assert estado == estado2 == 201
+    assert repetida == primera
+    assert cabeceras[b"idempotent-replayed"] == b"true"
+    assert app.llamadas == 1
+
+    estado, _, cuerpo = post(middleware, b'{"nombre": "Eva"}')
+    assert estado == 422 and b"ya usada" in cuerpo
+    assert post(middleware, b"{}", clave="")[0] == 400
+    assert post(middleware, b"{}", clave=None)[0] == 201  # sin clave pasa tal cual
+    assert app.llamadas == 2
+
+
+def test_asgi_cuerpo_demasiado_grande_413_y_no_se_guarda():
+    app = AppContadora()
+    deduplicador = Deduplicador(AlmacenMemoria(), max_bytes_cuerpo=10)
+    middleware = MiddlewareIdempotenciaASGI(app, deduplicador, ["/saludo"])
+
+    # Con Content-Length se rechaza antes de leer
+    estado, _, _ = post(middleware, b"x" * 11, cabeceras=[(b"content-length", b"11")])
+    assert estado == 413
+    # Sin Content-Length se rechaza al pasar el límite leyendo
+    estado, _, _ = post(middleware, None, trozos=[b"x" * 6, b"x" * 6])
+    assert estado == 413
+    assert app.llamadas == 0
+    assert deduplicador.estadisticas()["entradas"] == 0
+    assert post(middleware, b"x" * 10)[0] == 201
+
+
+def test_asgi_error_del_handler_libera_la_clave():
+    class AppRota:
+        async def __call__(self, scope, receive, send):
+            raise RuntimeError("boom")
+
+    deduplicador = Deduplicador(AlmacenMemoria())
+    middleware = MiddlewareIdempotenciaASGI(AppRota(), deduplicador, ["/saludo"])
+    with pytest.raises(RuntimeError):
+        post(middleware, b"{}")
+    assert deduplicador.estadisticas()["entradas"] == 0
+
+
+def test_asgi_almacen_lleno_de_claves_en_curso_503():
+    app = AppContadora()
+    deduplicador = Deduplicador(AlmacenMemoria(max_entradas=1), espera_max=0)
+    deduplicador.almacen.reclamar(idempotencia.clave_completa("/saludo", "", "otra"), "h")
+    middleware = MiddlewareIdempotenciaASGI(app, deduplicador, ["/saludo"])
+    estado, cabeceras, _ = post(middleware, b"{}")
+    assert (estado, cabeceras[b"retry-after"]) == (503, b"1")
+    assert app.llamadas == 0
+    assert deduplicador.estadisticas()["almacen_lleno"] == 1
+
+
+def test_flask_413_con_idempotency_key(monkeypatch):
+    import app_flask
+
+    monkeypatch.setattr(app_flask.deduplicador_saludos, "max_bytes_cuerpo", 20)
+    cliente = app_flask.crear_app().test_client()
+    respuesta = cliente.post("/api/crear_saludo", json={"nombre": "x" * 50}, headers={"Idempotency-Key": "g"})
+    assert respuesta.status_code == 413
+    respuesta = cliente.post("/api/crear_saludo", json={"nombre": "x"}, headers={"Idempotency-Key": "g"})
+    assert respuesta.status_code == 201
+
+
+def test_contadores_desde_varios_hilos():
+    deduplicador = Deduplicador(AlmacenMemoria(max_entradas=100_000), espera_max=0)
+
+    def reclamar(hilo):
+        for i in range(2000):
+            deduplicador.reclamar(f"{hilo}-{i}", "h")
+
+    hilos = [threading.Thread(target=reclamar, args=(n,)) for n in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert deduplicador.estadisticas()["nuevas"] == 16_000
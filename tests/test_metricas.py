@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+
+import metricas
+from metricas import RegistroMetricas, muestras_de
+
+
+def lineas_de(texto, nombre):
+    return [linea for linea in texto.splitlines() if linea.startswith(nombre)]
+
+
+def test_exportar_solicitudes_e_histogramas():
+    registro = RegistroMetricas("prueba", directorio="")
+    registro.entrar()
+    registro.salir("GET", "/items/{item_id}", 200, 0.003, 0, 100)
+    registro.entrar()
+    registro.salir("GET", "/items/{item_id}", 404, 0.2, 0, 20)
+    texto = registro.exportar()
+
+    assert 'http_solicitudes_total{app="prueba",metodo="GET",ruta="/items/{item_id}",estado="200"} 1' in texto
+    assert 'http_solicitudes_en_vuelo{app="prueba"} 0' in texto
+    base = 'app="prueba",metodo="GET",ruta="/items/{item_id}"'
+    # Las cubetas son acumuladas y +Inf coincide con _count
+    assert f'http_duracion_segundos_bucket{{{base},le="0.0025"}} 0' in texto
+    assert f'http_duracion_segundos_bucket{{{base},le="0.005"}} 1' in texto
+    assert f'http_duracion_segundos_bucket{{{base},le="+Inf"}} 2' in texto
+    assert f"http_duracion_segundos_count{{{base}}} 2" in texto
+    assert f"http_bytes_respuesta_sum{{{base}}} 120" in texto
+
+
+def test_etiquetas_escapadas():
+    assert metricas._etiqueta("ruta", 'a"b\\c\nd') == 'ruta="a\\"b\\\\c\\nd"'
+
+
+def test_muestras_de_separa_counters_y_gauges():
+    muestras = muestras_de("cache", "Ayuda.", {"entradas": 3, "aciertos": 10},
+                           ("aciertos",), cache="items")
+    assert ("cache_entradas", "gauge", "Ayuda.", {"cache": "items"}, 3) in muestras
+    assert ("cache_aciertos_total", "counter", "Ayuda.", {"cache": "items"}, 10) in muestras
+
+
+def test_colectores_anuncian_su_tipo():
+    registro = RegistroMetricas("prueba", directorio="")
+    registro.registrar_colector(lambda: muestras_de("admision", "Admisión.", {"en_curso": 2, "admitidas": 7},
+                                                    ("admitidas",), ruta="/x"))
+    texto = registro.exportar()
+    assert "# TYPE admision_admitidas_total counter" in texto
+    assert 'admision_admitidas_total{app="prueba",ruta="/x"} 7' in texto
+    assert "# TYPE admision_en_curso gauge" in texto
+
+
+def pid_terminado():
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    return proceso.pid
+
+
+def instantanea_de(pid, solicitudes=4, admitidas=100):
+    return {
+        "pid": pid, "en_vuelo": 3,
+        "series": [{"metodo": "GET", "ruta": "/", "estados": {"200": solicitudes},
+                    "latencia": [solicitudes] + [0] * len(metricas.CUBETAS_LATENCIA), "suma_latencia": 0.001,
+                    "bytes_entrada": [solicitudes] + [0] * len(metricas.CUBETAS_BYTES), "suma_bytes_entrada": 0,
+                    "bytes_salida": [solicitudes] + [0] * len(metricas.CUBETAS_BYTES), "suma_bytes_salida": 40}],
+        "muestras": [["admision_en_curso", "gauge", "Admisión.", {}, 9],
+                     ["admision_admitidas_total", "counter", "Admisión.", {}, admitidas]],
+    }
+
+
+def test_multiproceso_descarta_gauges_de_procesos_muertos(tmp_path):
+    registro = RegistroMetricas("prueba", directorio=str(tmp_path))
+    registro.registrar_colector(lambda: muestras_de("admision", "Admisión.", {"en_curso": 1, "admitidas": 5},
+                                                    ("admitidas",)))
+    muerto = pid_terminado()
+    (tmp_path / f"metricas_prueba_{muerto}_1.json").write_text(json.dumps(instantanea_de(muerto)))
+
+    texto = registro.exportar()
+    assert lineas_de(texto, "admision_en_curso{") == ['admision_en_curso{app="prueba"} 1']
+    assert lineas_de(texto, "admision_admitidas_total{") == ['admision_admitidas_total{app="prueba"} 105']
+    assert 'http_solicitudes_en_vuelo{app="prueba"} 0' in texto
+    assert 'http_solicitudes_total{app="prueba",metodo="GET",ruta="/",estado="200"} 4' in texto
+
+
+def test_volcar_es_atomico_y_legible(tmp_path):
+    registro = RegistroMetricas("prueba", directorio=str(tmp_path))
+    registro.entrar()
+    registro.salir("POST", "/", 201, 0.01, 10, 10)
+    registro.volcar()
+    archivos = os.listdir(tmp_path)
+    assert archivos == [f"metricas_prueba_{os.getpid()}_{registro._arranque}.json"]
+    instantanea = json.loads((tmp_path / archivos[0]).read_text())
+    assert instantanea["series"][0]["estados"] == {"201": 1}
+
+
+def test_procesos_muertos_se_retiran_sin_que_los_contadores_retrocedan(tmp_path):
+    registro = RegistroMetricas("prueba", directorio=str(tmp_path))
+    muerto = pid_terminado()
+    (tmp_path / f"metricas_prueba_{muerto}_1.json").write_text(json.dumps(instantanea_de(muerto, 4, 100)))
+    texto = registro.exportar()
+    assert 'http_solicitudes_total{app="prueba",metodo="GET",ruta="/",estado="200"} 4' in texto
+    # Su archivo desaparece y sus contadores quedan en el de retirados
+    assert sorted(os.listdir(tmp_path)) == ["metricas_prueba.lock", "metricas_prueba_retirados.json"]
+
+    # Otro proceso muerto con el mismo pid (reutilizado) y otro arranque
+    (tmp_path / f"metricas_prueba_{muerto}_2.json").write_text(json.dumps(instantanea_de(muerto, 1, 10)))
+    texto = registro.exportar()
+    assert 'http_solicitudes_total{app="prueba",metodo="GET",ruta="/",estado="200"} 5' in texto
+    assert lineas_de(texto, "admision_admitidas_total{") == ['admision_admitidas_total{app="prueba"} 110']
+    assert lineas_de(texto, "admision_en_curso{") == []
+    assert 'http_solicitudes_en_vuelo{app="prueba"} 0' in texto
+    # Exportar de nuevo no vuelve a sumar lo ya retirado
+    assert registro.exportar() == texto
@@ -0,0 +1,92 @@
+import asyncio
+
+import perfilador
+from perfilador import MiddlewarePerfilASGI, MiddlewarePerfilWSGI, PerfiladorMuestreado
+
+
+def test_apagado_no_perfila():
+    muestreado = PerfiladorMuestreado(cada_n=0, token="")
+    assert not muestreado.activo
+    assert not any(muestreado.debe_perfilar() for _ in range(10))
+
+
+def test_uno_de_cada_n_y_token():
+    muestreado = PerfiladorMuestreado(cada_n=3, token="secreto")
+    assert [muestreado.debe_perfilar() for _ in range(6)] == [False, False, True, False, False, True]
+    assert PerfiladorMuestreado(cada_n=0, token="secreto").debe_perfilar("secreto")
+    assert not PerfiladorMuestreado(cada_n=0, token="secreto").debe_perfilar("otro")
+
+
+def test_autorizado_exige_un_token_configurado():
+    assert not PerfiladorMuestreado(cada_n=5, token="").autorizado(None)
+    assert not PerfiladorMuestreado(cada_n=5, token="").autorizado("")
+    con_token = PerfiladorMuestreado(cada_n=0, token="secreto")
+    assert con_token.autorizado("secreto")
+    assert not con_token.autorizado("secret")
+    assert not con_token.autorizado(None)
+
+
+def trabajo_lento():
+    return sum(i * i for i in range(20_000))
+
+
+def test_wsgi_agrega_pilas_por_ruta():
+    muestreado = PerfiladorMuestreado(cada_n=1, token="")
+
+    def app(environ, start_response):
+        environ[perfilador.CLAVE_RUTA_WSGI] = "/lenta"
+        trabajo_lento()
+        start_response("200 OK", [])
+        return [b"ok"]
+
+    middleware = MiddlewarePerfilWSGI(app, muestreado)
+    cuerpo = middleware({}, lambda status, headers, exc_info=None: None)
+    assert b"".join(cuerpo) == b"ok"
+    cuerpo.close()
+
+    assert muestreado.solicitudes == {"/lenta": 1}
+    lineas = muestreado.colapsado().splitlines()
+    assert any(linea.startswith("/lenta;") and "trabajo_lento (test_perfilador.py" in linea for linea in lineas)
+    assert all(int(linea.rsplit(" ", 1)[1]) > 0 for linea in lineas)
+    assert muestreado.colapsado("/otra") == ""
+    muestreado.limpiar()
+    assert muestreado.colapsado() == ""
+
+
+def test_asgi_solo_cuenta_la_tarea_perfilada():
+    muestreado = PerfiladorMuestreado(cada_n=0, token="t")
+
+    class Ruta:
+        path = "/items/{item_id}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Ruta()
+        if scope["perfilar"]:
+            trabajo_lento()
+        else:
+            otra_funcion()
+        await asyncio.sleep(0)
+
+    def otra_funcion():
+        return sum(range(10_000))
+
+    async def probar():
+        middleware = MiddlewarePerfilASGI(app, muestreado)
+        perfilada = {"type": "http", "headers": [(b"x-perfil-token", b"t")], "perfilar": True}
+        normal = {"type": "http", "headers": [], "perfilar": False}
+        await asyncio.gather(middleware(perfilada, None, None), middleware(normal, None, None))
+
+    asyncio.run(probar())
+    texto = muestreado.colapsado()
+    assert muestreado.solicitudes == {"/items/{item_id}": 1}
+    assert "trabajo_lento" in texto and "otra_funcion" not in texto
+
+
+def test_endpoints_sin_token_configurado_responden_403(monkeypatch):
+    import app_flask
+
+    monkeypatch.setattr(app_flask.perfilador_muestreado, "token", None)
+    cliente = app_flask.crear_app().test_client()
+    assert cliente.get("/admin/perfiles").status_code == 403
+    monkeypatch.setattr(app_flask.perfilador_muestreado, "token", "secreto")
+    assert cliente.get("/admin/perfiles", headers={"X-Perfil-Token": "secreto"}).status_code == 200
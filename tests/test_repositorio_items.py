@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from repositorio_items import (RepositorioEco, RepositorioItems, RepositorioMemoria, RepositorioSQLite,
+                               crear_repositorio, generar_items)
+
+
+def test_implementacion_incompleta_falla_al_crearse():
+    class SoloObtener(RepositorioItems):
+        async def obtener(self, item_id):
+            return None
+
+    with pytest.raises(TypeError):
+        SoloObtener()
+    with pytest.raises(TypeError):
+        RepositorioItems()
+
+
+def test_eco_y_memoria():
+    async def principal():
+        eco = RepositorioEco()
+        memoria = RepositorioMemoria({1: {"item_id": 1, "nombre": "uno"}})
+        return (await eco.obtener(5), await eco.obtener_varios([1, 2]),
+                await memoria.obtener(2), await memoria.obtener_varios([1, 2]))
+
+    assert asyncio.run(principal()) == (
+        {"item_id": 5}, {1: {"item_id": 1}, 2: {"item_id": 2}},
+        None, {1: {"item_id": 1, "nombre": "uno"}})
+
+
+def test_sqlite(tmp_path):
+    ruta = str(tmp_path / "items.db")
+    generar_items(ruta, 100, lote=30)
+    repositorio = RepositorioSQLite(ruta, tam_pool=2)
+
+    async def principal():
+        uno = await repositorio.obtener(1)
+        falta = await repositorio.obtener(1000)
+        varios = await repositorio.obtener_varios([3, 50, 1000, 3])
+        vacio = await repositorio.obtener_varios([])
+        return uno, falta, varios, vacio
+
+    try:
+        uno, falta, varios, vacio = asyncio.run(principal())
+    finally:
+        repositorio.cerrar()
+    assert uno["item_id"] == 1 and uno["nombre"] == "item 1"
+    assert falta is None
+    assert sorted(varios) == [3, 50]
+    assert vacio == {}
+
+
+def test_crear_repositorio_segun_entorno(monkeypatch, tmp_path):
+    monkeypatch.delenv("ITEMS_DB", raising=False)
+    assert isinstance(crear_repositorio(), RepositorioEco)
+    monkeypatch.setenv("ITEMS_DB", str(tmp_path / "items.db"))
+    assert isinstance(crear_repositorio(), RepositorioSQLite)
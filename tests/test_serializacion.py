@@ -0,0 +1,101 @@
+import dataclasses
+import datetime
+import json
+
+import pytest
+
+import serializacion
+from serializacion import CODIFICADORES
+
+CASOS = [
+    {"mensaje": "¡Hola, Ñandú!", "lista": [1, 2.5, None, True], "anidado": {"a": {"b": []}}},
+    {1: "uno", None: "nada", True: "sí", "texto": 0},
+    {"nan": float("nan"), "infinito": [float("inf"), -float("inf")], "bien": 1.5},
+    [],
+    "solo texto",
+]
+
+
+@pytest.fixture(params=sorted(CODIFICADORES))
+def codificador(request):
+    return CODIFICADORES[request.param]
+
+
+@pytest.mark.parametrize("contenido", CASOS)
+def test_los_codificadores_dan_los_mismos_bytes(contenido):
+    salidas = {nombre: c.dumps(contenido) for nombre, c in CODIFICADORES.items()}
+    assert len(set(salidas.values())) == 1, salidas
+
+
+def test_salida_compacta_utf8_y_nan_como_null(codificador):
+    assert codificador.dumps({"a": "ñ", "b": [1, 2]}) == '{"a":"ñ","b":[1,2]}'.encode("utf-8")
+    assert codificador.dumps({"x": float("nan"), "y": [float("inf")]}) == b'{"x":null,"y":[null]}'
+
+
+def test_claves_no_str_como_json(codificador):
+    assert codificador.dumps({1: "a", None: "b", True: "c"}) == json.dumps(
+        {1: "a", None: "b", True: "c"}, separators=(",", ":")).encode()
+
+
+def test_ordenar(codificador):
+    assert codificador.dumps({"b": 1, "a": {"d": 1, "c": 2}}, ordenar=True) == b'{"a":{"c":2,"d":1},"b":1}'
+    assert codificador.dumps({"b": 1, "a": 2}) == b'{"b":1,"a":2}'
+
+
+def test_fechas_pasan_por_default(codificador):
+    fecha = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    assert codificador.dumps({"t": fecha}, default=lambda o: "fecha") == b'{"t":"fecha"}'
+    with pytest.raises(TypeError):
+        codificador.dumps({"t": fecha})
+
+
+def test_modelos_pydantic_y_errores(codificador):
+    class Modelo:
+        def model_dump(self):
+            return {"campo": 1}
+
+    assert codificador.dumps({"m": Modelo()}) == b'{"m":{"campo":1}}'
+    with pytest.raises(TypeError):
+        codificador.dumps({"x": object()})
+    circular = []
+    circular.append(circular)
+    with pytest.raises((ValueError, TypeError)):
+        codificador.dumps(circular)
+
+
+def test_usar_cambia_el_codificador_activo():
+    anterior = serializacion.codificador_activo()
+    try:
+        serializacion.usar("json")
+        assert serializacion.codificador_activo() == "json"
+        with pytest.raises(ValueError):
+            serializacion.usar("no-existe")
+    finally:
+        serializacion.usar(anterior)
+
+
+@dataclasses.dataclass
+class Punto:
+    x: int
+    y: int
+
+
+def test_jsonify_igual_que_el_proveedor_de_flask():
+    from flask.json.provider import DefaultJSONProvider
+
+    import app_flask
+
+    app = app_flask.crear_app()
+    estandar = DefaultJSONProvider(app)
+    casos = [{"z": 1, "fecha": datetime.datetime(2024, 1, 2, 3, 4, 5), "punto": Punto(1, 2), "a": [1.5]},
+             {2: "dos", 1: "uno"}]
+    with app.app_context():
+        for contenido in casos:
+            esperado = estandar.response(contenido).get_data()
+            for nombre in CODIFICADORES:
+                anterior = serializacion.codificador_activo()
+                serializacion.usar(nombre)
+                try:
+                    assert app.json.response(contenido).get_data() == esperado, nombre
+                finally:
+                    serializacion.usar(anterior)
@@ -0,0 +1,92 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import metricas
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_LENTA = '''
+import time
+
+def app(environ, start_response):
+    if environ["PATH_INFO"] == "/lenta":
+        time.sleep(1.0)
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+'''
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="servidor.py necesita SO_REUSEPORT")
+
+
+def puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def arrancar(objetivo, cwd, entorno=None):
+    puerto = puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "servidor.py"), objetivo, "--port", str(puerto), "--workers", "1",
+         "--gracia", "5"],
+        cwd=cwd, env={**os.environ, "PYTHONPATH": RAIZ, **(entorno or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 15
+    while time.monotonic() < limite:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{puerto}/", timeout=1).read()
+            return proceso, puerto
+        except OSError:
+            time.sleep(0.05)
+    proceso.kill()
+    raise RuntimeError("el servidor no arrancó")
+
+
+def test_sigterm_termina_la_solicitud_en_curso(tmp_path):
+    (tmp_path / "app_lenta.py").write_text(APP_LENTA)
+    proceso, puerto = arrancar("app_lenta:app", tmp_path)
+    resultado = {}
+
+    def pedir():
+        try:
+            resultado["cuerpo"] = urllib.request.urlopen(f"http://127.0.0.1:{puerto}/lenta", timeout=5).read()
+        except OSError as error:
+            resultado["error"] = error
+
+    try:
+        hilo = threading.Thread(target=pedir)
+        hilo.start()
+        time.sleep(0.3)  # la solicitud ya está en el worker
+        proceso.send_signal(signal.SIGTERM)
+        hilo.join(5)
+        assert resultado == {"cuerpo": b"ok"}
+        assert proceso.wait(10) == 0
+    finally:
+        if proceso.poll() is None:
+            proceso.kill()
+
+
+def test_el_worker_vuelca_sus_metricas_al_terminar(tmp_path):
+    directorio = str(tmp_path / "metricas")
+    proceso, puerto = arrancar("app_flask:app", tmp_path, {"METRICAS_DIR": directorio, "APP_CALENTAR": "0"})
+    try:
+        for _ in range(20):
+            urllib.request.urlopen(f"http://127.0.0.1:{puerto}/api/saludo", timeout=5).read()
+        # Antes del siguiente volcado periódico (cada segundo)
+        proceso.send_signal(signal.SIGTERM)
+        assert proceso.wait(10) == 0
+    finally:
+        if proceso.poll() is None:
+            proceso.kill()
+
+    texto = metricas.RegistroMetricas("flask", directorio=directorio).exportar()
+    linea = 'http_solicitudes_total{app="flask",metodo="GET",ruta="/api/saludo",estado="200"} 20'
+    assert linea in texto
@@ -0,0 +1,54 @@
+import pytest
+
+import validacion
+from validacion import ErrorValidacion, errores_json, es_json, validar_saludo, validar_saludo_json
+
+
+def claves(errores):
+    return [sorted(e) for e in errores]
+
+
+def test_valido_y_coercion():
+    assert validar_saludo_json(b'{"nombre": "Ana"}') == {"nombre": "Ana", "edad": None}
+    assert validar_saludo_json(b'{"nombre": "Ana", "edad": "30"}') == {"nombre": "Ana", "edad": 30}
+    assert validar_saludo({"nombre": "Ana", "edad": 3}) == {"nombre": "Ana", "edad": 3}
+
+
+def test_tipos_estrictos_donde_importa():
+    with pytest.raises(ErrorValidacion):
+        validar_saludo_json(b'{"nombre": 1}')
+
+
+def test_misma_forma_en_cuerpo_y_en_registro():
+    with pytest.raises(ErrorValidacion) as cuerpo:
+        validar_saludo_json(b'{"edad": "treinta"}')
+    with pytest.raises(ErrorValidacion) as registro:
+        validar_saludo({"edad": "treinta"})
+    assert cuerpo.value.errores == registro.value.errores
+    assert {tuple(e["loc"]) for e in cuerpo.value.errores} == {("body", "nombre"), ("body", "edad")}
+    assert claves(cuerpo.value.errores) == [["input", "loc", "msg", "type"]] * 2
+
+
+def test_json_invalido_tiene_la_misma_forma():
+    with pytest.raises(ErrorValidacion) as error:
+        validar_saludo_json(b"{roto")
+    [detalle] = error.value.errores
+    assert detalle["type"] == "json_invalid"
+    assert detalle["loc"] == ["body"]
+    assert detalle["input"] is None  # no devolvemos los bytes del cuerpo
+    assert claves(errores_json("JSON inválido: x")) == claves(error.value.errores)
+    assert errores_json("x", "too_long")[0]["type"] == "too_long"
+
+
+def test_es_json():
+    assert es_json(None)
+    assert es_json("application/json; charset=utf-8")
+    assert es_json("application/problem+json")
+    assert not es_json("text/plain")
+
+
+def test_esquema_perezoso():
+    esquema = validacion.ESQUEMA_SALUDO
+    assert esquema["required"] == ["nombre"]
+    with pytest.raises(AttributeError):
+        validacion.NO_EXISTE
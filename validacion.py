@@ -0,0 +1,146 @@
+from typing_extensions import NotRequired, TypedDict
+
+from flujo_json import ErrorRegistro
+
+"""Validación compartida del saludo para app_flask y app_fastapi.
+
+Antes cada app validaba a su manera: Flask comprobaba a mano que 'nombre'
+estuviera en el diccionario (sin mirar tipos) y FastAPI usaba un modelo
+Pydantic, así que el mismo cuerpo podía ser válido en una y no en la otra, y
+los errores tenían formas distintas.
+
+Aquí el esquema se define una sola vez (SaludoRequest) y se compila una sola
+vez al importar el módulo en un validador de pydantic-core (TypeAdapter). Ese
+validador:
+- decodifica y valida directamente desde los bytes del cuerpo (validate_json),
+  sin pasar por json.loads ni por un diccionario intermedio;
+- aplica la misma conversión de tipos en las dos apps (modo "lax" de Pydantic:
+  "30" se acepta como edad 30, pero 1 no se acepta como nombre);
+- devuelve un dict normal en lugar de una instancia de modelo, así no hay que
+  construir el objeto ni llamar después a model_dump().
+
+Los errores se devuelven con la forma de FastAPI: un 422 con
+{"detail": [{"type", "loc", "msg", "input"}, ...]} y "body" al inicio de loc.
+Los lotes, el WebSocket y SSE usan exactamente la misma lista en el "error" de
+cada registro (loc relativo al registro, también con "body" delante): todos
+pasan por validar_saludo_json o validar_registro, que lanzan ErrorValidacion.
+Una línea NDJSON que no es JSON válido se vuelve a validar con pydantic, así
+da el mismo error que ese texto enviado en un POST o por el WebSocket; lo que
+no se puede repetir así (un array roto, un registro demasiado grande) usa
+errores_json, con la misma forma. El cliente tiene un solo parser de errores.
+
+Importar pydantic cuesta ~100 ms, y la app Flask solo lo necesita al validar
+un POST. Por eso el validador se compila en el primer uso (o en calentar(),
+que las apps llaman antes de aceptar tráfico) y no al importar el módulo.
+
+Comparar con la validación anterior:
+    python benchmark.py validacion
+"""
+
+TIPOS_JSON = ("application/json",)
+
+
+class SaludoRequest(TypedDict):
+    nombre: str
+    edad: NotRequired[None | int]  # La edad es opcional
+
+
+_validador_saludo = None
+ValidationError = None  # pydantic.ValidationError, tras el primer _validador()
+
+
+def _validador():
+    global _validador_saludo, ValidationError
+    if _validador_saludo is None:
+        from pydantic import TypeAdapter, ValidationError
+        _validador_saludo = TypeAdapter(SaludoRequest)
+    return _validador_saludo
+
+
+def __getattr__(nombre):
+    # Esquema JSON para la documentación OpenAPI de FastAPI (también perezoso)
+    if nombre == "ESQUEMA_SALUDO":
+        return _validador().json_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+class ErrorValidacion(Exception):
+    """El cuerpo no es un SaludoRequest válido. 'errores' es la lista del "detail"."""
+
+    def __init__(self, errores):
+        super().__init__(errores)
+        self.errores = errores
+
+
+def detalle_errores(error, *prefijo) -> list:
+    """Lista de errores de Pydantic lista para serializar, con 'prefijo' delante de cada loc."""
+    errores = []
+    for e in error.errors(include_url=False, include_context=False):
+        # Con JSON mal formado el input son los bytes del cuerpo: no los devolvemos
+        entrada = e.get("input")
+        errores.append({
+            "type": e["type"],
+            "loc": [*prefijo, *e["loc"]],
+            "msg": e["msg"],
+            "input": None if isinstance(entrada, (bytes, bytearray)) else entrada,
+        })
+    return errores
+
+
+def errores_json(mensaje, tipo="json_invalid") -> list:
+    """Lista de errores, con la misma forma que detalle_errores, para un registro
+    que no se pudo leer como JSON (ver flujo_json.ErrorRegistro)."""
+    return [{"type": tipo, "loc": ["body"], "msg": mensaje, "input": None}]
+
+
+def es_json(tipo_contenido) -> bool:
+    """Sin Content-Type se intenta leer como JSON (como hace FastAPI); si lo hay,
+    tiene que ser application/json o un tipo +json."""
+    if not tipo_contenido:
+        return True
+    tipo = tipo_contenido.split(";", 1)[0].strip().lower()
+    return tipo in TIPOS_JSON or tipo.endswith("+json")
+
+
+def _completar(datos: dict) -> dict:
+    datos.setdefault("edad", None)
+    return datos
+
+
+def validar_saludo_json(cuerpo: bytes) -> dict:
+    """Decodifica y valida el cuerpo de la solicitud. Lanza ErrorValidacion."""
+    validador = _validador()
+    try:
+        return _completar(validador.validate_json(cuerpo))
+    except ValidationError as error:
+        raise ErrorValidacion(detalle_errores(error, "body")) from None
+
+
+def validar_saludo(objeto) -> dict:
+    """Valida un registro ya decodificado (los endpoints de lote leen el JSON por
+    trozos con flujo_json). Lanza ErrorValidacion con los mismos errores que
+    validar_saludo_json: loc relativo al registro y con "body" delante."""
+    validador = _validador()
+    try:
+        return _completar(validador.validate_python(objeto))
+    except ValidationError as error:
+        raise ErrorValidacion(detalle_errores(error, "body")) from None
+
+
+def validar_registro(registro) -> dict:
+    """Valida un registro de flujo_json: un valor ya decodificado o un ErrorRegistro.
+    Lanza ErrorValidacion igual que validar_saludo_json con el mismo texto."""
+    if isinstance(registro, ErrorRegistro):
+        if registro.texto is not None:
+            validar_saludo_json(registro.texto.encode("utf-8"))  # lanza ErrorValidacion
+        raise ErrorValidacion(errores_json(registro.mensaje, registro.tipo))
+    return validar_saludo(registro)
+
+
+def calentar():
+    """Compila el validador y recorre una vez el camino válido y el de error."""
+    validar_saludo_json(b'{"nombre": "calentamiento", "edad": 1}')
+    try:
+        validar_saludo_json(b"{}")
+    except ErrorValidacion:
+        pass